@@ -0,0 +1,400 @@
+"""
+Offline benchmark harness for naip_pull.py.
+
+Everything runs locally, so throughput can be tracked without touching the Planetary Computer:
+
+  - SyntheticNaipCatalog writes NAIP-like 4-band uint8 COGs in several UTM zones, plus a STAC
+    item per tile and vintage.
+  - InProcessStacClient stands in for pystac_client.Client (same search(...).items() surface
+    naip_pull uses), with optional injected latency to mimic a remote catalog.
+  - make_substations() scatters a reproducible set of synthetic substations over the tiles,
+    with a small share deliberately outside coverage.
+
+Each stage (_prepare_geometry, _search_stac_for_imagery, _extract_raster_chip,
+_save_output_image) is timed on its own, and the whole pipeline end to end through
+naip_pull.main(). Every case runs in a fresh process so its peak RSS is its own.
+
+Usage:
+    python naip_benchmark.py                       # all stages + e2e at 100/1k/10k features
+    python naip_benchmark.py --sizes 100,1000 --cases geometry,search,e2e --mode concurrent
+"""
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import datetime
+import pathlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from unittest import mock
+
+import numpy as np
+import pyproj
+import rasterio
+from rasterio.transform import from_origin
+from shapely import STRtree
+from shapely.geometry import shape, box, mapping
+from shapely.ops import transform as shapely_transform
+from pystac import Item as StacItem
+from pystac import Asset as StacAsset
+
+try:
+    import resource # Unix only; peak RSS is reported as None elsewhere
+except ImportError:
+    resource = None
+
+import naip_pull
+
+# --- Benchmark Configuration ---
+BENCH_CONFIG = {
+    "WORKDIR": pathlib.Path("./.naip_bench"), # Synthetic COGs, catalog, inputs, outputs and results land here
+    "SIZES": [100, 1000, 10000],
+    "CASES": ["geometry", "search", "extract", "save", "e2e"],
+    "CATALOG": {
+        # (EPSG code, lon, lat) of each zone's tile grid origin - a few different UTM zones so the per-CRS paths get exercised
+        "ZONES": [(32611, -116.20, 43.60), (32615, -93.30, 44.95), (32617, -81.70, 28.55)],
+        "TILES_PER_SIDE": 2, # Tiles per zone = TILES_PER_SIDE ** 2
+        "TILE_PIXELS": 2048,
+        "GSD": 0.6, # Meters, current NAIP
+        "YEARS": [2019, 2021], # One item per tile and vintage; the latest is what gets selected
+        "BLOCK_SIZE": 512,
+    },
+    "NO_COVERAGE_FRACTION": 0.05, # Share of synthetic substations placed where there is no imagery
+    "SEED": 42,
+}
+
+logger = logging.getLogger("naip_benchmark")
+
+
+# --- Synthetic COG Catalog ---
+class SyntheticNaipCatalog:
+    """
+    Generates NAIP-like COGs (4 bands, uint8, internally tiled, deflate) on a small tile
+    grid in each configured UTM zone, and the matching STAC items.
+
+    The pixels are a smooth pattern plus noise, so the compressed size and decode cost are
+    in the same ballpark as real imagery rather than the worst case of pure noise.
+    """
+
+    def __init__(self, root: pathlib.Path, catalog_config: Dict[str, Any]):
+        """
+        Args:
+            root: Directory for the COGs and catalog.json.
+            catalog_config: BENCH_CONFIG["CATALOG"].
+        """
+        self.root: pathlib.Path = root
+        self.config: Dict[str, Any] = catalog_config
+        self.catalog_path: pathlib.Path = root / "catalog.json"
+
+    def _write_cog(self, path: pathlib.Path, epsg: int, min_x: float, max_y: float, seed: int) -> None:
+        size = self.config["TILE_PIXELS"]
+        rng = np.random.default_rng(seed)
+        rows, cols = np.indices((size, size), dtype=np.float32)
+        bands = []
+        for band in range(4):
+            pattern = 96 + 64 * np.sin(rows / (37.0 + 11 * band) + seed) * np.cos(cols / (53.0 + 7 * band))
+            bands.append(np.clip(pattern + rng.integers(0, 24, (size, size)), 0, 255).astype(np.uint8))
+        with rasterio.open(path, "w", driver="COG", width=size, height=size, count=4, dtype="uint8",
+                           crs=f"EPSG:{epsg}", transform=from_origin(min_x, max_y, self.config["GSD"], self.config["GSD"]),
+                           compress="DEFLATE", blocksize=self.config["BLOCK_SIZE"]) as dst:
+            dst.write(np.stack(bands))
+
+    def build(self) -> List[Dict[str, Any]]:
+        """
+        Writes any missing COGs and (re)writes catalog.json.
+
+        Returns:
+            The STAC item dicts, one per tile and vintage.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tile_meters = self.config["TILE_PIXELS"] * self.config["GSD"]
+        item_dicts: List[Dict[str, Any]] = []
+        seed = 0
+        for epsg, lon, lat in self.config["ZONES"]:
+            to_utm = pyproj.Transformer.from_crs("EPSG:4326", f"EPSG:{epsg}", always_xy=True)
+            to_ll = pyproj.Transformer.from_crs(f"EPSG:{epsg}", "EPSG:4326", always_xy=True)
+            origin_x, origin_y = to_utm.transform(lon, lat)
+            for row in range(self.config["TILES_PER_SIDE"]):
+                for col in range(self.config["TILES_PER_SIDE"]):
+                    min_x, max_y = origin_x + col * tile_meters, origin_y - row * tile_meters
+                    footprint_ll = shapely_transform(to_ll.transform, box(min_x, max_y - tile_meters, min_x + tile_meters, max_y))
+                    for year in self.config["YEARS"]:
+                        seed += 1
+                        tile_id = f"bench_{epsg}_{row}_{col}_{year}"
+                        cog_path = self.root / f"{tile_id}.tif"
+                        if not cog_path.exists():
+                            logger.info(f"Writing synthetic COG {cog_path.name}")
+                            self._write_cog(cog_path, epsg, min_x, max_y, seed)
+                        item = StacItem(id=tile_id, geometry=mapping(footprint_ll), bbox=list(footprint_ll.bounds),
+                                        datetime=datetime.datetime(year, 7, 1, tzinfo=datetime.timezone.utc),
+                                        properties={"gsd": self.config["GSD"], "proj:epsg": epsg})
+                        item.add_asset("image", StacAsset(href=str(cog_path.resolve()), media_type="image/tiff; application=geotiff; profile=cloud-optimized"))
+                        item_dicts.append(item.to_dict(transform_hrefs=False))
+        self.catalog_path.write_text(json.dumps(item_dicts), encoding="utf-8")
+        return item_dicts
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Reads catalog.json written by build()."""
+        return json.loads(self.catalog_path.read_text(encoding="utf-8"))
+
+
+# --- In-Process STAC Stand-in ---
+class _ItemSearch:
+    def __init__(self, items: List[StacItem]):
+        self._items = items
+
+    def items(self):
+        return iter(self._items)
+
+
+class InProcessStacClient:
+    """
+    Drop-in for the pystac_client.Client surface naip_pull uses: search(collections=...,
+    intersects=... or bbox=..., limit=...).items(). Footprints are indexed with an STRtree, so
+    the stand-in itself stays out of the way of the numbers.
+    """
+
+    def __init__(self, item_dicts: List[Dict[str, Any]], latency_ms: float = 0.0):
+        """
+        Args:
+            item_dicts: STAC item dicts (from SyntheticNaipCatalog).
+            latency_ms: Sleep this long per search to mimic a remote catalog round trip.
+        """
+        self.items: List[StacItem] = [StacItem.from_dict(d) for d in item_dicts]
+        self.footprints = [shape(item.geometry) for item in self.items]
+        self.tree = STRtree(self.footprints)
+        self.latency_s: float = latency_ms / 1000.0
+        self.search_count: int = 0
+
+    def search(self, collections: Optional[List[str]] = None, intersects: Optional[Dict[str, Any]] = None,
+               bbox: Optional[List[float]] = None, limit: Optional[int] = None, **_: Any) -> _ItemSearch:
+        self.search_count += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        query = shape(intersects) if intersects is not None else box(*bbox)
+        hits = sorted(self.tree.query(query, predicate="intersects"))
+        return _ItemSearch([self.items[i] for i in hits])
+
+
+# --- Synthetic Substations ---
+def make_substations(count: int, item_dicts: List[Dict[str, Any]], no_coverage_fraction: float, seed: int) -> List[Dict[str, Any]]:
+    """
+    Builds `count` substation records shaped like the app's substations.json.
+
+    Half are points and half small rotated-ish polygons (~40-120 m across), placed uniformly
+    inside a random tile footprint; no_coverage_fraction of them go somewhere with no imagery.
+
+    Returns:
+        The records, reproducible for a given seed.
+    """
+    rng = np.random.default_rng(seed)
+    footprints = [shape(d["geometry"]) for d in item_dicts]
+    records: List[Dict[str, Any]] = []
+    for index in range(count):
+        if rng.random() < no_coverage_fraction:
+            lon, lat = rng.uniform(-105.0, -100.0), rng.uniform(36.0, 38.0) # Nothing in the synthetic catalog out here
+        else:
+            min_x, min_y, max_x, max_y = footprints[rng.integers(len(footprints))].bounds
+            inset_x, inset_y = (max_x - min_x) * 0.1, (max_y - min_y) * 0.1
+            lon, lat = rng.uniform(min_x + inset_x, max_x - inset_x), rng.uniform(min_y + inset_y, max_y - inset_y)
+
+        if index % 2:
+            geometry = {"type": "Point", "coordinates": [lon, lat]}
+        else:
+            half_x = rng.uniform(20, 60) / (111320.0 * math.cos(math.radians(lat)))
+            half_y = rng.uniform(20, 60) / 110540.0
+            geometry = mapping(box(lon - half_x, lat - half_y, lon + half_x, lat + half_y))
+        records.append({
+            "full_id": f"bench{index}",
+            "id": index,
+            "name": f"Synthetic Substation {index}",
+            "substation": "transmission",
+            "geometry": geometry,
+        })
+    return records
+
+
+# --- Benchmark Cases ---
+def _peak_rss_mb() -> Optional[float]:
+    # Prefer VmHWM on Linux: ru_maxrss survives fork+exec, so a spawned case would inherit the parent's peak
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0 # bytes on macOS, KiB on Linux
+
+
+def _bench_config(workdir: pathlib.Path, case_name: str, input_path: pathlib.Path, mode: str, workers: int) -> Dict[str, Any]:
+    """A copy of naip_pull.CONFIG pointed at the benchmark's inputs/outputs, with caching and incremental runs off."""
+    config = {section: dict(values) for section, values in naip_pull.CONFIG.items()}
+    config["INPUT_DATA"].update(SOURCE_TYPE="ndjson", NDJSON_FILE_PATH=input_path)
+    config["OUTPUT"]["IMAGE_FOLDER"] = workdir / "out" / case_name
+    config["TILING"]["TILE_FOLDER"] = workdir / "tiles" / case_name
+    config["STAC_CACHE"]["ENABLED"] = False
+    config["INCREMENTAL"]["ENABLED"] = False
+    config["EXECUTION"].update(MODE=mode, MAX_WORKERS=workers, PROGRESS_INTERVAL=0)
+    config["REPORTING"].update(RUN_REPORT_PATH=workdir / "reports" / f"{case_name}.json", PROFILER=None)
+    return config
+
+
+def _stage_case(case: str, records: List[Dict[str, Any]], config: Dict[str, Any], stac_client: InProcessStacClient) -> Tuple[float, Dict[str, Any]]:
+    """
+    Times one processor stage over every record; the stages it depends on run untimed first.
+
+    Returns:
+        (seconds spent in the timed stage, its per-record timing summary)
+    """
+    timings = naip_pull.StageTimings()
+    timed_total = 0.0
+    for index, record in enumerate(records):
+        processor = naip_pull.SubstationImageProcessor(index, record, config)
+        if not processor.validate():
+            continue
+
+        if case == "geometry":
+            start = time.perf_counter()
+            processor._prepare_geometry()
+            elapsed = time.perf_counter() - start
+        else:
+            if not processor._prepare_geometry():
+                continue
+            if case == "search":
+                start = time.perf_counter()
+                processor._search_stac_for_imagery(stac_client)
+                elapsed = time.perf_counter() - start
+            else:
+                if not processor._search_stac_for_imagery(stac_client):
+                    continue
+                if case == "extract":
+                    start = time.perf_counter()
+                    processor._extract_raster_chip()
+                    elapsed = time.perf_counter() - start
+                else: # save
+                    if not processor._extract_raster_chip():
+                        continue
+                    start = time.perf_counter()
+                    processor._save_output_image()
+                    elapsed = time.perf_counter() - start
+                processor.processed_image_array = None # Don't hold every chip for the whole case
+
+        timings.add(case, elapsed)
+        timed_total += elapsed
+    return timed_total, timings.summary().get(case, {})
+
+
+def run_case(case: str, size: int, workdir: str, mode: str, workers: int, stac_latency_ms: float) -> Dict[str, Any]:
+    """
+    Runs one (case, size) benchmark. Called in a fresh process, so peak RSS is this case's alone.
+
+    Returns:
+        A result row: records, seconds, records_per_s, peak_rss_mb and a stage timing summary.
+    """
+    logging.getLogger("naip_pull").setLevel(logging.ERROR) # Per-record INFO / no-coverage lines would swamp the numbers (and the terminal)
+    workdir_path = pathlib.Path(workdir)
+    catalog = SyntheticNaipCatalog(workdir_path / "cogs", BENCH_CONFIG["CATALOG"])
+    stac_client = InProcessStacClient(catalog.load(), latency_ms=stac_latency_ms)
+    input_path = workdir_path / "inputs" / f"substations_{size}.geojsonl"
+    case_name = f"{case}_{size}"
+    config = _bench_config(workdir_path, case_name, input_path, mode, workers)
+
+    result: Dict[str, Any] = {"case": case, "size": size}
+    if case == "e2e":
+        with mock.patch.dict(naip_pull.CONFIG, config), \
+                mock.patch.object(naip_pull.pystac_client.Client, "open", staticmethod(lambda url, *a, **k: stac_client)):
+            start = time.perf_counter()
+            try:
+                naip_pull.main([])
+            except SystemExit as e:
+                result["exit_code"] = e.code
+            seconds = time.perf_counter() - start
+        report = json.loads(config["REPORTING"]["RUN_REPORT_PATH"].read_text(encoding="utf-8"))
+        result.update(records=report["outcomes"]["total"], outcomes=report["outcomes"], stages=report["stages"])
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        seconds, summary = _stage_case(case, records, config, stac_client)
+        result.update(records=len(records), stages={case: summary})
+
+    result["seconds"] = seconds
+    result["records_per_s"] = result["records"] / seconds if seconds > 0 else None
+    result["stac_searches"] = stac_client.search_count
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+# --- Main ---
+def prepare_inputs(workdir: pathlib.Path, sizes: List[int]) -> None:
+    """Builds the synthetic catalog (COGs are reused between runs) and one NDJSON input per size."""
+    item_dicts = SyntheticNaipCatalog(workdir / "cogs", BENCH_CONFIG["CATALOG"]).build()
+    inputs_dir = workdir / "inputs"
+    inputs_dir.mkdir(parents=True, exist_ok=True)
+    for size in sizes:
+        records = make_substations(size, item_dicts, BENCH_CONFIG["NO_COVERAGE_FRACTION"], BENCH_CONFIG["SEED"])
+        with open(inputs_dir / f"substations_{size}.geojsonl", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for naip_pull.py.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in BENCH_CONFIG["SIZES"]),
+                        help="Comma-separated feature counts (default: %(default)s).")
+    parser.add_argument("--cases", default=",".join(BENCH_CONFIG["CASES"]),
+                        help="Comma-separated subset of geometry,search,extract,save,e2e (default: all).")
+    parser.add_argument("--mode", choices=["sequential", "concurrent"], default="sequential",
+                        help="EXECUTION.MODE for the e2e case.")
+    parser.add_argument("--workers", type=int, default=naip_pull.CONFIG["EXECUTION"]["MAX_WORKERS"],
+                        help="EXECUTION.MAX_WORKERS for the e2e case.")
+    parser.add_argument("--stac-latency-ms", type=float, default=0.0,
+                        help="Simulated per-search catalog latency (0 = local speed).")
+    parser.add_argument("--workdir", type=pathlib.Path, default=BENCH_CONFIG["WORKDIR"])
+    parser.add_argument("--output", type=pathlib.Path, default=None,
+                        help="Results JSON (default: WORKDIR/results.json).")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = set(cases) - set(BENCH_CONFIG["CASES"])
+    if unknown:
+        raise SystemExit(f"Unknown benchmark case(s): {sorted(unknown)}")
+
+    workdir = args.workdir.resolve()
+    prepare_inputs(workdir, sizes)
+
+    results: List[Dict[str, Any]] = []
+    spawn = multiprocessing.get_context("spawn")
+    for size in sizes:
+        for case in cases:
+            logger.info(f"Running {case} at {size} features...")
+            # Fresh interpreter per case: ru_maxrss only ever goes up, so sharing a process would blur the peaks
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                result = pool.submit(run_case, case, size, str(workdir), args.mode, args.workers, args.stac_latency_ms).result()
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+            rate = f"{result['records_per_s']:.1f}" if result["records_per_s"] else "n/a"
+            logger.info(f"  {case:<8} n={size:<6} {result['seconds']:8.2f}s  {rate:>9} records/s  peak RSS {rss}")
+
+    output_path = args.output or workdir / "results.json"
+    output_path.write_text(json.dumps({
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "settings": {"mode": args.mode, "workers": args.workers, "stac_latency_ms": args.stac_latency_ms},
+        "results": results,
+    }, indent=2), encoding="utf-8")
+    logger.info(f"Benchmark results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
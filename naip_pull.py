@@ -1,55 +1,229 @@
+from __future__ import annotations
+
 import os
 import pathlib
 import json
+import hashlib
+import sqlite3
+import argparse
 import datetime
 import math
+import random
+import re
 import sys
+import io
+import queue
+import time
 import logging
-from typing import List, Dict, Any, Optional, Tuple, TypeAlias
-import numpy as np
-import pyproj
-import rasterio
-from rasterio import features
-from rasterio.enums import Resampling
-from rasterio.errors import RasterioIOError, WindowError
-from shapely.geometry import shape, Point
-from shapely.geometry.base import BaseGeometry
-from shapely.ops import transform as shapely_transform
-from pystac_client import Client
-from PIL import Image
-from pystac import Asset as StacAsset # Explicit type for STAC asset which here I decided to just use this webcomputer because that's what is used say in the GeoAI github
+import threading
+import functools
+import importlib
+import types
+import itertools
+import contextlib
+import multiprocessing
+from array import array
+from collections import defaultdict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple, TypeAlias, Iterable, Iterator, TextIO
+
+if TYPE_CHECKING:
+    # Only for the annotations; at runtime these are reached through the lazy modules below
+    from rasterio.enums import Resampling
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+    from shapely import STRtree
+    from shapely.geometry.base import BaseGeometry
+    from pystac_client import Client
+    from pystac import Item as StacItem
+    from pystac import Asset as StacAsset # Explicit type for STAC asset which here I decided to just use this webcomputer because that's what is used say in the GeoAI github
+
+
+# --- Lazy Imports ---
+class _LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is only imported the first time one of its attributes is used.
+
+    numpy and the geospatial stack (GDAL via rasterio, PROJ via pyproj, GEOS via shapely,
+    pystac_client, PIL) take most of a second to import. Going through these proxies means
+    --help never loads them, nor does --plan on JSON/NDJSON input (sharded or not; GeoPackage
+    and FlatGeobuf inputs still need fiona), and a real run pays the cost in the first stage
+    that needs each one. Submodules resolve too (rasterio.warp, shapely.ops, ...).
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module: Optional[types.ModuleType] = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr) # Keep introspection (copy, pickle, doctest) from triggering the import
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        try:
+            return getattr(self._module, attr)
+        except AttributeError:
+            try:
+                return importlib.import_module(f"{self.__name__}.{attr}")
+            except ModuleNotFoundError:
+                raise AttributeError(f"module '{self.__name__}' has no attribute '{attr}'") from None
+
+
+np = _LazyModule("numpy")
+pyproj = _LazyModule("pyproj")
+shapely = _LazyModule("shapely")
+rasterio = _LazyModule("rasterio")
+features = _LazyModule("rasterio.features")
+pystac = _LazyModule("pystac")
+pystac_client = _LazyModule("pystac_client")
+Image = _LazyModule("PIL.Image")
 
 
 # --- Type Aliases for Enhanced Readability ---
 # Define custom types for common data structures used throughout the script.
 GeoJSONGeometry: TypeAlias = Dict[str, Any]
 SubstationRecord: TypeAlias = Dict[str, Any]
-ImageArray: TypeAlias = np.ndarray # Representing H, W, C image data i think this is the common format? not sure we can change if needed :)
+ImageArray: TypeAlias = "np.ndarray" # Representing H, W, C image data i think this is the common format? not sure we can change if needed :)
+
+# --- Processing Outcomes ---
+# Every record ends up in exactly one of these buckets, which is what the run summary counts.
+OUTCOME_SUCCESS = "success"
+OUTCOME_NO_COVERAGE = "no_coverage"
+OUTCOME_FAILURE = "failure"
+OUTCOME_SKIPPED = "skipped" # Incremental mode: unchanged since the last run, nothing to do
+OUTCOME_PENDING = "pending" # Chip handed to the async writer; its real outcome is reported when the write finishes
 
 # --- Configuration Block ---
 # Centralized configuration management using a dictionary.
 # This approach allows for easier modification and potentially loading from external files.
 CONFIG = {
     "INPUT_DATA": {
-        "SOURCE_TYPE": "json", # Could be changed Ashley if we want to move this to a CSV/coco/etc. file instead
-        "JSON_FILE_PATH": pathlib.Path("./substation_data.json"),
+        "SOURCE_TYPE": "json", # Could be changed Ashley if we want to move this to a CSV/coco/etc. file instead. "json", "ndjson"/"geojsonseq", "gpkg" or "fgb"
+        "JSON_FILE_PATH": pathlib.Path("./substation_data.json"), # JSON array of records / GeoJSON Features, or a FeatureCollection
+        "NDJSON_FILE_PATH": pathlib.Path("./substation_data.geojsonl"), # One record or GeoJSON Feature per line
+        "VECTOR_FILE_PATH": pathlib.Path("./substation_data.gpkg"), # GeoPackage / FlatGeobuf, read through fiona
+        "VECTOR_LAYER": None, # Layer name for multi-layer GeoPackages (None = first layer)
+        "READ_CHUNK_BYTES": 1 << 20, # Read size for the streaming JSON array parser
     },
     "GEOSPATIAL": {
         "BUFFER_METERS": 100.0,
         "TARGET_GEOGRAPHIC_CRS": "EPSG:4326", # WGS84 what we are using for our webapplication
-        "DEFAULT_RESAMPLING": Resampling.bilinear, # Default resampling for raster reads  but there is also the nearest nei resampling if we want to try that though in my exp it looks blocky
+        "DEFAULT_RESAMPLING": "bilinear", # Name of a rasterio Resampling method, default for raster reads  but there is also the nearest nei resampling if we want to try that though in my exp it looks blocky
         "BOUNDLESS_READ": True, # Allow reading slightly outside raster bounds if needed, initally I had this causing issues so set to false if you do
+        "BULK_GEOMETRY_PREP": False, # Reproject/buffer a whole UTM zone's features in a few vectorized shapely calls; runs through the staged pipeline (chunks of STAGE_CHUNK_SIZE)
+    },
+    "RASTER_IO": {
+        "GDAL_CACHEMAX_MB": 512, # GDAL block cache; process-wide, so it's set once instead of being toggled by every thread's env
+        # GDAL config for the remote COG reads, scoped with rasterio.Env around every open + read
+        "GDAL_OPTIONS": {
+            "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR", # Don't list the blob container looking for sidecar files on every open
+            "GDAL_INGESTED_BYTES_AT_OPEN": 65536, # Pull the whole COG header (IFDs + tile offsets) in the first request
+            "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES", # Adjacent tiles of a window come back as one range request
+            "GDAL_HTTP_MULTIPLEX": "YES", # HTTP/2 multiplexing: parallel range requests share one connection
+            "GDAL_HTTP_VERSION": "2",
+            "GDAL_HTTP_MAX_RETRY": 2, # GDAL's own retry for 429/502/503/504, below our retry loop
+            "GDAL_HTTP_RETRY_DELAY": 0.5,
+            "CPL_VSIL_CURL_CACHE_SIZE": 128 * 1024 * 1024, # Process-wide /vsicurl/ cache of fetched ranges, so repeat headers/tiles are free
+            "VSI_CACHE": "TRUE", # Per-open-file block cache on top of that
+            "VSI_CACHE_SIZE": 32 * 1024 * 1024,
+        },
+        "MAX_RETRIES": 3, # Extra attempts for a transient open/read failure (timeouts, resets, 429/5xx)
+        "RETRY_BACKOFF_SECONDS": 0.5, # First backoff; doubles each attempt, with jitter
+        "RETRY_BACKOFF_MAX_SECONDS": 8.0,
     },
     "STAC": {
         "CATALOG_URL": "https://planetarycomputer.microsoft.com/api/stac/v1", # this is what everyone uses from what i read
         "COLLECTION": "naip",
         "ASSET_KEY": "image", # Key for the desired image asset within a STAC item
         "SEARCH_LIMIT": 20, # Limit for STAC search results per feature
+        "BATCH_SEARCH": False, # One search per spatial group of features instead of one per feature
+        "BATCH_GROUPING": "grid", # "grid" (BATCH_GRID_DEGREES cells) or "utm_zone"
+        "BATCH_GRID_DEGREES": 1.0, # Cell size for grid grouping; NAIP quarter quads are ~0.0625 deg so a 1 deg cell is a few hundred items per vintage
+        "BATCH_PAGE_LIMIT": 1000, # Page size for batch searches (Planetary Computer caps this at 1000)
+    },
+    "STAC_CACHE": {
+        "ENABLED": False, # Persist search results + item JSON locally so reruns don't hit the catalog again
+        "PATH": pathlib.Path("./.naip_cache/stac_cache.sqlite"),
+        "TTL_SECONDS": 30 * 24 * 3600, # NAIP items rarely change, a month is plenty fresh
+        "MAX_SIZE_MB": 512, # Least recently used searches get evicted past this size
+        "OFFLINE": False, # Replay entirely from the cache (no catalog requests); also set by --offline
+    },
+    "INCREMENTAL": {
+        "ENABLED": False, # Skip features the manifest says are already done and unchanged (also set by --incremental)
+        "MANIFEST_PATH": pathlib.Path("./naip_manifest.jsonl"), # Append-only, one JSON line per finished feature
+        "RECHECK_IMAGERY": True, # Re-run the STAC search for unchanged geometries so newer NAIP still gets picked up; False skips on geometry alone
     },
     "OUTPUT": {
         "IMAGE_FOLDER": pathlib.Path("./public/naip_images"),
-        "IMAGE_FORMAT": "PNG",
-        "OPTIMIZE_PNG": True,
+        "IMAGE_FORMAT": "PNG", # Encoder for chip images: "PNG", "WEBP" (lossless), "JPEG" (previews) or "COG" (keeps the georeference)
+        "OPTIMIZE_PNG": True, # PIL's optimize pass; smallest files but by far the slowest encode, overrides PNG_COMPRESS_LEVEL (False = use PNG_COMPRESS_LEVEL)
+        "PNG_COMPRESS_LEVEL": 6, # zlib level 0-9; 1-3 is a lot faster for a few % bigger files
+        "WEBP_METHOD": 4, # 0 (fast) - 6 (slowest, smallest); WebP output is always lossless
+        "JPEG_QUALITY": 90,
+        "COG_COMPRESSION": "DEFLATE", # GDAL COG driver COMPRESS option (e.g. "DEFLATE", "ZSTD", "LZW", "JPEG")
+        "ASYNC_WRITER": False, # Encode + write chips on background threads so the next raster read doesn't wait on compression (write errors then surface after the record moves on)
+        "WRITER_THREADS": 2, # Background writer threads (encodes still go to the CPU_WORKERS process pool when there is one)
+        "WRITER_QUEUE_SIZE": 16, # Chips waiting for the writer; readers block when it's full, which caps memory
+    },
+    "CHIP": {
+        "FIXED_SIZE": False, # Fixed-size chips centred on the substation instead of the buffered-geometry window (for ML batches)
+        "SIZE_PX": 512, # Chip width and height in pixels
+        "TARGET_GSD_METERS": 0.6, # Output resolution; sources at another GSD are resampled in the same single warped read
+    },
+    "MOSAIC": {
+        "ENABLED": False, # Fill the parts of a chip that fall off the selected tile from the other same-year tiles covering it
+        "MAX_ITEMS": 4, # Extra tiles per chip at most (a chip can touch up to 4 quarter quads)
+    },
+    "MASK": {
+        "ENABLED": False, # Rasterize the substation + buffer geometry onto the chip grid while extracting (no reopen/reproject later)
+        "MODE": "companion", # "companion" writes a uint8 mask next to the chip, "alpha" adds it as the chip's alpha channel (PNG/WEBP/COG only)
+        "FOLDER": pathlib.Path("./public/naip_masks"), # Companion masks: {full_id}.png, or a georeferenced .tif when IMAGE_FORMAT is COG
+        "FOOTPRINT_VALUE": 255, # Pixels inside the original substation geometry
+        "BUFFER_VALUE": 128, # Pixels inside the buffer but outside the footprint (0 = everything outside the buffer)
+        "ALL_TOUCHED": False, # Burn every pixel the geometry touches instead of only those whose centre is inside
+    },
+    "TEMPORAL": {
+        "ENABLED": False, # Also extract older NAIP vintages into a per-feature time stack for change detection
+        "MAX_VINTAGES": None, # Keep the N most recent acquisition years (None = every year the catalog has)
+        "STACK_FOLDER": pathlib.Path("./public/naip_stacks"), # {full_id}.npz: chips (T, H, W, 3) uint8 + years, item ids, transform, CRS
+    },
+    "INDEX": {
+        "ENABLED": False, # Write a compact columnar index of every chip (bbox, centroid, item, GSD, size, path) for the app / downstream tools
+        "PATH": pathlib.Path("./public/naip_index"), # ".parquet" or ".npy" gets appended depending on FORMAT
+        "FORMAT": "auto", # "parquet" (needs pyarrow), "numpy" (fixed-layout structured .npy, no extra deps) or "auto" (parquet if pyarrow imports)
+    },
+    "TILING": {
+        "ENABLED": False, # Write a 256x256 TMS pyramid per substation for the app's /api/tiles route
+        "TILE_FOLDER": pathlib.Path("./public/tiles"), # Tiles land in {TILE_FOLDER}/{full_id}/{z}/{x}/{y}.png (TMS y, like the route expects)
+        "MIN_ZOOM": 15,
+        "MAX_ZOOM": 18, # ~0.6 m/px at the equator, which is about NAIP's native GSD
+        "TILE_SIZE": 256,
+        "PNG_COMPRESS_LEVEL": 6, # zlib level for tile PNGs, lower is faster to write
+        "KEEP_CHIP_IMAGE": False, # Also write the flat full-size chip to OUTPUT.IMAGE_FOLDER
+    },
+    "EXECUTION": {
+        "MODE": "sequential", # "sequential" keeps the original one-record-at-a-time loop, "concurrent" uses the worker pools below
+        "MAX_WORKERS": 8, # Threads for the I/O-bound stages (STAC search + remote COG reads)
+        "CPU_WORKERS": 0, # Processes for the CPU-bound image encode; 0 keeps encoding on the writer (or I/O) threads
+        "MAX_IN_FLIGHT": None, # Max records queued/running at once; None means 2x MAX_WORKERS so memory stays bounded
+        "PROGRESS_INTERVAL": 50, # Log progress + throughput every N completed records (0 disables)
+        "GROUP_READS_BY_ASSET": False, # Resolve imagery for all records first, then open each COG once and read all of its windows
+        "MERGE_OVERLAPPING_READS": False, # With GROUP_READS_BY_ASSET: one union read per cluster of overlapping windows, chips sliced out as views
+        "MAX_MERGED_READ_PIXELS": 4096 * 4096, # Cap on a merged read's area (~48 MB of RGB) so one dense cluster can't blow up memory
+        "STAGE_CHUNK_SIZE": 5000, # The staged pipeline works through the input this many records at a time, so memory stays flat
+    },
+    "SHARDING": {
+        "SHARD_INDEX": None, # This worker's shard, 0-based (None = read INDEX_ENV_VAR, else unsharded); also set by --shard-index
+        "SHARD_COUNT": None, # Total shards (None = read COUNT_ENV_VAR, else 1); also set by --shard-count
+        "INDEX_ENV_VAR": "JOB_COMPLETION_INDEX", # Set per pod by a Kubernetes Indexed Job
+        "COUNT_ENV_VAR": "NAIP_SHARD_COUNT", # Set to the Job's completions count
+        "STRATEGY": "hash", # "hash" (full_id, even split - use this unless COG reuse matters more than balance) or "spatial" (whole SPATIAL_TILE_DEGREES cells per shard so COG reuse stays local)
+        "SPATIAL_TILE_DEGREES": 0.25, # "spatial" only. A few NAIP quarter quads per cell; substations cluster, so a few dense cells can leave shards lopsided (or empty)
+    },
+    "REPORTING": {
+        "RUN_REPORT_PATH": None, # Path for a JSON report of per-stage timing percentiles + outcome counts, e.g. ./naip_run_report.json (None = no report; also set by --report)
+        "PROFILER": None, # None, "cprofile" or "pyinstrument" (also set by --profile); only the main thread is profiled
+        "PROFILE_PATH": pathlib.Path("./naip_profile"), # .prof (cProfile, open with snakeviz/pstats) or .html (pyinstrument) gets appended
     },
     "LOGGING": {
         "LEVEL": logging.INFO,
@@ -59,20 +233,30 @@ CONFIG = {
 
 # --- Logging Setup ---
 # Configure structured logging for better monitoring and debugging.
-logging.basicConfig(level=CONFIG["LOGGING"]["LEVEL"], format=CONFIG["LOGGING"]["FORMAT"])
 logger = logging.getLogger(__name__) # Get logger for this module
 
-# --- Geospatial Utility Function ---
-def calculate_utm_crs(latitude: float, longitude: float) -> pyproj.CRS:
+
+def setup_logging(logging_config: Dict[str, Any]) -> None:
     """
-    Determines the appropriate UTM Coordinate Reference System for a given latitude and longitude.
+    Configures root logging for a CLI run. Called from main() rather than at import, so
+    importing this module (the benchmark, the chip index loader, notebooks) leaves the
+    caller's logging alone.
 
     Args:
-        latitude: Latitude of the point.
-        longitude: Longitude of the point.
+        logging_config: The LOGGING section of CONFIG; LEVEL may be a logging constant or a name like "DEBUG".
+    """
+    level = logging_config["LEVEL"]
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    logging.basicConfig(level=level, format=logging_config["FORMAT"])
+
+# --- Geospatial Utility Function ---
+UTM_ZONE_COUNT = 60 # Zones 1-60; lon 180 would compute as zone 61 (EPSG:32661 is UPS North), so it's clamped to 60
 
-    Returns:
-        A pyproj.CRS object representing the calculated UTM zone.
+
+def utm_epsg(latitude: float, longitude: float) -> int:
+    """
+    Returns the EPSG code of the WGS84 UTM zone for a latitude and longitude (pure arithmetic, no PROJ).
 
     Raises:
         ValueError: If latitude or longitude are out of valid bounds.
@@ -82,22 +266,528 @@ def calculate_utm_crs(latitude: float, longitude: float) -> pyproj.CRS:
     if not -90 <= latitude <= 90:
         raise ValueError(f"Invalid latitude: {latitude}. Must be between -90 and 90.")
 
-    # Calculate UTM zone number (1-60)
-    zone_number = math.floor((longitude + 180) / 6) + 1
+    # Calculate UTM zone number (1-60); the antimeridian itself belongs to zone 60
+    zone_number = min(math.floor((longitude + 180) / 6) + 1, UTM_ZONE_COUNT)
 
     # Determine hemisphere and corresponding EPSG base code
     # Northern Hemisphere EPSG codes start with 326xx, Southern with 327xx accc to google lol if i messed up lmk and we can update
     epsg_base = 32600 if latitude >= 0 else 32700
-    epsg_code = epsg_base + zone_number
+    return epsg_base + zone_number
+
+
+def calculate_utm_crs(latitude: float, longitude: float) -> pyproj.CRS:
+    """
+    Determines the appropriate UTM Coordinate Reference System for a given latitude and longitude.
+
+    Args:
+        latitude: Latitude of the point.
+        longitude: Longitude of the point.
+
+    Returns:
+        A pyproj.CRS object representing the calculated UTM zone.
 
-    logger.debug(f"Calculated UTM zone {zone_number} {'N' if latitude >= 0 else 'S'} (EPSG:{epsg_code}) for ({latitude}, {longitude})")
+    Raises:
+        ValueError: If latitude or longitude are out of valid bounds.
+    """
+    epsg_code = utm_epsg(latitude, longitude)
+    logger.debug(f"Calculated UTM zone {epsg_code % 100} {'N' if latitude >= 0 else 'S'} (EPSG:{epsg_code}) for ({latitude}, {longitude})")
     return pyproj.CRS(f"EPSG:{epsg_code}")
 
 
+def resampling_method(value: Any) -> Resampling:
+    """Turns DEFAULT_RESAMPLING (a name like "bilinear", or a Resampling member) into the rasterio enum."""
+    if isinstance(value, str):
+        return rasterio.enums.Resampling[value.lower()]
+    return value
+
+
+@functools.lru_cache(maxsize=128)
+def _build_transformer(from_crs: str, to_crs: str) -> pyproj.Transformer:
+    return pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+
+def get_transformer(from_crs: Any, to_crs: Any) -> pyproj.Transformer:
+    """
+    Returns an always_xy pyproj.Transformer between two CRSs, reusing one per CRS pair.
+
+    Building a Transformer costs far more than using one, and a run only ever touches a
+    handful of CRSs. pyproj Transformers are safe to share across threads.
+
+    Args:
+        from_crs: Source CRS (string, pyproj.CRS or rasterio CRS).
+        to_crs: Destination CRS (same options).
+    """
+    def _crs_key(crs: Any) -> str:
+        return crs.to_string() if hasattr(crs, "to_string") else str(crs)
+    return _build_transformer(_crs_key(from_crs), _crs_key(to_crs))
+
+
+def geometry_hash(geometry: GeoJSONGeometry) -> str:
+    """
+    Returns a stable hash for a GeoJSON-like geometry (or any JSON-serializable query payload).
+
+    Keys are sorted so two dicts with the same content always hash the same.
+    """
+    canonical = json.dumps(geometry, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _geojson_bounds(geometry: GeoJSONGeometry) -> Optional[Tuple[float, float, float, float]]:
+    """(min_x, min_y, max_x, max_y) of a GeoJSON geometry by walking its coordinates; no shapely needed."""
+    xs: List[float] = []
+    ys: List[float] = []
+
+    def walk(node: Any) -> None:
+        if isinstance(node, (list, tuple)) and node and isinstance(node[0], (int, float)):
+            xs.append(float(node[0]))
+            ys.append(float(node[1]))
+        elif isinstance(node, (list, tuple)):
+            for child in node:
+                walk(child)
+
+    if geometry.get("type") == "GeometryCollection":
+        for member in geometry.get("geometries") or []:
+            walk(member.get("coordinates") if isinstance(member, dict) else None)
+    else:
+        walk(geometry.get("coordinates"))
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# --- Image Encoders ---
+# Each encoder turns an (H, W, C) uint8 array into file bytes. They are plain module-level
+# functions so they can be shipped to a process pool, which is where the CPU-heavy
+# compression runs when CPU_WORKERS > 0. The georeference is passed as (crs_wkt, transform
+# coefficients) so it pickles cleanly; only the COG encoder uses it.
+def _encode_png(image_array: ImageArray, options: Dict[str, Any], georef: Optional[Tuple[str, Tuple[float, ...]]]) -> bytes:
+    buffer = io.BytesIO()
+    if options["OPTIMIZE_PNG"]:
+        Image.fromarray(image_array).save(buffer, format="PNG", optimize=True)
+    else:
+        Image.fromarray(image_array).save(buffer, format="PNG", compress_level=int(options["PNG_COMPRESS_LEVEL"]))
+    return buffer.getvalue()
+
+
+def _encode_webp(image_array: ImageArray, options: Dict[str, Any], georef: Optional[Tuple[str, Tuple[float, ...]]]) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format="WEBP", lossless=True, method=int(options["WEBP_METHOD"]))
+    return buffer.getvalue()
+
+
+def _encode_jpeg(image_array: ImageArray, options: Dict[str, Any], georef: Optional[Tuple[str, Tuple[float, ...]]]) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, format="JPEG", quality=int(options["JPEG_QUALITY"]))
+    return buffer.getvalue()
+
+
+def _encode_cog(image_array: ImageArray, options: Dict[str, Any], georef: Optional[Tuple[str, Tuple[float, ...]]]) -> bytes:
+    if georef is None:
+        raise ValueError("COG output needs the chip's CRS and transform.")
+    crs_wkt, transform_coeffs = georef
+    if image_array.ndim == 2:
+        image_array = image_array[:, :, np.newaxis] # Single band, e.g. a mask
+    height, width, band_count = image_array.shape
+    with rasterio.io.MemoryFile() as memfile:
+        with memfile.open(driver="COG", width=width, height=height, count=band_count, dtype=image_array.dtype,
+                          crs=crs_wkt, transform=rasterio.transform.Affine(*transform_coeffs), compress=options["COG_COMPRESSION"]) as dst:
+            dst.write(np.transpose(image_array, (2, 0, 1)))
+            if band_count == 4:
+                dst.colorinterp = [rasterio.enums.ColorInterp.red, rasterio.enums.ColorInterp.green, rasterio.enums.ColorInterp.blue, rasterio.enums.ColorInterp.alpha]
+        return memfile.read()
+
+
+# IMAGE_FORMAT -> (file extension, encoder). Add an entry here to support another output format.
+IMAGE_ENCODERS: Dict[str, Tuple[str, Any]] = {
+    "PNG": ("png", _encode_png),
+    "WEBP": ("webp", _encode_webp),
+    "JPEG": ("jpg", _encode_jpeg),
+    "COG": ("tif", _encode_cog),
+}
+
+
+def encode_image_bytes(image_array: ImageArray, image_format: str, options: Dict[str, Any],
+                       georef: Optional[Tuple[str, Tuple[float, ...]]] = None) -> bytes:
+    """
+    Encodes an (H, W, C) image array into an in-memory image file.
+
+    Args:
+        image_array: The image data to encode.
+        image_format: Key into IMAGE_ENCODERS (e.g. "PNG").
+        options: The encoder settings from CONFIG["OUTPUT"] (compression level, quality, ...).
+        georef: Optional (crs_wkt, affine coefficients) of the chip, needed for "COG".
+
+    Returns:
+        The encoded image bytes.
+
+    Raises:
+        ValueError: If image_format has no registered encoder.
+    """
+    if image_format.upper() not in IMAGE_ENCODERS:
+        raise ValueError(f"Unsupported IMAGE_FORMAT '{image_format}'. Expected one of {sorted(IMAGE_ENCODERS)}.")
+    _, encoder = IMAGE_ENCODERS[image_format.upper()]
+    return encoder(image_array, options, georef)
+
+
+# MASK.MODE values, and the IMAGE_FORMATs that can carry the mask as an alpha channel (JPEG can't)
+MASK_MODES = ("companion", "alpha")
+ALPHA_IMAGE_FORMATS = ("PNG", "WEBP", "COG")
+
+
+def validate_mask_config(mask_config: Dict[str, Any], output_config: Dict[str, Any]) -> None:
+    """
+    Checks the MASK settings against the output format up front, so a bad combination fails
+    before any feature is read rather than at every save.
+
+    Raises:
+        ValueError: On an unknown MASK.MODE, or "alpha" with an IMAGE_FORMAT that has no alpha channel.
+    """
+    if not mask_config["ENABLED"]:
+        return
+    mode = mask_config["MODE"]
+    if mode not in MASK_MODES:
+        raise ValueError(f"Unsupported MASK.MODE '{mode}'. Expected one of {list(MASK_MODES)}.")
+    image_format = str(output_config["IMAGE_FORMAT"]).upper()
+    if mode == "alpha" and image_format not in ALPHA_IMAGE_FORMATS:
+        raise ValueError(f"MASK.MODE 'alpha' needs an IMAGE_FORMAT with an alpha channel ({', '.join(ALPHA_IMAGE_FORMATS)}), "
+                         f"not {image_format}. Use MASK.MODE 'companion' instead.")
+
+
+# --- Stage Timing Instrumentation ---
+class StageTimings:
+    """
+    Thread-safe per-stage timing collector for the hot path.
+
+    Every processor stage (validate, geometry, STAC search, open, window read, save, ...) is
+    wrapped in measure(), which records its wall time plus whatever counters the stage fills
+    in (bytes, pixels, retries). Durations are kept in compact float arrays so the run report
+    can give exact p50/p95/p99 even on runs with millions of records.
+    """
+
+    COUNTERS = ("bytes", "pixels", "retries", "errors")
+
+    def __init__(self):
+        self._durations: Dict[str, array] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[Dict[str, int]]:
+        """
+        Times the body of a with-block as one sample of `stage`.
+
+        Yields:
+            A dict the caller can fill with "bytes", "pixels" and "retries" for this sample.
+            An exception escaping the block is counted under "errors" and re-raised.
+        """
+        metrics: Dict[str, int] = {}
+        start = time.perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            metrics["errors"] = metrics.get("errors", 0) + 1
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - start, **metrics)
+
+    def add(self, stage: str, seconds: float, **metrics: int) -> None:
+        """Records one sample for a stage (for callers that time things themselves)."""
+        with self._lock:
+            if stage not in self._durations:
+                self._durations[stage] = array("d")
+                self._counters[stage] = dict.fromkeys(self.COUNTERS, 0)
+            self._durations[stage].append(seconds)
+            counters = self._counters[stage]
+            for name, value in metrics.items():
+                counters[name] = counters.get(name, 0) + int(value)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count, total/mean/max and p50/p95/p99 wall time (seconds) plus the summed counters."""
+        with self._lock:
+            snapshot = {stage: (np.frombuffer(durations, dtype=np.float64).copy(), dict(self._counters[stage]))
+                        for stage, durations in self._durations.items()}
+
+        summary: Dict[str, Dict[str, float]] = {}
+        for stage, (durations, counters) in snapshot.items():
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            summary[stage] = {
+                "count": int(durations.size),
+                "total_s": float(durations.sum()),
+                "mean_s": float(durations.mean()),
+                "p50_s": float(p50),
+                "p95_s": float(p95),
+                "p99_s": float(p99),
+                "max_s": float(durations.max()),
+                **counters,
+            }
+        return summary
+
+
+# --- Managed Raster Reader ---
+class RasterReader:
+    """
+    Managed access to the source COGs.
+
+    env() scopes a rasterio.Env with the RASTER_IO.GDAL_OPTIONS (merged range requests,
+    HTTP/2 multiplexing, header size hint, VSI caches); the GDAL block cache size is
+    process-wide and set once when the reader is created. rasterio environments are
+    thread-local, so each worker thread enters its own around its open + reads. GDAL's
+    /vsicurl/ cache and connection handles outlive the env, which is what lets consecutive
+    features on the same asset reuse them.
+
+    retry() re-runs an open or read on transient errors with jittered exponential backoff.
+    Only errors that look like a network hiccup (timeouts, resets, 429/5xx) are retried;
+    everything else (4xx, an expired SAS token, a missing file, an unreadable format, a
+    corrupt tile) is raised straight away.
+    """
+
+    _HTTP_CODE_PATTERN = re.compile(r"HTTP (?:response )?code:?\s*(\d{3})", re.IGNORECASE)
+    # Checked first: a corrupt tile also surfaces as "Read or write failed", but reading it again won't help
+    _PERMANENT_PATTERN = re.compile(
+        r"no such file|does not exist|not recogni[sz]ed as (?:being in )?a supported file format"
+        r"|corrupt|decod|TIFFRead|permission denied"
+        r"|certificate|no alternative certificate subject name|ssl: no alternative", # TLS setup problems won't fix themselves
+        re.IGNORECASE,
+    )
+    _TRANSIENT_PATTERN = re.compile(
+        r"timed out|timeout|connection reset|reset by peer|connection refused|connection aborted|broken pipe"
+        r"|read or write failed|curl error|empty reply|transfer closed|could not resolve host"
+        r"|SSL_ERROR_SYSCALL|ssl.*(?:timed out|eof|reset)", # Dropped TLS connections only
+        re.IGNORECASE,
+    )
+
+    def __init__(self, raster_io_config: Dict[str, Any]):
+        """
+        Args:
+            raster_io_config: CONFIG["RASTER_IO"].
+        """
+        self.gdal_options: Dict[str, Any] = dict(raster_io_config["GDAL_OPTIONS"])
+        if raster_io_config["GDAL_CACHEMAX_MB"]:
+            # rasterio hands this straight to GDALSetCacheMax64, which takes bytes (a bare 512 would mean 512 bytes)
+            rasterio.env.set_gdal_config("GDAL_CACHEMAX", int(raster_io_config["GDAL_CACHEMAX_MB"]) * 1024 * 1024)
+        self.max_retries: int = max(0, int(raster_io_config["MAX_RETRIES"]))
+        self.backoff_seconds: float = float(raster_io_config["RETRY_BACKOFF_SECONDS"])
+        self.backoff_max_seconds: float = float(raster_io_config["RETRY_BACKOFF_MAX_SECONDS"])
+        self.logger = logging.getLogger(f"{__name__}.RasterReader")
+
+    def env(self) -> rasterio.Env:
+        """The GDAL environment to hold open around an open + its reads."""
+        return rasterio.Env(**self.gdal_options)
+
+    @classmethod
+    def is_transient(cls, error: Exception) -> bool:
+        """True for errors worth retrying: timeouts, resets, throttling and server errors."""
+        if not isinstance(error, rasterio.errors.RasterioIOError):
+            return False
+        message = str(error)
+        match = cls._HTTP_CODE_PATTERN.search(message)
+        if match is not None:
+            status = int(match.group(1))
+            return status == 429 or status >= 500
+        if cls._PERMANENT_PATTERN.search(message):
+            return False
+        # curl timeouts / connection resets / "Read or write failed" carry no status code
+        return cls._TRANSIENT_PATTERN.search(message) is not None
+
+    def retry(self, operation, description: str, metrics: Optional[Dict[str, int]] = None):
+        """
+        Runs operation(), retrying transient failures with jittered exponential backoff.
+
+        Args:
+            operation: Zero-argument callable (the open or the read).
+            description: What is being attempted, for the retry log lines.
+            metrics: Optional StageTimings metrics dict; retries are added under "retries".
+
+        Returns:
+            Whatever operation() returns.
+
+        Raises:
+            The last error once retries are exhausted, or immediately if it isn't transient.
+        """
+        attempt = 0
+        while True:
+            try:
+                return operation()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_transient(e):
+                    raise
+                delay = min(self.backoff_max_seconds, self.backoff_seconds * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                attempt += 1
+                if metrics is not None:
+                    metrics["retries"] = metrics.get("retries", 0) + 1
+                self.logger.warning(f"Transient error during {description} (attempt {attempt}/{self.max_retries}), retrying in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def open(self, asset_href: str, metrics: Optional[Dict[str, int]] = None) -> rasterio.io.DatasetReader:
+        """rasterio.open() with retries. Call inside env()."""
+        return self.retry(lambda: rasterio.open(asset_href), f"open of {asset_href}", metrics)
+
+
+# --- TMS Tile Pyramid ---
+WEB_MERCATOR_CRS = "EPSG:3857"
+WEB_MERCATOR_HALF_EXTENT = 20037508.342789244 # Half the width of the EPSG:3857 world square, in meters
+
+
+class TmsPyramidWriter:
+    """
+    Writes a TMS tile quadtree for one chip straight from the windowed read.
+
+    The chip is warped once into the Web Mercator tile grid at MAX_ZOOM (plus an alpha band
+    marking real coverage). Every lower zoom is then built by 2x2 alpha-weighted averaging of
+    the level below with NumPy, so the source raster is never touched again. Tiles with no
+    coverage are skipped, and tile rows are written with TMS (bottom-origin) y numbering,
+    which is what /api/tiles expects.
+    """
+
+    def __init__(self, tiling_config: Dict[str, Any], resampling: Resampling):
+        """
+        Args:
+            tiling_config: The CONFIG["TILING"] block.
+            resampling: Resampling used for the warp into the max zoom grid.
+        """
+        self.tile_root: pathlib.Path = tiling_config["TILE_FOLDER"]
+        self.min_zoom: int = int(tiling_config["MIN_ZOOM"])
+        self.max_zoom: int = int(tiling_config["MAX_ZOOM"])
+        self.tile_size: int = int(tiling_config["TILE_SIZE"])
+        self.compress_level: int = int(tiling_config["PNG_COMPRESS_LEVEL"])
+        self.resampling: Resampling = resampling
+        if self.min_zoom > self.max_zoom:
+            raise ValueError(f"TILING MIN_ZOOM ({self.min_zoom}) must not exceed MAX_ZOOM ({self.max_zoom}).")
+
+    def _tile_span(self, zoom: int) -> float:
+        """Width of one tile in Web Mercator meters at the given zoom."""
+        return 2 * WEB_MERCATOR_HALF_EXTENT / (2 ** zoom)
+
+    def _render_max_zoom(self, chip_array: ImageArray, chip_transform: Affine, chip_crs: Any) -> Tuple[np.ndarray, int, int]:
+        """
+        Warps the chip into the MAX_ZOOM tile grid.
+
+        Returns:
+            (rgba, tx_min, ty_min): a (4, H, W) uint8 canvas covering whole tiles, and the
+            XYZ column/row of its top-left tile.
+        """
+        height, width = chip_array.shape[:2]
+        left, bottom, right, top = rasterio.transform.array_bounds(height, width, chip_transform)
+        m_left, m_bottom, m_right, m_top = rasterio.warp.transform_bounds(chip_crs, WEB_MERCATOR_CRS, left, bottom, right, top, densify_pts=21)
+
+        zoom = self.max_zoom
+        span = self._tile_span(zoom)
+        last_index = 2 ** zoom - 1
+        tx_min = min(max(math.floor((m_left + WEB_MERCATOR_HALF_EXTENT) / span), 0), last_index)
+        tx_max = min(max(math.ceil((m_right + WEB_MERCATOR_HALF_EXTENT) / span) - 1, tx_min), last_index)
+        ty_min = min(max(math.floor((WEB_MERCATOR_HALF_EXTENT - m_top) / span), 0), last_index)
+        ty_max = min(max(math.ceil((WEB_MERCATOR_HALF_EXTENT - m_bottom) / span) - 1, ty_min), last_index)
+
+        pixel_size = span / self.tile_size
+        dst_transform = rasterio.transform.Affine(pixel_size, 0.0, -WEB_MERCATOR_HALF_EXTENT + tx_min * span,
+                               0.0, -pixel_size, WEB_MERCATOR_HALF_EXTENT - ty_min * span)
+        rgba = np.zeros((4, (ty_max - ty_min + 1) * self.tile_size, (tx_max - tx_min + 1) * self.tile_size), dtype=np.uint8)
+
+        # Alpha is opaque wherever the chip has data; all-zero pixels are boundless-read fill
+        source = np.empty((4, height, width), dtype=np.uint8)
+        source[:3] = np.moveaxis(chip_array, -1, 0)
+        source[3] = np.where(chip_array.any(axis=-1), 255, 0)
+
+        rasterio.warp.reproject(
+            source=source,
+            destination=rgba,
+            src_transform=chip_transform,
+            src_crs=chip_crs,
+            dst_transform=dst_transform,
+            dst_crs=WEB_MERCATOR_CRS,
+            resampling=self.resampling,
+        )
+        return rgba, tx_min, ty_min
+
+    @staticmethod
+    def _pad_to_even_tiles(rgba: np.ndarray, tx_min: int, ty_min: int, tile_size: int) -> Tuple[np.ndarray, int, int]:
+        """Pads the canvas with empty tiles so it starts on an even tile and spans an even count (needed for 2x2 parents)."""
+        pad_left = (tx_min % 2) * tile_size
+        pad_top = (ty_min % 2) * tile_size
+        cols = (rgba.shape[2] + pad_left) // tile_size
+        rows = (rgba.shape[1] + pad_top) // tile_size
+        pad_right = (cols % 2) * tile_size
+        pad_bottom = (rows % 2) * tile_size
+        if pad_left or pad_top or pad_right or pad_bottom:
+            rgba = np.pad(rgba, ((0, 0), (pad_top, pad_bottom), (pad_left, pad_right)))
+        return rgba, tx_min - tx_min % 2, ty_min - ty_min % 2
+
+    @staticmethod
+    def _downsample(rgba: np.ndarray) -> np.ndarray:
+        """
+        Halves a (4, H, W) RGBA canvas by alpha-weighted 2x2 averaging.
+
+        Weighting by alpha keeps transparent (no-data) pixels from darkening the edges.
+        """
+        _, height, width = rgba.shape
+        blocks = rgba.reshape(4, height // 2, 2, width // 2, 2).astype(np.uint32)
+        alpha = blocks[3]
+        alpha_sum = alpha.sum(axis=(1, 3))
+        rgb_sum = (blocks[:3] * alpha[np.newaxis]).sum(axis=(2, 4))
+
+        out = np.zeros((4, height // 2, width // 2), dtype=np.uint8)
+        covered = alpha_sum > 0
+        out[:3, covered] = ((rgb_sum[:, covered] + alpha_sum[covered] // 2) // alpha_sum[covered]).astype(np.uint8)
+        out[3] = ((alpha_sum + 2) // 4).astype(np.uint8)
+        return out
+
+    def _write_level(self, tile_dir: pathlib.Path, zoom: int, rgba: np.ndarray, tx_min: int, ty_min: int) -> int:
+        """Slices one zoom level into tiles and writes every tile that has any coverage."""
+        ts = self.tile_size
+        written = 0
+        for row in range(rgba.shape[1] // ts):
+            for col in range(rgba.shape[2] // ts):
+                tile = rgba[:, row * ts:(row + 1) * ts, col * ts:(col + 1) * ts]
+                alpha = tile[3]
+                if not alpha.any():
+                    continue # Fully transparent, nothing to serve
+
+                x = tx_min + col
+                y_tms = (2 ** zoom - 1) - (ty_min + row)
+                tile_path = tile_dir / str(zoom) / str(x) / f"{y_tms}.png"
+                tile_path.parent.mkdir(parents=True, exist_ok=True)
+
+                # Fully covered tiles don't need the alpha channel
+                pixels = tile[:3] if alpha.min() == 255 else tile
+                Image.fromarray(np.ascontiguousarray(np.moveaxis(pixels, 0, -1))).save(
+                    tile_path, format="PNG", compress_level=self.compress_level
+                )
+                written += 1
+        return written
+
+    def write(self, feature_id: str, chip_array: ImageArray, chip_transform: Affine, chip_crs: Any) -> Tuple[pathlib.Path, int]:
+        """
+        Writes the full MIN_ZOOM..MAX_ZOOM pyramid for one chip.
+
+        Args:
+            feature_id: Substation full_id, used as the tile set folder name.
+            chip_array: (H, W, 3) uint8 chip from the windowed read.
+            chip_transform: Affine transform of the chip's window in its source CRS.
+            chip_crs: The source CRS.
+
+        Returns:
+            The tile set folder and the number of tiles written.
+        """
+        tile_dir = self.tile_root / feature_id
+        rgba, tx_min, ty_min = self._render_max_zoom(chip_array, chip_transform, chip_crs)
+
+        written = 0
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            written += self._write_level(tile_dir, zoom, rgba, tx_min, ty_min)
+            if zoom > self.min_zoom:
+                rgba, tx_min, ty_min = self._pad_to_even_tiles(rgba, tx_min, ty_min, self.tile_size)
+                rgba = self._downsample(rgba)
+                tx_min, ty_min = tx_min // 2, ty_min // 2
+        return tile_dir, written
+
+
 # --- Data Loading Module ---
 class SubstationDataLoader:
     """Handles loading of substation feature data from specified sources."""
 
+    _NUMBER_TAIL = re.compile(r"[0-9+\-.eE]*\Z") # Buffer tail that could still be part of the number before it
+    _TRUNCATION_MARGIN = 16 # A decode error this close to the buffer end may just be a cut-off token ("fals", "\u00", "-Infin")
+
     @staticmethod
     def load_from_json(file_path: pathlib.Path) -> List[SubstationRecord]:
         """
@@ -140,6 +830,224 @@ class SubstationDataLoader:
             logger.error(f"An unexpected error occurred during JSON loading: {e}")
             raise # Re-raise any other unexpected error
 
+    @staticmethod
+    def feature_to_record(feature: Dict[str, Any]) -> SubstationRecord:
+        """
+        Flattens a GeoJSON Feature into the record shape the processor expects
+        (properties at the top level plus a 'geometry' key). Plain records pass through.
+        """
+        if not isinstance(feature, dict) or feature.get("type") != "Feature":
+            return feature
+        record = dict(feature.get("properties") or {})
+        if feature.get("id") is not None:
+            record.setdefault("id", feature["id"])
+        record["geometry"] = feature.get("geometry")
+        return record
+
+    @staticmethod
+    def iter_json_array(file_obj: TextIO, chunk_size: int = 1 << 20) -> Iterator[Any]:
+        """
+        Incrementally parses a top-level JSON array, or the "features" array of a GeoJSON
+        FeatureCollection, yielding one element at a time.
+
+        Only a read chunk plus the element currently being decoded are held in memory, so
+        the input file's size doesn't matter. Elements are decoded with the stdlib C scanner
+        (json.JSONDecoder.raw_decode) as soon as enough bytes have been read. The other members
+        of a FeatureCollection (type, crs, bbox, ...) are decoded and dropped.
+
+        Args:
+            file_obj: Text file positioned at the start of the JSON document.
+            chunk_size: Characters to read per refill.
+
+        Raises:
+            TypeError: If the document is neither a JSON array nor an object with a "features" array.
+            json.JSONDecodeError: If the content is not valid JSON.
+        """
+        decoder = json.JSONDecoder()
+        buffer, pos, eof = "", 0, False
+
+        def refill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def next_char() -> str:
+            # Skips whitespace (refilling as needed) and returns the next significant character, "" at EOF
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not refill():
+                    return ""
+
+        def decode_value() -> Any:
+            # Decodes the value starting at pos, reading more input while it may be cut off at the buffer edge
+            nonlocal pos
+            if not next_char():
+                raise json.JSONDecodeError("Unexpected end of JSON document", buffer, pos)
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number running up to the buffer edge may continue in the next chunk ("2.5" of "2.5e10"), read on to be sure
+                    if eof or buffer[pos] not in "-0123456789" or not SubstationDataLoader._NUMBER_TAIL.match(buffer, end):
+                        break
+                except json.JSONDecodeError as e:
+                    # Only a token cut off at the buffer edge is worth reading on for; anything earlier is a real
+                    # syntax error, and refilling until EOF would pull the rest of the file into memory
+                    cut_off = e.msg.startswith("Unterminated string") or e.pos >= len(buffer) - SubstationDataLoader._TRUNCATION_MARGIN
+                    if eof or not cut_off:
+                        raise
+                if not refill():
+                    value, end = decoder.raw_decode(buffer, pos)
+                    break
+            pos = end
+            return value
+
+        def expect(*allowed: str) -> str:
+            nonlocal pos
+            char = next_char()
+            if char not in allowed:
+                raise json.JSONDecodeError(f"Expecting {' or '.join(repr(c) for c in allowed)}", buffer, pos)
+            pos += 1
+            return char
+
+        def iter_array() -> Iterator[Any]:
+            # pos is on the opening "["
+            nonlocal pos
+            pos += 1
+            if next_char() == "]":
+                pos += 1
+                return
+            while True:
+                yield decode_value()
+                if expect(",", "]") == "]":
+                    return
+
+        first = next_char()
+        if first == "[":
+            yield from iter_array()
+            return
+        if first != "{":
+            raise TypeError("Loaded JSON data is not a list or a GeoJSON FeatureCollection.")
+
+        # FeatureCollection: walk the members, streaming "features" and skipping the rest
+        pos += 1
+        found_features = False
+        if next_char() == "}":
+            pos += 1
+        else:
+            while True:
+                if next_char() != '"':
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes", buffer, pos)
+                key = decode_value()
+                expect(":")
+                if key == "features" and next_char() == "[":
+                    found_features = True
+                    yield from iter_array()
+                else:
+                    decode_value()
+                if expect(",", "}") == "}":
+                    break
+        if not found_features:
+            raise TypeError("Loaded JSON object has no \"features\" array (expected a GeoJSON FeatureCollection).")
+
+    @staticmethod
+    def _stream_json(file_path: pathlib.Path, chunk_size: int) -> Iterator[SubstationRecord]:
+        with file_path.open('r', encoding='utf-8') as f:
+            count = 0
+            for feature in SubstationDataLoader.iter_json_array(f, chunk_size):
+                count += 1
+                yield SubstationDataLoader.feature_to_record(feature)
+        logger.info(f"Finished streaming {count} records from {file_path}")
+
+    @staticmethod
+    def _stream_ndjson(file_path: pathlib.Path) -> Iterator[SubstationRecord]:
+        """Newline-delimited records or GeoJSON Features (RFC 8142 record separators are tolerated)."""
+        with file_path.open('r', encoding='utf-8') as f:
+            count = 0
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip().lstrip("\x1e")
+                if not line:
+                    continue
+                try:
+                    feature = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Skipping unparseable line {line_number} in {file_path}: {e}")
+                    continue
+                count += 1
+                yield SubstationDataLoader.feature_to_record(feature)
+        logger.info(f"Finished streaming {count} records from {file_path}")
+
+    @staticmethod
+    def _stream_vector(file_path: pathlib.Path, layer: Optional[str], target_crs: str) -> Iterator[SubstationRecord]:
+        """GeoPackage / FlatGeobuf features via fiona, reprojected to the target geographic CRS if needed."""
+        try:
+            import fiona
+        except ImportError as e:
+            raise ImportError("Reading GeoPackage/FlatGeobuf input requires fiona (pip install fiona).") from e
+
+        with fiona.open(file_path, layer=layer) as collection:
+            source_crs = collection.crs.to_string() if hasattr(collection.crs, "to_string") else collection.crs_wkt
+            needs_reprojection = bool(source_crs) and pyproj.CRS.from_user_input(source_crs) != pyproj.CRS.from_user_input(target_crs)
+            transformer = get_transformer(source_crs, target_crs) if needs_reprojection else None
+            logger.info(f"Streaming features from {file_path} (layer={layer or 'default'}, CRS={source_crs or 'unknown'})")
+
+            count = 0
+            for feature in collection:
+                feature_dict = fiona.model.to_dict(feature) if hasattr(fiona, "model") and hasattr(fiona.model, "to_dict") else feature
+                record = SubstationDataLoader.feature_to_record(feature_dict)
+                if transformer is not None and record.get("geometry"):
+                    record["geometry"] = shapely.ops.transform(transformer.transform, shapely.geometry.shape(record["geometry"])).__geo_interface__
+                count += 1
+                yield record
+        logger.info(f"Finished streaming {count} records from {file_path}")
+
+    @staticmethod
+    def open_stream(input_config: Dict[str, Any], target_crs: str) -> Iterator[SubstationRecord]:
+        """
+        Returns a lazy iterator over the input records, chosen by SOURCE_TYPE.
+
+        The file is checked up front so a missing input fails before any work starts; the
+        records themselves are only parsed as the pipeline pulls them.
+
+        Args:
+            input_config: The CONFIG["INPUT_DATA"] block.
+            target_crs: Geographic CRS records should be in (vector sources are reprojected to it).
+
+        Raises:
+            FileNotFoundError: If the input file does not exist.
+            ValueError: If SOURCE_TYPE is not supported.
+        """
+        source_type = input_config["SOURCE_TYPE"]
+        if source_type == "json":
+            file_path = input_config["JSON_FILE_PATH"]
+        elif source_type in ("ndjson", "geojsonseq"):
+            file_path = input_config["NDJSON_FILE_PATH"]
+        elif source_type in ("gpkg", "fgb"):
+            file_path = input_config["VECTOR_FILE_PATH"]
+        else:
+            logger.error(f"Unsupported input data source type: {source_type}")
+            raise ValueError(f"Unsupported input data source type: {source_type}")
+
+        logger.info(f"Streaming substation data ({source_type}) from: {file_path}")
+        if not file_path.is_file():
+            logger.error(f"Input data file not found: {file_path}")
+            raise FileNotFoundError(f"Required input file missing: {file_path}")
+
+        if source_type == "json":
+            return SubstationDataLoader._stream_json(file_path, input_config["READ_CHUNK_BYTES"])
+        if source_type in ("ndjson", "geojsonseq"):
+            return SubstationDataLoader._stream_ndjson(file_path)
+        return SubstationDataLoader._stream_vector(file_path, input_config["VECTOR_LAYER"], target_crs)
+
+
 # --- Core Processing Class ---
 class SubstationImageProcessor:
     """
@@ -147,7 +1055,10 @@ class SubstationImageProcessor:
     finding corresponding NAIP imagery, cropping it, and saving the output.
     """
 
-    def __init__(self, record_index: int, substation_data: SubstationRecord, config: Dict[str, Any]):
+    def __init__(self, record_index: int, substation_data: SubstationRecord, config: Dict[str, Any],
+                 encode_executor: Optional[Executor] = None, manifest: Optional["RunManifest"] = None,
+                 output_writer: Optional["AsyncOutputWriter"] = None, timings: Optional[StageTimings] = None,
+                 raster_reader: Optional[RasterReader] = None):
         """
         Initializes the processor for a single substation.
 
@@ -155,10 +1066,22 @@ class SubstationImageProcessor:
             record_index: The 0-based index of the record being processed (for logging).
             substation_data: The dictionary containing data for one substation.
             config: The global configuration dictionary.
+            encode_executor: Optional executor (normally a process pool) used for the image encode.
+                If None, encoding runs on the calling thread.
+            manifest: Optional run manifest; when given, features it marks as done and unchanged are skipped.
+            output_writer: Optional background writer; when given, the encode + write of each chip is
+                queued there instead of running on the thread that did the read.
+            timings: Shared stage timing collector for the run report (a private one is used if None).
+            raster_reader: Shared managed reader for the source COGs (built from CONFIG["RASTER_IO"] if None).
         """
         self.record_index: int = record_index
         self.data: SubstationRecord = substation_data
         self.config: Dict[str, Any] = config
+        self.encode_executor: Optional[Executor] = encode_executor
+        self.manifest: Optional[RunManifest] = manifest
+        self.output_writer: Optional[AsyncOutputWriter] = output_writer
+        self.timings: StageTimings = timings if timings is not None else StageTimings()
+        self.raster_reader: RasterReader = raster_reader if raster_reader is not None else RasterReader(config["RASTER_IO"])
         self.logger = logging.getLogger(f"{__name__}.SubstationProcessor") # Specific logger instance
 
         # Initialize state variables that will be populated during processing
@@ -169,6 +1092,24 @@ class SubstationImageProcessor:
         self.selected_stac_asset: Optional[StacAsset] = None   # The chosen NAIP STAC asset
         self.source_gsd: Optional[float] = None                # Ground Sample Distance of the asset
         self.processed_image_array: Optional[ImageArray] = None # The cropped image data as NumPy array
+        self.stac_search_error: bool = False                   # Set when the search itself failed (vs. simply no coverage)
+        self.geometry_hash: Optional[str] = None               # Hash of the input geometry + buffer, for the manifest
+        self.selected_stac_item_id: Optional[str] = None       # Id of the STAC item the asset came from
+        self.selected_stac_item_datetime: Optional[str] = None # ISO acquisition datetime of that item
+        self.output_path: Optional[pathlib.Path] = None        # Where the chip (or its tile set) was written
+        self.chip_transform: Optional[Affine] = None           # Affine transform of the read window
+        self.chip_crs: Optional[Any] = None                    # CRS of the source raster the chip came from
+        self.skipped_unchanged: bool = False                   # Manifest says this feature is already up to date
+        self.write_pending: bool = False                       # Chip was queued on the async writer, which reports the outcome
+        self.temporal_items: List[StacItem] = []               # Temporal mode: one item per acquisition year, newest first
+        self.temporal_mosaic_items: Dict[str, List[StacItem]] = {} # Older vintage item id -> same-year items covering the rest of its chip
+        self.time_stack: Optional[List[Tuple[int, str, Optional[str], ImageArray]]] = None # (year, item id, datetime, chip) per vintage
+        self.stack_path: Optional[pathlib.Path] = None         # Where the time stack was written
+        self.chip_mask: Optional[np.ndarray] = None            # Mask mode: (H, W) uint8 footprint/buffer mask on the chip grid
+        self.mask_path: Optional[pathlib.Path] = None          # Where the companion mask was written
+        self.chip_size: Optional[Tuple[int, int]] = None       # (height, width) of the chip, kept after the pixels are dropped
+        self.shared_read: Optional[Tuple[Window, np.ndarray]] = None # Merged reads: (union window, (bands, H, W) pixels) to slice instead of reading
+        self.mosaic_items: List[StacItem] = []                 # Same-vintage items that cover the parts of the chip the selected item doesn't
 
     def _generate_feature_id(self) -> str:
         """Generates a unique and robust feature identifier for logging and filenames."""
@@ -203,7 +1144,7 @@ class SubstationImageProcessor:
         try:
             # 1. Load geometry from GeoJSON-like dictionary into Shapely object
             raw_geom_data = self.data['geometry']
-            self.initial_geometry_ll = shape(raw_geom_data)
+            self.initial_geometry_ll = shapely.geometry.shape(raw_geom_data)
 
             # 2. Validate the loaded geometry
             if not self.initial_geometry_ll or self.initial_geometry_ll.is_empty:
@@ -218,16 +1159,16 @@ class SubstationImageProcessor:
             rep_point = self.initial_geometry_ll.representative_point()
             self.target_utm_crs = calculate_utm_crs(rep_point.y, rep_point.x) # lat, lon
 
-            # 4. Define coordinate transformation operations
+            # 4. Define coordinate transformation operations (cached, one pair per UTM zone)
             geo_crs = self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"]
-            transformer_ll_to_utm = pyproj.Transformer.from_crs(geo_crs, self.target_utm_crs, always_xy=True)
-            transformer_utm_to_ll = pyproj.Transformer.from_crs(self.target_utm_crs, geo_crs, always_xy=True)
+            transformer_ll_to_utm = get_transformer(geo_crs, self.target_utm_crs)
+            transformer_utm_to_ll = get_transformer(self.target_utm_crs, geo_crs)
 
             # 5. Project to UTM, buffer in meters, project back to Lat/Lon
-            geom_utm = shapely_transform(transformer_ll_to_utm.transform, self.initial_geometry_ll)
+            geom_utm = shapely.ops.transform(transformer_ll_to_utm.transform, self.initial_geometry_ll)
             buffer_distance = self.config["GEOSPATIAL"]["BUFFER_METERS"]
             geom_buf_utm = geom_utm.buffer(buffer_distance)
-            self.buffered_geometry_ll = shapely_transform(transformer_utm_to_ll.transform, geom_buf_utm)
+            self.buffered_geometry_ll = shapely.ops.transform(transformer_utm_to_ll.transform, geom_buf_utm)
 
             self.logger.debug(f"{self.feature_id}: Geometry prepared successfully (Buffered in UTM Zone {self.target_utm_crs.utm_zone}).")
             return True
@@ -262,106 +1203,207 @@ class SubstationImageProcessor:
 
         try:
             search_geom_geojson = self.buffered_geometry_ll.__geo_interface__
-            search = stac_client.search(
-                collections=[self.config["STAC"]["COLLECTION"]],
-                intersects=search_geom_geojson,
-                limit=self.config["STAC"]["SEARCH_LIMIT"]
-            )
-            # Get all items - note: search.items() returns a generator
-            items = list(search.items())
-
-            if not items:
-                self.logger.warning(f"{self.feature_id}: No NAIP coverage found in STAC search.")
-                return False
-
-            # Find the item with the latest datetime (handle potential None datetimes)
-            latest_item = max(items, key=lambda item: item.datetime or datetime.datetime.min)
-            self.logger.debug(f"{self.feature_id}: Found {len(items)} items. Latest is from {latest_item.datetime}.")
-
-            # Get the desired asset (e.g., the main 'image' asset)
-            asset_key = self.config["STAC"]["ASSET_KEY"]
-            self.selected_stac_asset = latest_item.assets.get(asset_key)
-
-            if not self.selected_stac_asset:
-                self.logger.warning(f"{self.feature_id}: Latest item found, but missing required asset key '{asset_key}'.")
-                return False
-
-            # Extract Ground Sample Distance (resolution) if available
-            self.source_gsd = latest_item.properties.get('gsd')
-            gsd_str = f"{self.source_gsd:.2f}m" if isinstance(self.source_gsd, (int, float)) else "unknown"
-            self.logger.debug(f"{self.feature_id}: Selected asset '{asset_key}' (GSD: {gsd_str}) from URL: {self.selected_stac_asset.href}")
-            return True
+            with self.timings.measure("stac_search"):
+                search = stac_client.search(
+                    collections=[self.config["STAC"]["COLLECTION"]],
+                    intersects=search_geom_geojson,
+                    limit=self.config["STAC"]["SEARCH_LIMIT"]
+                )
+                # Get all items - note: search.items() returns a generator
+                items = list(search.items())
+            return self.select_imagery(items)
 
         except Exception as e:
+            self.stac_search_error = True
             self.logger.error(f"{self.feature_id}: Error during STAC search: {e}", exc_info=True)
             return False
 
-    def _extract_raster_chip(self) -> bool:
+    def select_imagery(self, items: List[Any]) -> bool:
         """
-        Opens the selected raster asset, reprojects the buffered geometry to the raster's CRS,
-        calculates the window, reads the data, and performs necessary array manipulations.
+        Picks the latest item out of the STAC items intersecting this feature and selects its asset.
+
+        Shared by the per-feature search above and by BatchStacSearcher, which resolves the
+        intersecting items locally instead of issuing a search per feature.
+
+        Args:
+            items: pystac Items whose footprints intersect the buffered geometry.
 
         Populates:
-            - self.processed_image_array
+            - self.selected_stac_asset
+            - self.source_gsd
 
         Returns:
-            True if raster processing was successful, False otherwise.
+            True if a suitable asset was found, False otherwise.
+        """
+        if not items:
+            self.logger.warning(f"{self.feature_id}: No NAIP coverage found in STAC search.")
+            return False
+
+        # Find the item with the latest datetime (handle potential None datetimes)
+        latest_item = max(items, key=lambda item: item.datetime or datetime.datetime.min)
+        self.logger.debug(f"{self.feature_id}: Found {len(items)} items. Latest is from {latest_item.datetime}.")
+
+        # Get the desired asset (e.g., the main 'image' asset)
+        asset_key = self.config["STAC"]["ASSET_KEY"]
+        self.selected_stac_asset = latest_item.assets.get(asset_key)
+
+        if not self.selected_stac_asset:
+            self.logger.warning(f"{self.feature_id}: Latest item found, but missing required asset key '{asset_key}'.")
+            return False
+
+        self.selected_stac_item_id = latest_item.id
+        self.selected_stac_item_datetime = latest_item.datetime.isoformat() if latest_item.datetime else None
+        if self.config["TEMPORAL"]["ENABLED"]:
+            self.temporal_items = self._select_vintages(items, latest_item)
+        if self.config["MOSAIC"]["ENABLED"]:
+            self.mosaic_items = self._select_mosaic_items(items, latest_item)
+            for vintage in self.temporal_items[1:]:
+                vintage_mosaic_items = self._select_mosaic_items(items, vintage)
+                if vintage_mosaic_items:
+                    self.temporal_mosaic_items[vintage.id] = vintage_mosaic_items
+
+        # Extract Ground Sample Distance (resolution) if available
+        self.source_gsd = latest_item.properties.get('gsd')
+        gsd_str = f"{self.source_gsd:.2f}m" if isinstance(self.source_gsd, (int, float)) else "unknown"
+        self.logger.debug(f"{self.feature_id}: Selected asset '{asset_key}' (GSD: {gsd_str}) from URL: {self.selected_stac_asset.href}")
+        return True
+
+    def _select_vintages(self, items: List[Any], latest_item: Any) -> List[Any]:
+        """
+        Picks one item per acquisition year for the time stack, newest year first.
+
+        The latest item (the one the regular chip comes from) always represents its year, so
+        the stack's first layer is exactly the flat chip. Within older years the latest
+        acquisition wins, same rule as for the flat chip.
+
+        Args:
+            items: Every STAC item intersecting the feature.
+            latest_item: The item select_imagery() picked.
+
+        Returns:
+            Up to TEMPORAL.MAX_VINTAGES items, newest year first.
+        """
+        asset_key = self.config["STAC"]["ASSET_KEY"]
+        by_year: Dict[int, Any] = {latest_item.datetime.year if latest_item.datetime else 0: latest_item}
+        for item in sorted(items, key=lambda i: i.datetime or datetime.datetime.min, reverse=True):
+            if item.datetime is None or asset_key not in item.assets:
+                continue
+            by_year.setdefault(item.datetime.year, item)
+
+        vintages = [by_year[year] for year in sorted(by_year, reverse=True)]
+        max_vintages = self.config["TEMPORAL"]["MAX_VINTAGES"]
+        if max_vintages:
+            vintages = vintages[:int(max_vintages)]
+        self.logger.debug(f"{self.feature_id}: Time stack vintages: {[v.datetime.year for v in vintages if v.datetime]}")
+        return vintages
+
+    def _select_mosaic_items(self, items: List[Any], anchor_item: Any) -> List[Any]:
+        """
+        Finds the other items of the anchor item's acquisition year that cover part of the
+        buffered geometry, for chips that straddle a tile edge.
+
+        Nothing is returned when the anchor item's footprint already contains the whole buffered
+        geometry, which is the case for almost every feature. Newer acquisitions come first, and
+        they take priority when the chip is assembled.
+
+        Args:
+            items: Every STAC item intersecting the feature.
+            anchor_item: The item the chip (or time stack layer) is read from: the one
+                select_imagery() picked, or an older vintage.
+
+        Returns:
+            Up to MOSAIC.MAX_ITEMS items, newest first.
+        """
+        if not anchor_item.geometry or anchor_item.datetime is None:
+            return []
+        if shapely.geometry.shape(anchor_item.geometry).contains(self.buffered_geometry_ll):
+            return []
+
+        asset_key = self.config["STAC"]["ASSET_KEY"]
+        vintage_year = anchor_item.datetime.year
+        mosaic_items = []
+        for item in sorted(items, key=lambda i: i.datetime or datetime.datetime.min, reverse=True):
+            if item.id == anchor_item.id or item.datetime is None or item.datetime.year != vintage_year:
+                continue
+            if asset_key not in item.assets or not item.geometry:
+                continue
+            if shapely.geometry.shape(item.geometry).intersects(self.buffered_geometry_ll):
+                mosaic_items.append(item)
+        mosaic_items = mosaic_items[:int(self.config["MOSAIC"]["MAX_ITEMS"])]
+        if mosaic_items:
+            self.logger.debug(f"{self.feature_id}: Chip straddles {anchor_item.id}; mosaicking with {[item.id for item in mosaic_items]}")
+        return mosaic_items
+
+    def compute_read_window(self, src_dataset: rasterio.io.DatasetReader) -> Optional[Window]:
+        """
+        Reprojects the buffered geometry into the dataset's CRS and returns the pixel window covering it.
+
+        Uses the shared per-CRS transformer cache, so features read from the same tile (or any
+        tile in the same CRS) don't rebuild a pyproj.Transformer each time.
+
+        Args:
+            src_dataset: The open source raster.
+
+        Returns:
+            The read window, or None if the geometry doesn't overlap the raster.
+        """
+        source_crs = src_dataset.crs
+        self.logger.debug(f"{self.feature_id}: Source raster CRS: {source_crs}")
+
+        # Transform the *buffered geographic geometry* to the source raster's CRS
+        transformer_ll_to_src = get_transformer(self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"], source_crs)
+        geometry_in_source_crs = shapely.ops.transform(transformer_ll_to_src.transform, self.buffered_geometry_ll)
+
+        # Calculate the pixel window corresponding to the geometry in the source CRS
+        # (a mosaic chip keeps the part hanging off this raster, the other tiles fill it in)
+        try:
+            read_window = features.geometry_window(src_dataset, [geometry_in_source_crs.__geo_interface__],
+                                                   boundless=bool(self.mosaic_items))
+            self.logger.debug(f"{self.feature_id}: Calculated read window: {read_window}")
+            return read_window
+        except ValueError as e:
+            # This can happen if the geometry is completely outside the raster bounds
+            self.logger.warning(f"{self.feature_id}: Error calculating window (geometry likely outside raster bounds {src_dataset.bounds}?): {e}, skipping.")
+            return None
+
+    def _extract_raster_chip(self, src_dataset: Optional[rasterio.io.DatasetReader] = None,
+                             read_window: Optional[Window] = None) -> bool:
+        """
+        Opens the selected raster asset, reprojects the buffered geometry to the raster's CRS,
+        calculates the window, reads the data, and performs necessary array manipulations.
+
+        Args:
+            src_dataset: Already-open dataset for the selected asset (the grouped reader opens
+                each asset once and passes it in). If None, the asset is opened here.
+            read_window: Precomputed window in src_dataset; computed here if None.
+
+        Populates:
+            - self.processed_image_array
+
+        Returns:
+            True if raster processing was successful, False otherwise.
         """
         if not self.selected_stac_asset or not self.buffered_geometry_ll:
              self.logger.error(f"{self.feature_id}: Cannot process raster without selected asset or buffered geometry.")
              return False
 
+        asset_href = self.selected_stac_asset.href
         try:
-            asset_href = self.selected_stac_asset.href
-            self.logger.debug(f"{self.feature_id}: Opening raster asset: {asset_href}")
-
-            with rasterio.open(asset_href) as src_dataset:
-                source_crs = src_dataset.crs
-                self.logger.debug(f"{self.feature_id}: Source raster CRS: {source_crs}")
-
-                # Transform the *buffered geographic geometry* to the source raster's CRS
-                transformer_ll_to_src = pyproj.Transformer.from_crs(
-                    self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"],
-                    source_crs,
-                    always_xy=True
-                )
-                geometry_in_source_crs = shapely_transform(transformer_ll_to_src.transform, self.buffered_geometry_ll)
+            if src_dataset is None:
+                self.logger.debug(f"{self.feature_id}: Opening raster asset: {asset_href}")
+                with self.raster_reader.env():
+                    with self.timings.measure("open") as metrics:
+                        opened_dataset = self.raster_reader.open(asset_href, metrics)
+                    with opened_dataset:
+                        return self._read_chip(opened_dataset, read_window)
+            with self.raster_reader.env():
+                return self._read_chip(src_dataset, read_window)
 
-                # Calculate the pixel window corresponding to the geometry in the source CRS
-                try:
-                    read_window = features.geometry_window(src_dataset, [geometry_in_source_crs.__geo_interface__])
-                    self.logger.debug(f"{self.feature_id}: Calculated read window: {read_window}")
-                except ValueError as e:
-                    # This can happen if the geometry is completely outside the raster bounds
-                    self.logger.warning(f"{self.feature_id}: Error calculating window (geometry likely outside raster bounds {src_dataset.bounds}?): {e}, skipping.")
-                    return False
-
-                # Read the data for the RGB bands (1, 2, 3) within the calculated window
-                # Using boundless=True is generally safe when reading directly from source in this case the actual raw microsoft computer but I had issues as I described with tis variable so if you have runtime stuff that's pointing to this set to false!
-                # and Also helps avoid errors if the window slightly crosses raster edges.
-                raw_array = src_dataset.read(
-                    indexes=(1, 2, 3), # Using standard RGB order in NAIP first bands
-                    window=read_window,
-                    out_dtype="uint8", # Standard image data type according to docs
-                    resampling=self.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"],
-                    boundless=self.config["GEOSPATIAL"]["BOUNDLESS_READ"]
-                ) # Shape: (Bands, Height, Width)
-
-                # Validate the read array
-                if raw_array.size == 0 or raw_array.shape[1] == 0 or raw_array.shape[2] == 0:
-                     self.logger.warning(f"{self.feature_id}: Read an empty array from raster (window={read_window}), skipping.")
-                     return False
-
-                # Transpose the array from (Bands, Height, Width) to (Height, Width, Bands) for PIL/display
-                self.processed_image_array = np.transpose(raw_array, (1, 2, 0))
-                self.logger.debug(f"{self.feature_id}: Successfully read and transposed raster data. Shape: {self.processed_image_array.shape}")
-                return True
-
-        except WindowError as e:
+        except rasterio.errors.WindowError as e:
             # This specific error might occur if boundless=False and window is out of bounds. So if you see this then the issue I had been descirbing is inverse
             self.logger.error(f"{self.feature_id}: WindowError during raster read (Window likely out of bounds): {e}", exc_info=True)
             return False
-        except RasterioIOError as e:
+        except rasterio.errors.RasterioIOError as e:
             # General Rasterio I/O errors (e.g., network issues, file corruption)
             self.logger.error(f"{self.feature_id}: Rasterio IO Error reading {asset_href}: {e}", exc_info=True)
             return False
@@ -370,9 +1412,387 @@ class SubstationImageProcessor:
             self.logger.error(f"{self.feature_id}: Unexpected error processing raster {asset_href}: {e}", exc_info=True)
             return False
 
+    def _read_chip(self, src_dataset: rasterio.io.DatasetReader, read_window: Optional[Window]) -> bool:
+        """
+        Reads the chip out of an open dataset into self.processed_image_array (the buffered
+        window, or a fixed-size grid in CHIP.FIXED_SIZE mode), fills any part that falls off
+        the tile from the mosaic items, then rasterizes the geometry mask if enabled.
+        """
+        if read_window is None:
+            read_window = self.compute_read_window(src_dataset)
+            if read_window is None:
+                return False
+        if self.config["CHIP"]["FIXED_SIZE"]:
+            read_ok = self._read_fixed_chip(src_dataset)
+        else:
+            read_ok = self._read_window_chip(src_dataset, read_window)
+        if not read_ok:
+            return False
+        if self.mosaic_items:
+            self._fill_from_mosaic_items(src_dataset)
+        self.chip_size = tuple(self.processed_image_array.shape[:2])
+        if self.config["MASK"]["ENABLED"]:
+            self._rasterize_mask()
+        return True
+
+    def _read_window_chip(self, src_dataset: rasterio.io.DatasetReader, read_window: Window) -> bool:
+        """
+        Reads the RGB pixels of read_window at the source's native grid, or slices them out of
+        shared_read when the grouped reader already read a union window covering this one.
+        """
+        if self.shared_read is not None:
+            union_window, union_array = self.shared_read
+            self.shared_read = None # Don't pin the union array any longer than the chip view does
+            row_start = int(read_window.row_off - union_window.row_off)
+            col_start = int(read_window.col_off - union_window.col_off)
+            raw_array = union_array[:, row_start:row_start + int(read_window.height), col_start:col_start + int(read_window.width)]
+            self.processed_image_array = np.transpose(raw_array, (1, 2, 0)) # Still a view, no pixels copied
+            self.chip_transform = src_dataset.window_transform(read_window)
+            self.chip_crs = src_dataset.crs
+            self.logger.debug(f"{self.feature_id}: Sliced chip out of a merged read. Shape: {self.processed_image_array.shape}")
+            return True
+
+        # Read the data for the RGB bands (1, 2, 3) within the calculated window
+        # Using boundless=True is generally safe when reading directly from source in this case the actual raw microsoft computer but I had issues as I described with tis variable so if you have runtime stuff that's pointing to this set to false!
+        # and Also helps avoid errors if the window slightly crosses raster edges.
+        with self.timings.measure("read") as metrics:
+            raw_array = self.raster_reader.retry(lambda: src_dataset.read(
+                indexes=(1, 2, 3), # Using standard RGB order in NAIP first bands
+                window=read_window,
+                out_dtype="uint8", # Standard image data type according to docs
+                resampling=resampling_method(self.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"]),
+                boundless=self.config["GEOSPATIAL"]["BOUNDLESS_READ"] or bool(self.mosaic_items)
+            ), f"{self.feature_id} window read", metrics) # Shape: (Bands, Height, Width)
+            metrics["bytes"] = raw_array.nbytes # Decoded bytes; what actually crossed the wire depends on the COG's compression
+            metrics["pixels"] = int(read_window.width * read_window.height)
+
+        # Validate the read array
+        if raw_array.size == 0 or raw_array.shape[1] == 0 or raw_array.shape[2] == 0:
+             self.logger.warning(f"{self.feature_id}: Read an empty array from raster (window={read_window}), skipping.")
+             return False
+
+        # Transpose the array from (Bands, Height, Width) to (Height, Width, Bands) for PIL/display
+        self.processed_image_array = np.transpose(raw_array, (1, 2, 0))
+        self.chip_transform = src_dataset.window_transform(read_window)
+        self.chip_crs = src_dataset.crs
+        self.logger.debug(f"{self.feature_id}: Successfully read and transposed raster data. Shape: {self.processed_image_array.shape}")
+        return True
+
+    def _rasterize_mask(self) -> None:
+        """
+        Burns the buffered and original geometries onto the chip's own grid (chip_transform,
+        chip_crs, chip shape) so the mask lines up pixel for pixel with whatever was just read,
+        window or fixed-size. The footprint is burned last so it wins over the buffer ring.
+
+        Populates:
+            - self.chip_mask
+        """
+        mask_config = self.config["MASK"]
+        height, width = self.processed_image_array.shape[:2]
+        to_chip_crs = get_transformer(self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"], self.chip_crs)
+        with self.timings.measure("mask") as metrics:
+            shapes = [
+                (shapely.ops.transform(to_chip_crs.transform, self.buffered_geometry_ll), int(mask_config["BUFFER_VALUE"])),
+                (shapely.ops.transform(to_chip_crs.transform, self.initial_geometry_ll), int(mask_config["FOOTPRINT_VALUE"])),
+            ]
+            self.chip_mask = features.rasterize(shapes, out_shape=(height, width), transform=self.chip_transform, fill=0,
+                                                all_touched=bool(mask_config["ALL_TOUCHED"]), dtype="uint8")
+            metrics["pixels"] = height * width
+
+    def fixed_chip_grid(self, src_dataset: rasterio.io.DatasetReader) -> Tuple[Any, Affine]:
+        """
+        Works out the output grid for a fixed-size chip: CHIP.SIZE_PX square at
+        CHIP.TARGET_GSD_METERS, centred on the substation's centroid.
+
+        The grid lives in the source CRS (UTM for NAIP) so there's no reprojection, only a
+        resample when the GSDs differ. If the target GSD matches the source's, the origin is
+        snapped to the source pixel grid so the read is a straight copy with no resampling blur.
+        A geographic source falls back to the feature's UTM zone, since the GSD is in meters.
+
+        Returns:
+            (chip CRS, chip affine transform)
+        """
+        chip_config = self.config["CHIP"]
+        size = int(chip_config["SIZE_PX"])
+        gsd = float(chip_config["TARGET_GSD_METERS"])
+        chip_crs = src_dataset.crs if not src_dataset.crs.is_geographic else rasterio.crs.CRS.from_wkt(self.target_utm_crs.to_wkt())
+
+        centroid = self.initial_geometry_ll.centroid
+        to_chip_crs = get_transformer(self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"], chip_crs)
+        center_x, center_y = to_chip_crs.transform(centroid.x, centroid.y)
+        left, top = center_x - size * gsd / 2.0, center_y + size * gsd / 2.0
+
+        src_transform = src_dataset.transform
+        if chip_crs == src_dataset.crs and np.isclose(src_transform.a, gsd) and np.isclose(-src_transform.e, gsd):
+            left = src_transform.c + round((left - src_transform.c) / gsd) * gsd
+            top = src_transform.f - round((src_transform.f - top) / gsd) * gsd
+        return chip_crs, rasterio.transform.Affine(gsd, 0.0, left, 0.0, -gsd, top)
+
+    def _read_fixed_chip(self, src_dataset: rasterio.io.DatasetReader) -> bool:
+        """
+        Reads a fixed-size chip (see fixed_chip_grid) with one WarpedVRT read straight onto the
+        output grid, so memory and CPU per chip are the same whatever the substation size or
+        source GSD, and nothing is read at full resolution just to be resized afterwards.
+        """
+        size = int(self.config["CHIP"]["SIZE_PX"])
+        chip_crs, chip_transform = self.fixed_chip_grid(src_dataset)
+        with self.timings.measure("read") as metrics:
+            with rasterio.vrt.WarpedVRT(src_dataset, crs=chip_crs, transform=chip_transform, width=size, height=size,
+                           resampling=resampling_method(self.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"])) as vrt:
+                raw_array = self.raster_reader.retry(lambda: vrt.read(indexes=(1, 2, 3), out_dtype="uint8"),
+                                                     f"{self.feature_id} fixed-size chip read", metrics)
+            metrics["bytes"] = raw_array.nbytes
+            metrics["pixels"] = size * size
+
+        self.processed_image_array = np.transpose(raw_array, (1, 2, 0))
+        self.chip_transform = chip_transform
+        self.chip_crs = chip_crs
+        self.logger.debug(f"{self.feature_id}: Read fixed-size chip {size}x{size} at {chip_transform.a:.2f} m.")
+        return True
+
+    @staticmethod
+    def _grid_offset(src_transform: Affine, chip_transform: Affine) -> Optional[Tuple[int, int]]:
+        """
+        (col, row) offset of the chip grid inside the source grid, or None when the two pixel
+        grids don't line up (different resolution/rotation, or a sub-pixel shift).
+        """
+        if not np.allclose((src_transform.a, src_transform.b, src_transform.d, src_transform.e),
+                           (chip_transform.a, chip_transform.b, chip_transform.d, chip_transform.e)):
+            return None
+        col = (chip_transform.c - src_transform.c) / src_transform.a
+        row = (chip_transform.f - src_transform.f) / src_transform.e
+        if abs(col - round(col)) > 1e-6 or abs(row - round(row)) > 1e-6:
+            return None
+        return int(round(col)), int(round(row))
+
+    def _read_on_chip_grid(self, src_dataset: rasterio.io.DatasetReader,
+                           window_cache: Dict[Tuple[str, Tuple[float, ...]], Optional[Window]],
+                           metrics: Dict[str, int], purpose: str = "time stack") -> ImageArray:
+        """
+        Reads RGB from another vintage (or a neighbouring tile) onto the pixel grid of the already-extracted chip.
+
+        The geometry is never reprojected again: the chip's grid *is* the reprojected geometry
+        window, so for a source on the same grid (same CRS and pixel alignment, the usual case
+        for consecutive NAIP years in one UTM zone) the window is just an offset, computed once
+        per (CRS, transform) and reused. Anything else (other zone, 1 m vs 0.6 m GSD) goes
+        through a WarpedVRT onto the chip grid.
+        """
+        height, width = self.processed_image_array.shape[:2]
+        grid_key = (src_dataset.crs.to_string(), tuple(src_dataset.transform)[:6])
+        if grid_key not in window_cache:
+            offset = None
+            if src_dataset.crs == self.chip_crs:
+                offset = self._grid_offset(src_dataset.transform, self.chip_transform)
+            window_cache[grid_key] = rasterio.windows.Window(offset[0], offset[1], width, height) if offset is not None else None
+
+        read_window = window_cache[grid_key]
+        if read_window is not None:
+            raw_array = self.raster_reader.retry(lambda: src_dataset.read(
+                indexes=(1, 2, 3), window=read_window, out_dtype="uint8", boundless=True,
+            ), f"{self.feature_id} {purpose} read", metrics)
+        else:
+            with rasterio.vrt.WarpedVRT(src_dataset, crs=self.chip_crs, transform=self.chip_transform, width=width, height=height,
+                           resampling=resampling_method(self.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"])) as vrt:
+                raw_array = self.raster_reader.retry(lambda: vrt.read(indexes=(1, 2, 3), out_dtype="uint8"),
+                                                     f"{self.feature_id} {purpose} warp", metrics)
+        metrics["bytes"] = metrics.get("bytes", 0) + raw_array.nbytes
+        metrics["pixels"] = metrics.get("pixels", 0) + width * height
+        return np.transpose(raw_array, (1, 2, 0))
+
+    def _source_coverage(self, src_dataset: rasterio.io.DatasetReader,
+                         metrics: Optional[Dict[str, int]] = None) -> Tuple[ImageArray, bool]:
+        """
+        Works out which chip pixels hold real data from src_dataset, from the raster's extent and
+        its dataset mask (nodata / alpha) rather than from pixel values, so black shadows or water
+        inside the tile never count as holes.
+
+        Returns:
+            (valid, covers_chip): an (H, W) bool array of chip pixels with data from this source,
+            and whether the source's extent covers the whole chip (nothing to mosaic if it does).
+        """
+        height, width = self.processed_image_array.shape[:2]
+        offset = self._grid_offset(src_dataset.transform, self.chip_transform) if src_dataset.crs == self.chip_crs else None
+        if offset is not None:
+            # Aligned grids: the extent is plain window arithmetic
+            col_off, row_off = offset
+            footprint = np.zeros((height, width), dtype=bool)
+            row_start, row_stop = max(0, -row_off), min(height, src_dataset.height - row_off)
+            col_start, col_stop = max(0, -col_off), min(width, src_dataset.width - col_off)
+            if row_start < row_stop and col_start < col_stop:
+                footprint[row_start:row_stop, col_start:col_stop] = True
+        else:
+            # Other CRS or grid: burn the raster's (densified) outline onto the chip grid
+            outline = shapely.geometry.box(*src_dataset.bounds)
+            outline = shapely.segmentize(outline, max(outline.bounds[2] - outline.bounds[0], outline.bounds[3] - outline.bounds[1]) / 16)
+            outline_on_chip = rasterio.warp.transform_geom(src_dataset.crs, self.chip_crs, shapely.geometry.mapping(outline))
+            footprint = features.geometry_mask([outline_on_chip], out_shape=(height, width), transform=self.chip_transform, invert=True)
+        covers_chip = bool(footprint.all())
+
+        valid = footprint
+        flags = src_dataset.mask_flag_enums[:3]
+        if any(flag is not rasterio.enums.MaskFlags.all_valid for band_flags in flags for flag in band_flags):
+            # The source declares nodata or an alpha band: pixels inside its extent can still be empty
+            if offset is not None:
+                read_window = rasterio.windows.Window(offset[0], offset[1], width, height)
+                dataset_mask = self.raster_reader.retry(lambda: src_dataset.read_masks(1, window=read_window, boundless=True),
+                                                        f"{self.feature_id} mask read", metrics)
+            else:
+                with rasterio.vrt.WarpedVRT(src_dataset, crs=self.chip_crs, transform=self.chip_transform, width=width, height=height) as vrt:
+                    dataset_mask = self.raster_reader.retry(lambda: vrt.read_masks(1), f"{self.feature_id} mask warp", metrics)
+            valid = footprint & (dataset_mask > 0)
+        return valid, covers_chip
+
+    def _read_mosaic_source(self, asset_href: str,
+                            window_cache: Dict[Tuple[str, Tuple[float, ...]], Optional[Window]]) -> Tuple[Optional[ImageArray], Optional[ImageArray], Dict[str, int]]:
+        """Reads one mosaic item and its valid-pixel mask onto the chip grid on a worker thread; (None, None) (logged) if it fails."""
+        metrics: Dict[str, int] = {}
+        try:
+            with self.raster_reader.env(): # GDAL config is per thread, so each worker sets up its own
+                with self.raster_reader.open(asset_href, metrics) as src_dataset:
+                    layer = self._read_on_chip_grid(src_dataset, window_cache, metrics, purpose="mosaic")
+                    valid, _ = self._source_coverage(src_dataset, metrics)
+                    return layer, valid, metrics
+        except Exception as e:
+            self.logger.warning(f"{self.feature_id}: Mosaic read of {asset_href} failed, leaving that part of the chip empty: {e}")
+            return None, None, metrics
+
+    def _fill_from_mosaic_items(self, src_dataset: rasterio.io.DatasetReader) -> None:
+        """
+        Fills the part of a straddling chip that src_dataset (the selected tile) has no data for
+        from the neighbouring same-year tiles. Nothing is read when the tile covers the whole chip.
+
+        Populates:
+            - self.processed_image_array
+        """
+        valid, covers_chip = self._source_coverage(src_dataset)
+        if covers_chip:
+            return
+        self.processed_image_array = self._mosaic_chip(self.processed_image_array, valid, self.mosaic_items, {})
+
+    def _mosaic_chip(self, chip: ImageArray, valid: ImageArray, mosaic_items: List[Any],
+                     window_cache: Dict[Tuple[str, Tuple[float, ...]], Optional[Window]], label: str = "chip") -> ImageArray:
+        """
+        Composites a chip (the flat one or a time stack layer) with the same-year tiles covering the rest of it.
+
+        Every mosaic item is read onto the chip grid at the same time, one thread each (same
+        aligned-window or WarpedVRT path as the time stack). Items are then composited first
+        valid pixel wins, like rasterio.merge's "first" method: which pixels are valid comes from
+        each source's extent and dataset mask (see _source_coverage), never from the pixel values,
+        so genuinely black pixels are kept. The composite is a new array, because the chip may be
+        a view into a merged read that other features share.
+
+        Args:
+            chip: The chip as read from its own tile.
+            valid: (H, W) bool array of the chip pixels its own tile has data for.
+            mosaic_items: Same-year items from _select_mosaic_items(), newest first.
+            window_cache: Aligned read windows per source grid, shared between the reads of one feature.
+            label: What is being mosaicked, for the log line.
+
+        Returns:
+            The composited chip (chip itself when nothing was empty).
+        """
+        empty = ~valid
+        if not empty.any():
+            return chip
+
+        asset_key = self.config["STAC"]["ASSET_KEY"]
+        asset_hrefs = [item.assets[asset_key].href for item in mosaic_items]
+        with self.timings.measure("mosaic_read") as metrics:
+            if len(asset_hrefs) == 1:
+                results = [self._read_mosaic_source(asset_hrefs[0], window_cache)]
+            else:
+                with ThreadPoolExecutor(max_workers=len(asset_hrefs), thread_name_prefix="naip-mosaic") as pool:
+                    results = list(pool.map(lambda href: self._read_mosaic_source(href, window_cache), asset_hrefs))
+            for _, _, read_metrics in results:
+                for key, value in read_metrics.items():
+                    metrics[key] = metrics.get(key, 0) + value
+
+        empty_before = int(empty.sum())
+        mosaic = chip.copy()
+        for layer, layer_valid, _ in results:
+            if layer is None:
+                continue
+            fill = empty & layer_valid
+            mosaic[fill] = layer[fill]
+            empty &= ~fill
+        filled_share = 1.0 - empty.sum() / max(empty_before, 1)
+        self.logger.info(f"{self.feature_id}: Mosaicked {label} across {len(asset_hrefs) + 1} tiles "
+                         f"({empty_before} empty pixels, {filled_share:.0%} filled).")
+        return mosaic
+
+    def _extract_time_stack(self) -> None:
+        """
+        Reads every older vintage in self.temporal_items onto the chip grid, mosaicking it with
+        its own year's neighbouring tiles when the chip straddles that vintage's tile edge.
+
+        A vintage that fails to read is logged and left out; the feature still succeeds with
+        the layers that did read (the newest one is always there).
+
+        Populates:
+            - self.time_stack
+        """
+        newest = self.temporal_items[0] if self.temporal_items else None
+        year = newest.datetime.year if newest is not None and newest.datetime else 0
+        self.time_stack = [(year, self.selected_stac_item_id, self.selected_stac_item_datetime, self.processed_image_array)]
+
+        asset_key = self.config["STAC"]["ASSET_KEY"]
+        window_cache: Dict[Tuple[str, Tuple[float, ...]], Optional[Window]] = {}
+        for item in self.temporal_items[1:]:
+            asset_href = item.assets[asset_key].href
+            try:
+                with self.raster_reader.env(), self.timings.measure("stack_read") as metrics:
+                    with self.raster_reader.open(asset_href, metrics) as src_dataset:
+                        chip = self._read_on_chip_grid(src_dataset, window_cache, metrics)
+                        valid, covers_chip = self._source_coverage(src_dataset, metrics) if item.id in self.temporal_mosaic_items else (None, True)
+                if not covers_chip:
+                    chip = self._mosaic_chip(chip, valid, self.temporal_mosaic_items[item.id], window_cache,
+                                             label=f"{item.datetime.year} layer")
+                self.time_stack.append((item.datetime.year, item.id, item.datetime.isoformat(), chip))
+            except Exception as e:
+                self.logger.warning(f"{self.feature_id}: Skipping {item.datetime.year} vintage ({item.id}) in the time stack: {e}")
+
+    def _save_time_stack(self) -> bool:
+        """
+        Writes the time stack as one compressed .npz: chips (T, H, W, 3) uint8 newest first,
+        plus years, item_ids, datetimes, the chip's affine transform and its CRS as WKT
+        (and the (H, W) geometry mask when MASK is enabled; every layer shares the chip grid).
+
+        Returns:
+            True if the stack was written, False otherwise.
+        """
+        if not self.time_stack:
+            self.logger.error(f"{self.feature_id}: Cannot save time stack, no layers were extracted.")
+            return False
+        try:
+            stack_folder = self.config["TEMPORAL"]["STACK_FOLDER"]
+            stack_folder.mkdir(parents=True, exist_ok=True)
+            stack_path = stack_folder / f"{self.feature_id}.npz"
+            with self.timings.measure("stack_save") as metrics:
+                chips = np.stack([layer[3] for layer in self.time_stack])
+                extra_arrays = {"mask": self.chip_mask} if self.chip_mask is not None else {}
+                np.savez_compressed(
+                    stack_path,
+                    chips=chips,
+                    **extra_arrays,
+                    years=np.array([layer[0] for layer in self.time_stack], dtype=np.int16),
+                    item_ids=np.array([layer[1] or "" for layer in self.time_stack]),
+                    datetimes=np.array([layer[2] or "" for layer in self.time_stack]),
+                    transform=np.array(tuple(self.chip_transform)[:6]),
+                    crs=np.array(self.chip_crs.to_wkt()),
+                )
+                metrics["bytes"] = stack_path.stat().st_size
+                metrics["pixels"] = int(chips.shape[0] * chips.shape[1] * chips.shape[2])
+            self.stack_path = stack_path
+            years = ", ".join(str(layer[0]) for layer in self.time_stack)
+            self.logger.info(f"{self.feature_id}: ✅ Saved {len(self.time_stack)}-vintage time stack ({years}) to {stack_path.name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"{self.feature_id}: Failed to save time stack: {e}", exc_info=True)
+            return False
+
     def _save_output_image(self) -> bool:
         """
-        Saves the processed image array to a PNG file.
+        Encodes the processed image array with the configured IMAGE_FORMAT encoder and writes it out.
 
         Returns:
             True if saving was successful, False otherwise.
@@ -381,22 +1801,35 @@ class SubstationImageProcessor:
             self.logger.error(f"{self.feature_id}: Cannot save image, processed image array is missing.")
             return False
 
+        output_filename = self.feature_id # Placeholder so the error log below always has a name
         try:
             output_folder = self.config["OUTPUT"]["IMAGE_FOLDER"]
             output_folder.mkdir(parents=True, exist_ok=True) # Ensure folder exists
 
-            output_filename = f"{self.feature_id}.{self.config['OUTPUT']['IMAGE_FORMAT'].lower()}"
+            output_config = self.config["OUTPUT"]
+            image_format = output_config["IMAGE_FORMAT"].upper()
+            extension = IMAGE_ENCODERS[image_format][0] if image_format in IMAGE_ENCODERS else image_format.lower()
+            output_filename = f"{self.feature_id}.{extension}"
             output_path = output_folder / output_filename
 
-            # Create PIL Image object from the NumPy array
-            img = Image.fromarray(self.processed_image_array)
-
-            # Save the image
-            img.save(
-                output_path,
-                format=self.config["OUTPUT"]["IMAGE_FORMAT"],
-                optimize=self.config["OUTPUT"]["OPTIMIZE_PNG"]
-            )
+            # Encode the NumPy array (in the process pool if we have one) and write the bytes out
+            georef = None
+            if self.chip_transform is not None and self.chip_crs is not None:
+                georef = (self.chip_crs.to_wkt(), tuple(self.chip_transform)[:6])
+            image_array = self.processed_image_array
+            if self.chip_mask is not None and self.config["MASK"]["MODE"] == "alpha":
+                # Opaque inside the buffered geometry, transparent outside it
+                image_array = np.dstack([image_array, np.where(self.chip_mask > 0, 255, 0).astype(np.uint8)])
+            encode_args = (image_array, image_format, output_config, georef)
+            with self.timings.measure("save") as metrics:
+                if self.encode_executor is not None:
+                    image_bytes = self.encode_executor.submit(encode_image_bytes, *encode_args).result()
+                else:
+                    image_bytes = encode_image_bytes(*encode_args)
+                output_path.write_bytes(image_bytes)
+                metrics["bytes"] = len(image_bytes)
+                metrics["pixels"] = int(self.processed_image_array.shape[0] * self.processed_image_array.shape[1])
+            self.output_path = output_path
 
             gsd_str = f"{self.source_gsd:.2f}m" if isinstance(self.source_gsd, (int, float)) else "unknown"
             self.logger.info(f"{self.feature_id}: ✅ Successfully saved image to {output_path.name} (GSD: {gsd_str})")
@@ -406,6 +1839,162 @@ class SubstationImageProcessor:
             self.logger.error(f"{self.feature_id}: Failed to save output image {output_filename}: {e}", exc_info=True)
             return False
 
+    def _save_mask_image(self) -> bool:
+        """
+        Writes the companion mask: a georeferenced single-band COG when IMAGE_FORMAT is COG,
+        otherwise a lossless greyscale PNG with the same pixel grid as the chip.
+
+        Returns:
+            True if the mask was written, False otherwise.
+        """
+        if self.chip_mask is None:
+            self.logger.error(f"{self.feature_id}: Cannot save mask, it was not rasterized.")
+            return False
+        try:
+            mask_folder = self.config["MASK"]["FOLDER"]
+            mask_folder.mkdir(parents=True, exist_ok=True)
+            mask_format = "COG" if self.config["OUTPUT"]["IMAGE_FORMAT"].upper() == "COG" else "PNG"
+            mask_path = mask_folder / f"{self.feature_id}.{IMAGE_ENCODERS[mask_format][0]}"
+            georef = (self.chip_crs.to_wkt(), tuple(self.chip_transform)[:6])
+            with self.timings.measure("mask_save") as metrics:
+                mask_bytes = encode_image_bytes(self.chip_mask, mask_format, self.config["OUTPUT"], georef)
+                mask_path.write_bytes(mask_bytes)
+                metrics["bytes"] = len(mask_bytes)
+            self.mask_path = mask_path
+            self.logger.debug(f"{self.feature_id}: Saved mask to {mask_path.name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"{self.feature_id}: Failed to save mask: {e}", exc_info=True)
+            return False
+
+    def _write_tile_pyramid(self) -> bool:
+        """
+        Writes the TMS tile pyramid for the extracted chip (see TmsPyramidWriter).
+
+        Returns:
+            True if at least one tile was written, False otherwise.
+        """
+        if self.processed_image_array is None or self.chip_transform is None:
+            self.logger.error(f"{self.feature_id}: Cannot tile, processed image array is missing.")
+            return False
+
+        try:
+            writer = TmsPyramidWriter(self.config["TILING"], resampling_method(self.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"]))
+            with self.timings.measure("tiles") as metrics:
+                tile_dir, tile_count = writer.write(self.feature_id, self.processed_image_array, self.chip_transform, self.chip_crs)
+                metrics["pixels"] = tile_count * writer.tile_size * writer.tile_size
+            if tile_count == 0:
+                self.logger.warning(f"{self.feature_id}: Chip produced no non-empty tiles, skipping.")
+                return False
+            self.output_path = tile_dir
+            self.logger.info(f"{self.feature_id}: ✅ Wrote {tile_count} tiles (z{writer.min_zoom}-{writer.max_zoom}) to {tile_dir}")
+            return True
+        except Exception as e:
+            self.logger.error(f"{self.feature_id}: Failed to write tile pyramid: {e}", exc_info=True)
+            return False
+
+    def validate(self) -> bool:
+        """
+        Validates the input record and fingerprints its geometry for the run manifest.
+
+        Returns:
+            True if the record can go on to geometry preparation, False otherwise.
+        """
+        self.logger.info(f"--- Processing record {self.record_index + 1}: {self.feature_id} ---")
+        with self.timings.measure("validate"):
+            if not self._validate_input_record():
+                return False
+            self.geometry_hash = geometry_hash({
+                "geometry": self.data["geometry"],
+                "buffer_meters": self.config["GEOSPATIAL"]["BUFFER_METERS"],
+            })
+        return True
+
+    def prepare(self) -> bool:
+        """
+        Runs the stages that need no network access: input validation and geometry preparation.
+
+        Returns:
+            True if the record is ready for a STAC search, False otherwise.
+        """
+        if not self.validate():
+            return False
+        with self.timings.measure("geometry"):
+            return self._prepare_geometry()
+
+    def matches_manifest(self, check_imagery: bool) -> bool:
+        """
+        Checks the run manifest for a previous successful run of this exact feature.
+
+        Args:
+            check_imagery: Also require the same selected STAC item (call after the search).
+
+        Returns:
+            True (and marks the processor as skipped) if there is nothing new to do.
+        """
+        if self.manifest is None or not self.manifest.is_unchanged(self, check_imagery):
+            return False
+        self.skipped_unchanged = True
+        self.logger.info(f"{self.feature_id}: Unchanged since last run (per manifest), skipping.")
+        return True
+
+    def write_outputs(self) -> bool:
+        """
+        Writes everything derived from the extracted chip: the tile pyramid and/or the chip image,
+        plus the companion mask in mask mode and the time stack in temporal mode.
+
+        Runs on the async writer's threads when there is one. The image array is dropped
+        afterwards so processors kept around by the staged pipeline don't pin every chip in memory.
+
+        Returns:
+            True if all configured outputs were written, False otherwise.
+        """
+        try:
+            tiling_config = self.config["TILING"]
+            if tiling_config["ENABLED"]:
+                if not self._write_tile_pyramid():
+                    return False
+            if not tiling_config["ENABLED"] or tiling_config["KEEP_CHIP_IMAGE"]:
+                if not self._save_output_image():
+                    return False
+            if self.chip_mask is not None and self.config["MASK"]["MODE"] == "companion":
+                if not self._save_mask_image():
+                    return False
+            if self.config["TEMPORAL"]["ENABLED"]:
+                return self._save_time_stack()
+            return True
+        finally:
+            self.processed_image_array = None
+            self.time_stack = None
+            self.chip_mask = None
+
+    def extract_and_save(self, src_dataset: Optional[rasterio.io.DatasetReader] = None,
+                         read_window: Optional[Window] = None) -> bool:
+        """
+        Runs the raster stages once an asset has been selected: window read, then the output writes.
+
+        With an output_writer the writes are queued and this returns as soon as the chip is
+        read; classify_outcome() then reports OUTCOME_PENDING and the writer records the
+        real outcome once the files are on disk.
+
+        Args:
+            src_dataset: Optional already-open dataset for the selected asset.
+            read_window: Optional precomputed window in src_dataset.
+
+        Returns:
+            True if the chip was read and written (or queued for writing), False otherwise.
+        """
+        if not self._extract_raster_chip(src_dataset, read_window):
+            self.processed_image_array = None
+            return False
+        if self.config["TEMPORAL"]["ENABLED"]:
+            self._extract_time_stack()
+        if self.output_writer is not None:
+            self.write_pending = True
+            self.output_writer.submit(self)
+            return True
+        return self.write_outputs()
+
     def process(self, stac_client: Client) -> bool:
         """
         Executes the full processing pipeline for this substation record.
@@ -416,92 +2005,2124 @@ class SubstationImageProcessor:
         Returns:
             True if the entire process completed successfully, False otherwise.
         """
-        self.logger.info(f"--- Processing record {self.record_index + 1}: {self.feature_id} ---")
-
         # Chain the processing steps, returning False if any step fails.
-        if not self._validate_input_record():
-            return False
-        if not self._prepare_geometry():
+        recheck_imagery = self.config["INCREMENTAL"]["RECHECK_IMAGERY"]
+        if not self.prepare():
             return False
+        if not recheck_imagery and self.matches_manifest(check_imagery=False):
+            return True
         if not self._search_stac_for_imagery(stac_client):
             # No coverage is a common case, not necessarily an error, but stops processing this feature. let me know if this handling makes sense
             return False # Returning False indicates processing didn't complete with an image.
-        if not self._extract_raster_chip():
-            return False
-        if not self._save_output_image():
-            return False
+        if recheck_imagery and self.matches_manifest(check_imagery=True):
+            return True
+        return self.extract_and_save()
 
-        # If all steps passed
-        return True
+    def classify_outcome(self, succeeded: bool) -> str:
+        """
+        Maps the result of process() onto one of the OUTCOME_* buckets used by the run summary.
 
-# --- Main Execution Logic ---
-def main():
-    """Main function to orchestrate the data loading and processing workflow."""
-    logger.info("=== Starting Substation NAIP Image Processing Workflow ===")
+        A False return after geometry preparation but without a selected asset is treated as
+        "no coverage" (a bit heuristic, but it's the same rule the summary has always used),
+        unless the STAC search itself errored out.
 
-    # --- Load Data ---
-    try:
-        if CONFIG["INPUT_DATA"]["SOURCE_TYPE"] == "json":
-            input_file = CONFIG["INPUT_DATA"]["JSON_FILE_PATH"]
-            all_substation_data = SubstationDataLoader.load_from_json(input_file)
-        else:
-            logger.error(f"Unsupported input data source type: {CONFIG['INPUT_DATA']['SOURCE_TYPE']}")
-            sys.exit(1)
-    except Exception as e:
-        logger.critical(f"Failed to load input data. Terminating workflow. Error: {e}", exc_info=True)
-        sys.exit(1)
+        Args:
+            succeeded: The value returned by process().
 
-    if not all_substation_data:
-        logger.warning("Input data source is empty. No substations to process.")
-        sys.exit(0)
+        Returns:
+            OUTCOME_PENDING, OUTCOME_SKIPPED, OUTCOME_SUCCESS, OUTCOME_NO_COVERAGE or OUTCOME_FAILURE.
+        """
+        if self.write_pending:
+            return OUTCOME_PENDING
+        if self.skipped_unchanged:
+            return OUTCOME_SKIPPED
+        if succeeded:
+            return OUTCOME_SUCCESS
+        if self.buffered_geometry_ll is not None and self.selected_stac_asset is None and not self.stac_search_error:
+            return OUTCOME_NO_COVERAGE
+        return OUTCOME_FAILURE
 
-    # --- Initialize STAC Client ---
-    try:
-        stac_catalog_url = CONFIG["STAC"]["CATALOG_URL"]
-        logger.info(f"Initializing STAC client for catalog: {stac_catalog_url}")
-        stac_client = Client.open(stac_catalog_url)
-        logger.info("STAC client initialized successfully.")
-    except Exception as e:
-        logger.critical(f"Failed to initialize STAC client. Terminating workflow. Error: {e}", exc_info=True)
-        sys.exit(1)
+# --- Bulk Geometry Preparation ---
+class BulkGeometryPreparer:
+    """
+    Vectorized version of SubstationImageProcessor._prepare_geometry for a whole batch.
 
-    # --- Process Each Substation ---
-    total_records = len(all_substation_data)
-    success_count = 0
-    failure_count = 0
-    no_coverage_count = 0 # Track separately cases where no NAIP tile was found
+    Geometries are validated and given a representative point with array-wide shapely calls.
+    They are then grouped by UTM zone (same rule as calculate_utm_crs), and each zone is
+    projected, buffered and projected back in three calls over a geometry array, with one
+    cached transformer pair per zone. The results match the per-feature path; only the
+    per-feature Python overhead goes away.
+    """
 
-    logger.info(f"Beginning processing for {total_records} substation records...")
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Args:
+            config: The global configuration dictionary.
+        """
+        self.config: Dict[str, Any] = config
+        self.logger = logging.getLogger(f"{__name__}.BulkGeometryPreparer")
 
-    for index, record in enumerate(all_substation_data):
-        processor = SubstationImageProcessor(index, record, CONFIG)
-        try:
-            # The process method returns True on full success, False otherwise.
-            # We need to distinguish between failures and simple "no coverage".
-            # A more robust way might involve specific return codes or exceptions from process().
-            # For now, we assume a False return after _search_stac_for_imagery means no coverage. But that's a misnomer! just fyi
-            if processor.process(stac_client):
-                success_count += 1
-            else:
-                # Check if the failure occurred because no asset was found
-                # This is a bit heuristic based on the state after process() returns False
-                if processor.buffered_geometry_ll is not None and processor.selected_stac_asset is None:
-                     no_coverage_count += 1
-                else:
-                     failure_count += 1 # Assume other failures are processing errors .... may not be ideal lol but ok for now
+    @staticmethod
+    def _transform_array(geometries: np.ndarray, transformer: pyproj.Transformer) -> np.ndarray:
+        """Reprojects every coordinate of a geometry array with a single transformer call."""
+        def _reproject_coords(coords: np.ndarray) -> np.ndarray:
+            xs, ys = transformer.transform(coords[:, 0], coords[:, 1])
+            return np.column_stack([xs, ys])
+        return shapely.transform(geometries, _reproject_coords)
+
+    def prepare(self, processors: List["SubstationImageProcessor"]) -> List["SubstationImageProcessor"]:
+        """
+        Prepares the geometry of every (already validated) processor.
+
+        Populates, per processor:
+            - initial_geometry_ll
+            - target_utm_crs
+            - buffered_geometry_ll
+
+        Args:
+            processors: Processors whose validate() succeeded.
+
+        Returns:
+            The processors whose geometry was prepared successfully, in input order. Failures
+            are logged per feature exactly like the per-feature path.
+        """
+        parsed: List[SubstationImageProcessor] = []
+        for processor in processors:
+            try:
+                processor.initial_geometry_ll = shapely.geometry.shape(processor.data['geometry'])
+                parsed.append(processor)
+            except Exception as e:
+                processor.logger.error(f"{processor.feature_id}: Failed during geometry preparation: {e}", exc_info=True)
+        if not parsed:
+            return []
+
+        geometries = np.empty(len(parsed), dtype=object)
+        geometries[:] = [p.initial_geometry_ll for p in parsed]
+
+        # 1. Validate everything at once
+        empty = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+        valid = shapely.is_valid(geometries)
+
+        # 2. Representative points -> UTM zone EPSG codes, vectorized version of utm_epsg (same zone 60 clamp)
+        rep_points = shapely.point_on_surface(geometries)
+        lon = shapely.get_x(rep_points)
+        lat = shapely.get_y(rep_points)
+        with np.errstate(invalid="ignore"):
+            in_bounds = (lon >= -180) & (lon <= 180) & (lat >= -90) & (lat <= 90)
+            zone_numbers = np.minimum(np.floor((np.nan_to_num(lon) + 180) / 6).astype(np.int64) + 1, UTM_ZONE_COUNT)
+            epsg_codes = np.where(lat >= 0, 32600, 32700) + zone_numbers
+
+        usable = np.zeros(len(parsed), dtype=bool)
+        for position, processor in enumerate(parsed):
+            if empty[position]:
+                processor.logger.warning(f"{processor.feature_id}: Input geometry is null or empty, skipping.")
+            elif not valid[position]:
+                processor.logger.warning(f"{processor.feature_id}: Input geometry is invalid (self_intersection, etc.), skipping.")
+            elif not in_bounds[position]:
+                processor.logger.error(f"{processor.feature_id}: Invalid coordinates for UTM calculation ({lat[position]:.4f}, {lon[position]:.4f}), skipping.")
+            else:
+                usable[position] = True
+
+        # 3. One project -> buffer -> unproject pass per UTM zone
+        geo_crs = self.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"]
+        buffer_distance = self.config["GEOSPATIAL"]["BUFFER_METERS"]
+        ready = np.zeros(len(parsed), dtype=bool)
+        for epsg_code in np.unique(epsg_codes[usable]).tolist():
+            zone_idx = np.flatnonzero(usable & (epsg_codes == epsg_code))
+            zone_crs = pyproj.CRS(f"EPSG:{epsg_code}")
+            try:
+                geoms_utm = self._transform_array(geometries[zone_idx], get_transformer(geo_crs, zone_crs))
+                # quad_segs=16 matches BaseGeometry.buffer() in the per-feature path (shapely.buffer defaults to 8)
+                buffered_utm = shapely.buffer(geoms_utm, buffer_distance, quad_segs=16)
+                buffered_ll = self._transform_array(buffered_utm, get_transformer(zone_crs, geo_crs))
+            except Exception as e:
+                self.logger.error(f"Bulk geometry preparation failed for EPSG:{epsg_code} ({len(zone_idx)} features): {e}", exc_info=True)
+                continue
+
+            for position, buffered in zip(zone_idx.tolist(), buffered_ll):
+                processor = parsed[position]
+                processor.target_utm_crs = zone_crs
+                processor.buffered_geometry_ll = buffered
+                ready[position] = True
+            self.logger.debug(f"Prepared {len(zone_idx)} geometries in UTM zone EPSG:{epsg_code}.")
+
+        return [processor for position, processor in enumerate(parsed) if ready[position]]
+
+
+# --- Batched STAC Search ---
+class BatchStacSearcher:
+    """
+    Resolves imagery for many prepared features with one STAC search per spatial group.
+
+    Substations cluster heavily, so per-feature searches mostly return the same NAIP items.
+    Instead, features are grouped (by grid cell or UTM zone), each group is searched once by
+    its bounding box with every page pulled, and the items are matched back to the features
+    locally through an STRtree over the item footprints.
+    """
+
+    GROUPINGS = ("grid", "utm_zone")
+
+    def __init__(self, stac_client: Client, config: Dict[str, Any]):
+        """
+        Args:
+            stac_client: Initialized pystac_client.Client instance.
+            config: The global configuration dictionary.
+
+        Raises:
+            ValueError: If the STAC batch settings are invalid (see validate_config).
+        """
+        self.validate_config(config["STAC"])
+        self.stac_client = stac_client
+        self.config: Dict[str, Any] = config
+        self.logger = logging.getLogger(f"{__name__}.BatchStacSearcher")
 
+    @classmethod
+    def validate_config(cls, stac_config: Dict[str, Any]) -> None:
+        """
+        Checks BATCH_GROUPING (and the grid cell size), so a typo fails at startup instead of
+        part way through the run.
+
+        Raises:
+            ValueError: On an unknown BATCH_GROUPING or a non-positive BATCH_GRID_DEGREES.
+        """
+        grouping = stac_config["BATCH_GROUPING"]
+        if grouping not in cls.GROUPINGS:
+            raise ValueError(f"Unsupported BATCH_GROUPING: {grouping}. Expected 'grid' or 'utm_zone'.")
+        if grouping == "grid" and not stac_config["BATCH_GRID_DEGREES"] > 0:
+            raise ValueError(f"BATCH_GRID_DEGREES must be positive, got {stac_config['BATCH_GRID_DEGREES']}.")
+
+    def _group_key(self, processor: SubstationImageProcessor) -> Tuple[Any, ...]:
+        """Returns the spatial group a prepared feature's search is folded into."""
+        grouping = self.config["STAC"]["BATCH_GROUPING"]
+        if grouping == "utm_zone":
+            return ("utm", processor.target_utm_crs.to_epsg())
+        if grouping == "grid":
+            cell_size = self.config["STAC"]["BATCH_GRID_DEGREES"]
+            centroid = processor.buffered_geometry_ll.centroid
+            return ("grid", math.floor(centroid.x / cell_size), math.floor(centroid.y / cell_size))
+        raise ValueError(f"Unsupported BATCH_GROUPING: {grouping}. Expected 'grid' or 'utm_zone'.")
+
+    def group(self, processors: List[SubstationImageProcessor]) -> Dict[Tuple[Any, ...], List[SubstationImageProcessor]]:
+        """Buckets prepared processors by their spatial group key."""
+        groups: Dict[Tuple[Any, ...], List[SubstationImageProcessor]] = defaultdict(list)
+        for processor in processors:
+            groups[self._group_key(processor)].append(processor)
+        return groups
+
+    def _search_group(self, members: List[SubstationImageProcessor]) -> List[Any]:
+        """Runs one bbox search covering every member and pages through all of the results."""
+        min_x = min(m.buffered_geometry_ll.bounds[0] for m in members)
+        min_y = min(m.buffered_geometry_ll.bounds[1] for m in members)
+        max_x = max(m.buffered_geometry_ll.bounds[2] for m in members)
+        max_y = max(m.buffered_geometry_ll.bounds[3] for m in members)
+        # Members share the run's timing collector, so any of them can record the group's search
+        with members[0].timings.measure("stac_batch_search"):
+            search = self.stac_client.search(
+                collections=[self.config["STAC"]["COLLECTION"]],
+                bbox=[min_x, min_y, max_x, max_y],
+                limit=self.config["STAC"]["BATCH_PAGE_LIMIT"],
+            )
+            # items() follows the "next" links, so this pulls every page for the bbox
+            return list(search.items())
+
+    def _resolve_group(self, group_key: Tuple[Any, ...], members: List[SubstationImageProcessor]) -> None:
+        """Searches one group and assigns the latest intersecting item to each member."""
+        try:
+            items = self._search_group(members)
+        except Exception as e:
+            self.logger.error(f"Batch STAC search failed for group {group_key} ({len(members)} features): {e}", exc_info=True)
+            for member in members:
+                member.stac_search_error = True
+            return
+
+        self.logger.debug(f"Group {group_key}: {len(items)} items for {len(members)} features.")
+        if not items:
+            for member in members:
+                member.select_imagery([])
+            return
+
+        # Items without a footprint fall back to their bbox so they can still be matched
+        footprints = [shapely.geometry.shape(item.geometry) if item.geometry else shapely.geometry.box(*item.bbox) for item in items]
+        tree = shapely.STRtree(footprints)
+        member_idx, item_idx = tree.query([m.buffered_geometry_ll for m in members], predicate="intersects")
+
+        # Keep the catalog's item order per member so ties on datetime resolve the same way
+        # they do in the per-feature search
+        intersecting: Dict[int, List[Any]] = defaultdict(list)
+        for m_i, i_i in sorted(zip(member_idx.tolist(), item_idx.tolist())):
+            intersecting[m_i].append(items[i_i])
+
+        for position, member in enumerate(members):
+            try:
+                member.select_imagery(intersecting.get(position, []))
+            except Exception as e:
+                member.stac_search_error = True
+                member.logger.error(f"{member.feature_id}: Error selecting imagery from batch results: {e}", exc_info=True)
+
+    def assign(self, processors: List[SubstationImageProcessor], executor: Optional[Executor] = None) -> None:
+        """
+        Resolves imagery for every prepared processor.
+
+        Args:
+            processors: Processors whose prepare() succeeded.
+            executor: Optional thread pool; when given, groups are searched concurrently.
+        """
+        groups = self.group(processors)
+        self.logger.info(f"Batch STAC search: {len(processors)} features in {len(groups)} groups ({self.config['STAC']['BATCH_GROUPING']}).")
+        if executor is None:
+            for group_key, members in groups.items():
+                self._resolve_group(group_key, members)
+        else:
+            futures = [executor.submit(self._resolve_group, key, members) for key, members in groups.items()]
+            for future in futures:
+                future.result()
+
+
+# --- STAC Search Cache ---
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when a STAC search has no cached result to replay."""
+
+
+class StacSearchCache:
+    """
+    Persistent SQLite cache of STAC search results and item JSON.
+
+    Searches are keyed by collection plus a hash of the query geometry/bbox and limit, and
+    point at item rows by id, so an item returned by many overlapping searches is stored
+    once. Entries older than the TTL are treated as misses, and the least recently used
+    searches are evicted once the cache grows past its size limit. A single connection is
+    shared behind a lock so concurrent workers can use the same cache.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS searches (
+            search_key TEXT PRIMARY KEY,
+            collection TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS search_items (
+            search_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            item_key TEXT NOT NULL,
+            PRIMARY KEY (search_key, position)
+        );
+        CREATE INDEX IF NOT EXISTS idx_search_items_item ON search_items (item_key);
+        CREATE TABLE IF NOT EXISTS items (
+            item_key TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL
+        );
+    """
+
+    # Checking the total size is a full table scan, so only do it every N writes
+    _EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, db_path: pathlib.Path, ttl_seconds: float, max_size_mb: float):
+        """
+        Args:
+            db_path: Location of the SQLite database (parent folders are created).
+            ttl_seconds: Age after which a cached search counts as a miss.
+            max_size_mb: Size budget for cached item JSON before LRU eviction kicks in.
+        """
+        self.db_path: pathlib.Path = db_path
+        self.ttl_seconds: float = ttl_seconds
+        self.max_size_bytes: int = int(max_size_mb * 1024 * 1024)
+        self.hits: int = 0
+        self.misses: int = 0
+        self._writes_since_eviction: int = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(search_kwargs: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Builds the (collection, search_key) pair for a set of search() keyword arguments.
+
+        Returns:
+            The collection string and a hash over collection + geometry/bbox + limit.
+        """
+        collection = ",".join(sorted(search_kwargs.get("collections") or []))
+        spatial = search_kwargs.get("intersects") or {"bbox": search_kwargs.get("bbox")}
+        if hasattr(spatial, "__geo_interface__"):
+            spatial = spatial.__geo_interface__
+        return collection, f"{collection}:{geometry_hash({'geometry': spatial, 'limit': search_kwargs.get('limit')})}"
+
+    def get(self, search_key: str, ignore_ttl: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Looks up a cached search.
+
+        Args:
+            search_key: Key from make_key().
+            ignore_ttl: Return expired entries too (used for offline replay).
+
+        Returns:
+            The cached item dicts in their original order, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM searches WHERE search_key = ?", (search_key,)).fetchone()
+            if row is None or (not ignore_ttl and now - row[0] > self.ttl_seconds):
+                self.misses += 1
+                return None
+
+            payloads = self._conn.execute(
+                "SELECT i.payload FROM search_items s JOIN items i ON i.item_key = s.item_key "
+                "WHERE s.search_key = ? ORDER BY s.position",
+                (search_key,),
+            ).fetchall()
+            self._conn.execute("UPDATE searches SET accessed_at = ? WHERE search_key = ?", (now, search_key))
+            self._conn.commit()
+            self.hits += 1
+        return [json.loads(payload) for (payload,) in payloads]
+
+    def put(self, collection: str, search_key: str, item_dicts: List[Dict[str, Any]]) -> None:
+        """Stores (or refreshes) one search result and its items, then evicts if over budget."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM search_items WHERE search_key = ?", (search_key,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (search_key, collection, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (search_key, collection, now, now),
+            )
+            for position, item_dict in enumerate(item_dicts):
+                item_key = f"{item_dict.get('collection', collection)}/{item_dict['id']}"
+                payload = json.dumps(item_dict, separators=(",", ":"))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO items (item_key, payload, size_bytes) VALUES (?, ?, ?)",
+                    (item_key, payload, len(payload)),
+                )
+                self._conn.execute(
+                    "INSERT INTO search_items (search_key, position, item_key) VALUES (?, ?, ?)",
+                    (search_key, position, item_key),
+                )
+            self._conn.commit()
+
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= self._EVICTION_CHECK_INTERVAL:
+                self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        """Drops least recently used searches (and orphaned items) until under the size budget. Caller holds the lock."""
+        self._writes_since_eviction = 0
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM items").fetchone()[0]
+        if total_bytes <= self.max_size_bytes:
+            return
+
+        # Items are shared between searches, so we can't know up front how much a search frees.
+        # Evict in LRU chunks of ~10% and re-measure after each chunk.
+        evicted = 0
+        search_count = self._conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        chunk_size = max(1, search_count // 10)
+        while total_bytes > self.max_size_bytes and evicted < search_count:
+            lru_keys = self._conn.execute(
+                "SELECT search_key FROM searches ORDER BY accessed_at ASC LIMIT ?", (chunk_size,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM searches WHERE search_key = ?", lru_keys)
+            self._conn.executemany("DELETE FROM search_items WHERE search_key = ?", lru_keys)
+            self._conn.execute("DELETE FROM items WHERE item_key NOT IN (SELECT item_key FROM search_items)")
+            evicted += len(lru_keys)
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM items").fetchone()[0]
+        self._conn.commit()
+        logger.info(f"STAC cache over {self.max_size_bytes / (1024 * 1024):.1f} MB, evicted {evicted} least recently used searches.")
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict_locked()
+            self._conn.close()
+
+
+class CachedItemSearch:
+    """Minimal stand-in for pystac_client's ItemSearch over an already materialized item list."""
+
+    def __init__(self, items: List[StacItem]):
+        self._items = items
+
+    def items(self):
+        return iter(self._items)
+
+
+class CachedStacClient:
+    """
+    Wraps a pystac_client Client so search() goes through a StacSearchCache.
+
+    Only the search(...).items() surface the pipeline uses is provided. In offline mode
+    there is no underlying client at all: cached results are replayed regardless of age and
+    any miss raises OfflineCacheMiss.
+    """
+
+    def __init__(self, client: Optional[Client], cache: StacSearchCache, offline: bool = False):
+        """
+        Args:
+            client: The real STAC client, or None in offline mode.
+            cache: The persistent search cache.
+            offline: Replay from the cache only.
+        """
+        if client is None and not offline:
+            raise ValueError("An underlying STAC client is required unless running offline.")
+        self.client: Optional[Client] = client
+        self.cache: StacSearchCache = cache
+        self.offline: bool = offline
+
+    def search(self, **search_kwargs: Any) -> CachedItemSearch:
+        collection, search_key = StacSearchCache.make_key(search_kwargs)
+        cached = self.cache.get(search_key, ignore_ttl=self.offline)
+        if cached is not None:
+            return CachedItemSearch([pystac.Item.from_dict(item_dict) for item_dict in cached])
+
+        if self.offline:
+            raise OfflineCacheMiss(f"No cached STAC result for this search (key {search_key[:24]}...) and running offline.")
+
+        items = list(self.client.search(**search_kwargs).items())
+        self.cache.put(collection, search_key, [item.to_dict(transform_hrefs=False) for item in items])
+        return CachedItemSearch(items)
+
+    def close(self) -> None:
+        total = self.cache.hits + self.cache.misses
+        hit_rate = (100.0 * self.cache.hits / total) if total else 0.0
+        logger.info(f"STAC cache: {self.cache.hits} hits, {self.cache.misses} misses ({hit_rate:.1f}% hit rate).")
+        self.cache.close()
+
+
+def open_stac_client(config: Dict[str, Any]):
+    """
+    Opens the STAC client described by the config, wrapped in the persistent cache when enabled.
+
+    Returns:
+        A pystac_client.Client, or a CachedStacClient when STAC_CACHE is enabled / offline.
+    """
+    cache_config = config["STAC_CACHE"]
+    offline = cache_config["OFFLINE"]
+    client = None
+    if not offline:
+        stac_catalog_url = config["STAC"]["CATALOG_URL"]
+        logger.info(f"Initializing STAC client for catalog: {stac_catalog_url}")
+        client = pystac_client.Client.open(stac_catalog_url)
+        if not cache_config["ENABLED"]:
+            return client
+
+    cache = StacSearchCache(cache_config["PATH"], cache_config["TTL_SECONDS"], cache_config["MAX_SIZE_MB"])
+    logger.info(f"Using STAC search cache at {cache_config['PATH']}{' (offline replay)' if offline else ''}.")
+    return CachedStacClient(client, cache, offline=offline)
+
+
+# --- Run Manifest (Incremental Runs) ---
+# CONFIG keys that change what a finished feature's outputs look like (None = the whole section).
+# Runtime knobs like the writer threads are left out so tuning them doesn't invalidate the manifest.
+OUTPUT_FINGERPRINT_KEYS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "GEOSPATIAL": ("DEFAULT_RESAMPLING",),
+    "OUTPUT": ("IMAGE_FOLDER", "IMAGE_FORMAT", "OPTIMIZE_PNG", "PNG_COMPRESS_LEVEL", "WEBP_METHOD", "JPEG_QUALITY", "COG_COMPRESSION"),
+    "CHIP": None,
+    "MOSAIC": None,
+    "MASK": None,
+    "TILING": None,
+    "TEMPORAL": None,
+}
+
+
+def output_fingerprint(config: Dict[str, Any]) -> str:
+    """
+    Hashes the output-shaping settings (format + encoder options, chip grid, mosaic, masks,
+    tiles, time stacks), so an incremental run redoes features whose outputs were made differently.
+    """
+    settings = {
+        section: {key: value for key, value in config[section].items() if keys is None or key in keys}
+        for section, keys in OUTPUT_FINGERPRINT_KEYS.items()
+    }
+    return geometry_hash(settings)
+
+
+class RunManifest:
+    """
+    Append-only JSONL manifest of finished features, used to make runs incremental and resumable.
+
+    Each line records one feature's input geometry hash, the STAC item it was built from (plus any
+    items mosaicked into it), the output settings fingerprint, its GSD, output path and status. Lines are flushed as features finish, so a killed run
+    loses at most the features that were in flight. On load the last line per feature wins.
+    If a torn final line was left by a crash it is ignored.
+    """
+
+    def __init__(self, manifest_path: pathlib.Path, base_path: Optional[pathlib.Path] = None,
+                 output_fingerprint: Optional[str] = None):
+        """
+        Args:
+            manifest_path: JSONL file to read previous results from and append new ones to.
+            base_path: Optional read-only manifest loaded first (a sharded run seeds from the merged
+                manifest, then its own shard file wins for anything it has done since).
+            output_fingerprint: This run's output_fingerprint(); entries made with other output
+                settings are never treated as unchanged.
+        """
+        self.manifest_path: pathlib.Path = manifest_path
+        self.output_fingerprint: Optional[str] = output_fingerprint
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if base_path is not None and base_path != manifest_path:
+            self._entries.update(self.read_entries(base_path))
+        self._entries.update(self.read_entries(manifest_path))
+        self._lock = threading.Lock()
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = self.manifest_path.open("a", encoding="utf-8")
+        if self._ends_with_torn_line():
+            # Start on a fresh line so the first new entry isn't glued onto the broken one
+            self._handle.write("\n")
+
+    def _ends_with_torn_line(self) -> bool:
+        if not self.manifest_path.is_file() or self.manifest_path.stat().st_size == 0:
+            return False
+        with self.manifest_path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    @staticmethod
+    def read_entries(manifest_path: pathlib.Path) -> Dict[str, Dict[str, Any]]:
+        """Reads a manifest file into {full_id: last entry}; a missing file is just empty."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not manifest_path.is_file():
+            return entries
+
+        with manifest_path.open("r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring unreadable manifest line {line_number} in {manifest_path} (likely an interrupted write).")
+                    continue
+                entries[entry["full_id"]] = entry
+
+        logger.info(f"Loaded run manifest with {len(entries)} features from {manifest_path}")
+        return entries
+
+    def is_unchanged(self, processor: "SubstationImageProcessor", check_imagery: bool) -> bool:
+        """
+        True if the manifest has a successful entry for this feature with the same geometry
+        hash and output settings (and, if check_imagery, the same STAC item and mosaic items)
+        whose output file (or tile folder) still exists.
+        """
+        entry = self._entries.get(processor.feature_id)
+        if entry is None or entry.get("status") != OUTCOME_SUCCESS:
+            return False
+        if entry.get("geometry_hash") != processor.geometry_hash:
+            return False
+        if entry.get("output_fingerprint") != self.output_fingerprint:
+            return False
+        if check_imagery and entry.get("stac_item_id") != processor.selected_stac_item_id:
+            return False
+        # A neighbouring tile appearing (or being reprocessed) changes a mosaicked chip even when the
+        # primary item doesn't; entries from before mosaicking have no ids, same as an unmosaicked chip
+        if check_imagery and entry.get("mosaic_item_ids", []) != self.mosaic_item_ids(processor):
+            return False
+        output_path = entry.get("output_path")
+        return bool(output_path) and pathlib.Path(output_path).exists()
+
+    @staticmethod
+    def mosaic_item_ids(processor: "SubstationImageProcessor") -> List[str]:
+        """Sorted ids of every item mosaicked into the feature's chips, across all vintages."""
+        ids = {item.id for item in processor.mosaic_items}
+        for items in processor.temporal_mosaic_items.values():
+            ids.update(item.id for item in items)
+        return sorted(ids)
+
+    def record(self, processor: "SubstationImageProcessor", outcome: str) -> None:
+        """Appends a finished feature's result. Skipped features already have their line."""
+        if outcome == OUTCOME_SKIPPED:
+            return
+
+        entry = {
+            "full_id": processor.feature_id,
+            "geometry_hash": processor.geometry_hash,
+            "stac_item_id": processor.selected_stac_item_id,
+            "stac_item_datetime": processor.selected_stac_item_datetime,
+            "mosaic_item_ids": self.mosaic_item_ids(processor),
+            "output_fingerprint": self.output_fingerprint,
+            "gsd": processor.source_gsd,
+            "output_path": str(processor.output_path) if processor.output_path else None,
+            "status": outcome,
+            "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._entries[processor.feature_id] = entry
+            self._handle.write(json.dumps(entry) + "\n")
+            self._handle.flush()
+
+    def extend(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Appends already-built entries (e.g. from shard manifests) and returns how many were written."""
+        written = 0
+        with self._lock:
+            for entry in entries:
+                self._entries[entry["full_id"]] = entry
+                self._handle.write(json.dumps(entry) + "\n")
+                written += 1
+            self._handle.flush()
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+# --- Sharding (Multi-Node Runs) ---
+class RecordSharder:
+    """
+    Deterministically splits the input between SHARD_COUNT independent workers.
+
+    Every worker streams the whole input and keeps only the records whose shard key hashes to
+    its own index, so there's no coordinator and no pre-split input files; the same input and
+    shard count always give the same split. "hash" (the default) keys on full_id, which gives an
+    even split. "spatial" keys on the lon/lat cell of the centre of the record's bbox (plain
+    coordinate arithmetic, so --plan stays free of the geospatial stack), so neighbouring substations
+    (which usually share a NAIP COG and a batch search) land on the same worker - but the split is
+    only as even as the cells are: substations cluster around cities, and with few cells per shard
+    some shards can end up with several dense cells and others with none.
+
+    Per-shard outputs (manifest, report, profile) get a ".shard-III-of-NNN" suffix via shard_path(),
+    and merge_shard_reports() / merge_shard_manifests() fold them back together afterwards.
+    """
+
+    def __init__(self, sharding_config: Dict[str, Any], environ: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            sharding_config: The SHARDING section of CONFIG.
+            environ: Environment to read the index/count fallbacks from (defaults to os.environ).
+
+        Raises:
+            ValueError: If the shard count/index are invalid or the strategy is unknown.
+        """
+        environ = os.environ if environ is None else environ
+        self.config = sharding_config
+        count = sharding_config["SHARD_COUNT"]
+        if count is None:
+            count = environ.get(sharding_config["COUNT_ENV_VAR"]) or 1
+        index = sharding_config["SHARD_INDEX"]
+        if index is None:
+            index = environ.get(sharding_config["INDEX_ENV_VAR"]) or 0
+        self.shard_count: int = int(count)
+        self.shard_index: int = int(index)
+        self.strategy: str = sharding_config["STRATEGY"]
+
+        if self.shard_count < 1:
+            raise ValueError(f"SHARD_COUNT must be at least 1, got {self.shard_count}.")
+        if not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"SHARD_INDEX {self.shard_index} is out of range for {self.shard_count} shards.")
+        if self.strategy not in ("spatial", "hash"):
+            raise ValueError(f"Unsupported sharding STRATEGY: {self.strategy}. Expected 'spatial' or 'hash'.")
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 1
+
+    @property
+    def label(self) -> str:
+        width = max(3, len(str(self.shard_count - 1)))
+        return f"shard-{self.shard_index:0{width}d}-of-{self.shard_count:0{width}d}"
+
+    def shard_path(self, path: pathlib.Path) -> pathlib.Path:
+        """naip_manifest.jsonl -> naip_manifest.shard-003-of-016.jsonl (unchanged when not sharded)."""
+        path = pathlib.Path(path)
+        if not self.enabled:
+            return path
+        return path.with_name(f"{path.stem}.{self.label}{path.suffix}")
+
+    def shard_key(self, record: SubstationRecord, record_index: int) -> str:
+        """The string that gets hashed to pick a record's shard."""
+        if self.strategy == "spatial" and isinstance(record, dict) and record.get("geometry"):
+            bounds = _geojson_bounds(record["geometry"]) if isinstance(record["geometry"], dict) else None
+            if bounds is not None: # Bad geometry: fall through to the id; the record fails validation on whichever shard gets it
+                center_x, center_y = (bounds[0] + bounds[2]) / 2.0, (bounds[1] + bounds[3]) / 2.0
+                cell_size = self.config["SPATIAL_TILE_DEGREES"]
+                return f"cell:{math.floor(center_x / cell_size)}:{math.floor(center_y / cell_size)}"
+        if isinstance(record, dict):
+            record_id = record.get("full_id") or record.get("id")
+            if record_id:
+                return f"id:{record_id}"
+        return f"index:{record_index}"
+
+    def shard_of(self, record: SubstationRecord, record_index: int) -> int:
+        # blake2b rather than hash(): str hashing is salted per process, so workers would disagree
+        digest = hashlib.blake2b(self.shard_key(record, record_index).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.shard_count
+
+    def filter(self, records: Iterable[SubstationRecord]) -> Iterator[SubstationRecord]:
+        """Yields only this shard's records from the full input stream."""
+        if not self.enabled:
+            yield from records
+            return
+        for record_index, record in enumerate(records):
+            if self.shard_of(record, record_index) != self.shard_index:
+                continue
+            if isinstance(record, dict) and not record.get("full_id") and "id" not in record:
+                # The processor names id-less records after their position in the stream it sees;
+                # pin the position in the full input so names don't collide between shards
+                record["id"] = f"index_{record_index}"
+            yield record
+
+
+def _shard_siblings(path: pathlib.Path) -> List[pathlib.Path]:
+    """The shard files written next to a base path, e.g. naip_run_report.shard-*-of-*.json."""
+    path = pathlib.Path(path)
+    return sorted(path.parent.glob(f"{path.stem}.shard-*-of-*{path.suffix}"))
+
+
+def merge_shard_reports(report_paths: List[pathlib.Path]) -> Dict[str, Any]:
+    """
+    Combines per-shard run reports into one.
+
+    Outcome counts, stage counts/totals/counters and cache hits add up exactly. Shards run side
+    by side, so elapsed_s is the slowest shard's and records_per_s is total records over that.
+    Per-stage percentiles can't be recombined from summaries, so p50/p95/p99 are the worst
+    shard's value (an upper bound); the per-shard reports keep the exact numbers.
+
+    Args:
+        report_paths: The shard report JSON files.
+
+    Returns:
+        The merged report dictionary, with a "shards" list of each input's outcomes.
+    """
+    reports = [json.loads(pathlib.Path(path).read_text(encoding="utf-8")) for path in report_paths]
+    merged: Dict[str, Any] = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "exit_code": max((r.get("exit_code", 0) for r in reports), default=0),
+        "elapsed_s": max((r.get("elapsed_s", 0.0) for r in reports), default=0.0),
+        "outcomes": defaultdict(int),
+        "settings": reports[0].get("settings", {}) if reports else {},
+        "stages": {},
+        "shards": [],
+    }
+    cache_totals: Dict[str, int] = defaultdict(int)
+    for path, report in zip(report_paths, reports):
+        for outcome, count in report.get("outcomes", {}).items():
+            merged["outcomes"][outcome] += count
+        for key, count in report.get("stac_cache", {}).items():
+            cache_totals[key] += count
+        for stage, summary in report.get("stages", {}).items():
+            into = merged["stages"].setdefault(stage, {})
+            for key, value in summary.items():
+                if key in ("max_s", "p50_s", "p95_s", "p99_s"):
+                    into[key] = max(into.get(key, 0.0), value)
+                elif key != "mean_s":
+                    into[key] = into.get(key, 0) + value
+        merged["shards"].append({"path": str(path), "shard": report.get("shard"), "elapsed_s": report.get("elapsed_s"),
+                                 "outcomes": report.get("outcomes", {})})
+
+    for summary in merged["stages"].values():
+        summary["mean_s"] = summary["total_s"] / summary["count"] if summary.get("count") else 0.0
+    merged["outcomes"] = dict(merged["outcomes"])
+    merged["records_per_s"] = merged["outcomes"].get("total", 0) / merged["elapsed_s"] if merged["elapsed_s"] > 0 else 0.0
+    if cache_totals:
+        merged["stac_cache"] = dict(cache_totals)
+    return merged
+
+
+def merge_shard_manifests(manifest_paths: List[pathlib.Path], manifest_path: pathlib.Path) -> int:
+    """
+    Appends every shard manifest's latest entry per feature to the base manifest, so the next
+    run (sharded or not, any shard count) sees all of it. Returns the number of entries merged.
+    """
+    manifest = RunManifest(manifest_path)
+    try:
+        return sum(manifest.extend(RunManifest.read_entries(path).values()) for path in manifest_paths)
+    finally:
+        manifest.close()
+
+
+# --- Chip Output Index ---
+# Column name -> numpy dtype for the fixed-layout .npy form. Strings are sized to the longest
+# value when the index is written; Parquet keeps the same column names.
+CHIP_INDEX_COLUMNS: Dict[str, str] = {
+    "full_id": "U",
+    "min_lon": "f8", "min_lat": "f8", "max_lon": "f8", "max_lat": "f8", # Chip footprint in WGS84
+    "centroid_lon": "f8", "centroid_lat": "f8", # Substation geometry centroid
+    "utm_epsg": "i4",
+    "stac_item_id": "U",
+    "stac_datetime": "U",
+    "gsd": "f8", # NaN when the item didn't say
+    "width": "i4", "height": "i4",
+    "output_path": "U",
+}
+
+
+def _chip_index_format(index_format: str) -> str:
+    """Resolves FORMAT "auto" to "parquet" when pyarrow is importable, else "numpy"."""
+    if index_format == "auto":
+        try:
+            import pyarrow # noqa: F401
+            return "parquet"
+        except ImportError:
+            return "numpy"
+    if index_format not in ("parquet", "numpy"):
+        raise ValueError(f"Unsupported INDEX FORMAT '{index_format}'. Expected 'auto', 'parquet' or 'numpy'.")
+    return index_format
+
+
+class ChipIndexWriter:
+    """
+    Collects one row per successfully written chip and writes them as a columnar index when the run ends.
+
+    Registered as a ProcessingStats completion hook, like the run manifest. Rows already in an
+    index at the same path are carried over unless this run finished the same feature again,
+    so incremental (skipped) features and features from earlier runs stay findable.
+    """
+
+    def __init__(self, index_config: Dict[str, Any], index_path: Optional[pathlib.Path] = None):
+        """
+        Args:
+            index_config: The INDEX section of CONFIG.
+            index_path: Base path to write to (no suffix); defaults to INDEX.PATH. Sharded runs pass their shard path.
+
+        Raises:
+            ValueError: If FORMAT is not recognised.
+        """
+        self.index_format: str = _chip_index_format(index_config["FORMAT"])
+        base_path = pathlib.Path(index_path if index_path is not None else index_config["PATH"])
+        self.index_path: pathlib.Path = base_path.with_name(base_path.name + (".parquet" if self.index_format == "parquet" else ".npy"))
+        self._rows: Dict[str, Tuple[Any, ...]] = {}
+        self._finished_ids: set = set()
+        self._lock = threading.Lock()
+
+    def record(self, processor: "SubstationImageProcessor", outcome: str) -> None:
+        """Adds a row for a successful chip; any other outcome just marks the feature as redone."""
+        if outcome == OUTCOME_SKIPPED:
+            return
+        row = self._build_row(processor) if outcome == OUTCOME_SUCCESS else None
+        with self._lock:
+            self._finished_ids.add(processor.feature_id)
+            if row is not None:
+                self._rows[processor.feature_id] = row
+            else:
+                self._rows.pop(processor.feature_id, None)
+
+    def extend(self, chip_index: "ChipIndex") -> None:
+        """Takes every row of another index (e.g. a shard's), replacing any row for the same feature."""
+        with self._lock:
+            for position in range(len(chip_index)):
+                row = chip_index.row(position)
+                self._finished_ids.add(row["full_id"])
+                self._rows[row["full_id"]] = tuple(row[name] for name in CHIP_INDEX_COLUMNS)
+
+    @staticmethod
+    def _build_row(processor: "SubstationImageProcessor") -> Optional[Tuple[Any, ...]]:
+        if processor.chip_transform is None or processor.chip_size is None:
+            return None
+        height, width = processor.chip_size
+        min_lon, min_lat, max_lon, max_lat = rasterio.warp.transform_bounds(
+            processor.chip_crs, processor.config["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"],
+            *rasterio.transform.array_bounds(height, width, processor.chip_transform))
+        centroid = processor.initial_geometry_ll.centroid
+        utm_epsg = processor.target_utm_crs.to_epsg() if processor.target_utm_crs is not None else None
+        gsd = processor.source_gsd if isinstance(processor.source_gsd, (int, float)) else float("nan")
+        return (processor.feature_id, min_lon, min_lat, max_lon, max_lat, centroid.x, centroid.y, utm_epsg or 0,
+                processor.selected_stac_item_id or "", processor.selected_stac_item_datetime or "", gsd,
+                width, height, str(processor.output_path or ""))
+
+    def close(self) -> pathlib.Path:
+        """Merges with the existing index at the same path and writes it out (temp file + rename). Returns the path."""
+        merged: Dict[str, Tuple[Any, ...]] = {}
+        if self.index_path.is_file():
+            previous = ChipIndex.load(self.index_path)
+            for position in range(len(previous)):
+                row = previous.row(position)
+                if row["full_id"] not in self._finished_ids:
+                    merged[row["full_id"]] = tuple(row[name] for name in CHIP_INDEX_COLUMNS)
+        with self._lock:
+            merged.update(self._rows)
+        write_chip_index(list(merged.values()), self.index_path, self.index_format)
+        logger.info(f"Chip index with {len(merged)} chips written to {self.index_path}")
+        return self.index_path
+
+
+def write_chip_index(rows: List[Tuple[Any, ...]], index_path: pathlib.Path, index_format: str) -> None:
+    """Writes index rows (in CHIP_INDEX_COLUMNS order) as Parquet or a structured .npy."""
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    names = list(CHIP_INDEX_COLUMNS)
+    arrays: Dict[str, np.ndarray] = {}
+    for position, (name, dtype) in enumerate(CHIP_INDEX_COLUMNS.items()):
+        # "U" -> str lets numpy size the fixed-width string column to its longest value
+        arrays[name] = np.array([row[position] for row in rows], dtype=str if dtype == "U" else dtype)
+
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    if index_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table({name: arrays[name] for name in names}), tmp_path, compression="zstd")
+    else:
+        dtype = [(name, arrays[name].dtype) for name in names]
+        table = np.empty(len(rows), dtype=dtype)
+        for name in names:
+            table[name] = arrays[name]
+        with tmp_path.open("wb") as f:
+            np.save(f, table, allow_pickle=False)
+    os.replace(tmp_path, index_path)
+
+
+class ChipIndex:
+    """
+    Read side of the chip index: columns as numpy arrays plus a lazily built STRtree over
+    the chip footprints for bbox queries.
+
+    Example:
+        index = ChipIndex.load("public/naip_index.parquet")
+        for row in index.query_bbox(-116.3, 43.5, -116.1, 43.7):
+            print(row["full_id"], row["output_path"])
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns: Dict[str, np.ndarray] = columns
+        self._tree: Optional[STRtree] = None
+        self._positions: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def load(cls, index_path: Any) -> "ChipIndex":
+        """
+        Loads an index written by ChipIndexWriter. The suffix picks the reader; a bare base
+        path (INDEX.PATH) tries .parquet then .npy.
+
+        Raises:
+            FileNotFoundError: If no index file exists at the path.
+            ImportError: If the index is Parquet and pyarrow isn't installed.
+        """
+        index_path = pathlib.Path(index_path)
+        if index_path.suffix not in (".parquet", ".npy"):
+            candidates = [index_path.with_name(index_path.name + suffix) for suffix in (".parquet", ".npy")]
+            index_path = next((path for path in candidates if path.is_file()), candidates[-1])
+        if not index_path.is_file():
+            raise FileNotFoundError(f"No chip index at {index_path}")
+
+        if index_path.suffix == ".parquet":
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Reading a Parquet chip index requires pyarrow (pip install pyarrow).") from e
+            table = pq.read_table(index_path)
+            columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+            for name, dtype in CHIP_INDEX_COLUMNS.items():
+                if dtype == "U" and name in columns:
+                    columns[name] = columns[name].astype(str)
+        else:
+            table = np.load(index_path, allow_pickle=False)
+            columns = {name: table[name] for name in table.dtype.names}
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns["full_id"])
+
+    def row(self, position: int) -> Dict[str, Any]:
+        """One chip's columns as plain Python values."""
+        return {name: values[position].item() for name, values in self.columns.items()}
+
+    def get(self, full_id: str) -> Optional[Dict[str, Any]]:
+        """Looks a chip up by substation full_id."""
+        if self._positions is None:
+            self._positions = {str(feature_id): position for position, feature_id in enumerate(self.columns["full_id"])}
+        position = self._positions.get(full_id)
+        return self.row(position) if position is not None else None
+
+    def query_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> List[Dict[str, Any]]:
+        """Returns the chips whose footprint intersects the WGS84 bbox."""
+        if self._tree is None:
+            self._tree = shapely.STRtree(shapely.box(self.columns["min_lon"], self.columns["min_lat"],
+                                             self.columns["max_lon"], self.columns["max_lat"]))
+        positions = self._tree.query(shapely.box(min_lon, min_lat, max_lon, max_lat), predicate="intersects")
+        return [self.row(int(position)) for position in sorted(positions)]
+
+
+# --- Execution Engine ---
+class ProcessingStats:
+    """
+    Thread-safe tally of record outcomes, with periodic progress and throughput logging.
+
+    Workers in concurrent mode all report into one instance, so every counter update
+    goes through a lock. Per-record listeners (e.g. the run manifest) can be attached via
+    completion_hooks and are called with (processor, outcome) for every finished record.
+    """
+
+    def __init__(self, total_records: Optional[int], progress_interval: int):
+        """
+        Args:
+            total_records: Number of records the run is expected to process (for progress logs),
+                or None when streaming input of unknown length.
+            progress_interval: Log a progress line every N completed records (0 disables).
+
+        The run's StageTimings lives here too (stats.timings), since the stats object already
+        reaches every stage of every execution mode.
+        """
+        self.total_records: Optional[int] = total_records
+        self.progress_interval: int = progress_interval
+        self.success_count: int = 0
+        self.no_coverage_count: int = 0
+        self.failure_count: int = 0
+        self.skipped_count: int = 0
+        self.completion_hooks: List[Any] = []
+        self.timings: StageTimings = StageTimings()
+        self.start_time: float = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def completed_count(self) -> int:
+        return self.success_count + self.no_coverage_count + self.failure_count + self.skipped_count
+
+    def record(self, outcome: str, processor: Optional[SubstationImageProcessor] = None) -> None:
+        """Counts one finished record, notifies the completion hooks and logs progress when the interval is hit."""
+        if outcome == OUTCOME_PENDING:
+            return # The async writer records this one once its files are written
+        if processor is not None:
+            for hook in self.completion_hooks:
+                try:
+                    hook(processor, outcome)
+                except Exception as e:
+                    logger.error(f"Completion hook failed for record {processor.feature_id}: {e}", exc_info=True)
+
+        with self._lock:
+            if outcome == OUTCOME_SUCCESS:
+                self.success_count += 1
+            elif outcome == OUTCOME_SKIPPED:
+                self.skipped_count += 1
+            elif outcome == OUTCOME_NO_COVERAGE:
+                self.no_coverage_count += 1
+            else:
+                self.failure_count += 1
+            completed = self.completed_count
+            log_now = self.progress_interval > 0 and completed % self.progress_interval == 0
+
+        if log_now:
+            self.log_progress()
+
+    def throughput(self) -> float:
+        """Completed records per second since the stats object was created."""
+        elapsed = time.perf_counter() - self.start_time
+        return self.completed_count / elapsed if elapsed > 0 else 0.0
+
+    def log_progress(self) -> None:
+        with self._lock:
+            completed = self.completed_count
+            counts = (self.success_count, self.no_coverage_count, self.failure_count, self.skipped_count)
+        logger.info(
+            f"Progress: {completed}/{self.total_records if self.total_records is not None else '?'} records "
+            f"(success={counts[0]}, no_coverage={counts[1]}, failed={counts[2]}, unchanged={counts[3]}) "
+            f"- {self.throughput():.2f} records/s"
+        )
+
+
+class AsyncOutputWriter:
+    """
+    Background encode + write stage fed by a bounded queue.
+
+    Reader threads hand over a processor as soon as its chip is in memory and go back to
+    fetching rasters, while WRITER_THREADS threads run processor.write_outputs() (tiles and/or
+    the chip image; the encode itself still goes to the process pool when there is one). The
+    queue holds at most WRITER_QUEUE_SIZE chips, so a slow disk or encoder backs up into the
+    readers instead of into memory. Each finished write is reported to the stats object, which
+    is what fires the completion hooks (e.g. the run manifest) for that record.
+    """
+
+    def __init__(self, stats: ProcessingStats, output_config: Dict[str, Any]):
+        """
+        Args:
+            stats: Stats object that receives each written record's outcome.
+            output_config: CONFIG["OUTPUT"] (WRITER_THREADS and WRITER_QUEUE_SIZE are read from it).
+        """
+        self.stats: ProcessingStats = stats
+        self._queue: "queue.Queue[Optional[SubstationImageProcessor]]" = queue.Queue(maxsize=max(1, int(output_config["WRITER_QUEUE_SIZE"])))
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._drain, name=f"naip-writer-{n}", daemon=True)
+            for n in range(max(1, int(output_config["WRITER_THREADS"])))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, processor: SubstationImageProcessor) -> None:
+        """Queues a processor whose chip has been read; blocks while the queue is full."""
+        self._queue.put(processor)
+
+    def _drain(self) -> None:
+        while True:
+            processor = self._queue.get()
+            if processor is None:
+                return
+            try:
+                succeeded = processor.write_outputs()
+            except Exception as e:
+                processor.logger.error(f"{processor.feature_id}: Unexpected error in output writer: {e}", exc_info=True)
+                succeeded = False
+            self.stats.record(OUTCOME_SUCCESS if succeeded else OUTCOME_FAILURE, processor)
+
+    def close(self) -> None:
+        """Waits for every queued write to finish, then stops the writer threads."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def _open_output_writer(config: Dict[str, Any], stats: ProcessingStats) -> Optional[AsyncOutputWriter]:
+    """Starts the background writer if OUTPUT.ASYNC_WRITER is on."""
+    if not config["OUTPUT"]["ASYNC_WRITER"]:
+        return None
+    output_config = config["OUTPUT"]
+    logger.info(f"Async output writer: {output_config['WRITER_THREADS']} threads, queue of {output_config['WRITER_QUEUE_SIZE']} chips, "
+                f"{output_config['IMAGE_FORMAT']} encoder.")
+    return AsyncOutputWriter(stats, output_config)
+
+
+def _run_single_record(processor: SubstationImageProcessor, stac_client: Client) -> str:
+    """
+    Runs one processor end-to-end and returns its outcome bucket.
+
+    Any exception escaping process() is logged and counted as a failure so a single bad
+    record can never take down a worker.
+    """
+    try:
+        return processor.classify_outcome(processor.process(stac_client))
+    except Exception as e:
+        logger.error(f"Critical error during processing loop for record {processor.feature_id}: {e}", exc_info=True)
+        return OUTCOME_FAILURE
+
+
+def _pool_map(io_pool: Optional[Executor], fn, iterable: Iterable[Any]) -> Iterable[Any]:
+    """map() on the thread pool when there is one, on the calling thread otherwise."""
+    return map(fn, iterable) if io_pool is None else io_pool.map(fn, iterable)
+
+
+def _search_record(processor: SubstationImageProcessor, stac_client: Client) -> None:
+    """Per-feature STAC search for the staged pipeline; the result lives on the processor."""
+    try:
+        processor._search_stac_for_imagery(stac_client)
+    except Exception as e:
+        processor.stac_search_error = True
+        logger.error(f"Critical error during STAC search for record {processor.feature_id}: {e}", exc_info=True)
+
+
+def _extract_and_save_record(processor: SubstationImageProcessor,
+                             src_dataset: Optional[rasterio.io.DatasetReader] = None,
+                             read_window: Optional[Window] = None) -> str:
+    """Raster half of the staged pipeline: read + save one resolved record, returning its outcome."""
+    if processor.selected_stac_asset is None:
+        return processor.classify_outcome(False)
+    try:
+        return processor.classify_outcome(processor.extract_and_save(src_dataset, read_window))
+    except Exception as e:
+        logger.error(f"Critical error during processing loop for record {processor.feature_id}: {e}", exc_info=True)
+        return OUTCOME_FAILURE
+
+
+def _read_asset_group(asset_href: str, members: List[SubstationImageProcessor]) -> List[str]:
+    """
+    Reads and saves every chip that comes from one source asset, opening the COG only once.
+
+    All windows are computed up front and read in (row, col) offset order, so chips that sit
+    next to each other in the tile hit the same or adjacent internal blocks back to back.
+    With MERGE_OVERLAPPING_READS, overlapping windows are clustered (see _cluster_windows) and
+    each cluster is read once; its members' chips are views into that one array.
+
+    Args:
+        asset_href: The shared selected_stac_asset.href.
+        members: Processors whose selected asset is asset_href.
+
+    Returns:
+        One outcome per member, in member order.
+    """
+    outcomes: Dict[int, str] = {}
+    try:
+        raster_reader = members[0].raster_reader
+        with raster_reader.env():
+            with members[0].timings.measure("open") as metrics:
+                src_dataset = raster_reader.open(asset_href, metrics)
+            with src_dataset:
+                planned: List[Tuple[float, float, int, Window]] = []
+                for position, member in enumerate(members):
+                    try:
+                        read_window = member.compute_read_window(src_dataset)
+                    except Exception as e:
+                        member.logger.error(f"{member.feature_id}: Failed to compute read window in {asset_href}: {e}", exc_info=True)
+                        read_window = None
+                    if read_window is None:
+                        outcomes[position] = member.classify_outcome(False)
+                    else:
+                        planned.append((read_window.row_off, read_window.col_off, position, read_window))
+
+                planned.sort(key=lambda entry: entry[:3])
+                exec_config = members[0].config["EXECUTION"]
+                if exec_config["MERGE_OVERLAPPING_READS"] and not members[0].config["CHIP"]["FIXED_SIZE"]:
+                    clusters = _cluster_windows([(position, read_window) for _, _, position, read_window in planned],
+                                                int(exec_config["MAX_MERGED_READ_PIXELS"]))
+                else:
+                    clusters = [(read_window, [(position, read_window)]) for _, _, position, read_window in planned]
+
+                for union_window, cluster in clusters:
+                    if len(cluster) > 1:
+                        # If the union read fails the members just read their own windows
+                        _read_merged_window(src_dataset, union_window, [members[position] for position, _ in cluster])
+                    for position, read_window in cluster:
+                        outcomes[position] = _extract_and_save_record(members[position], src_dataset, read_window)
+                        members[position].shared_read = None # In case the record bailed out before slicing
+    except Exception as e:
+        logger.error(f"Failed to open raster asset {asset_href} for {len(members)} features: {e}", exc_info=True)
+
+    # Anything without an outcome by now never got read because the open itself failed
+    return [outcomes.get(position, OUTCOME_FAILURE) for position in range(len(members))]
+
+
+def _window_bounds(window: Window) -> Tuple[int, int, int, int]:
+    """(row_start, col_start, row_stop, col_stop) of an integer window."""
+    row_start, col_start = int(window.row_off), int(window.col_off)
+    return row_start, col_start, row_start + int(window.height), col_start + int(window.width)
+
+
+def _cluster_windows(windows: List[Tuple[int, Window]], max_pixels: int) -> List[Tuple[Window, List[Tuple[int, Window]]]]:
+    """
+    Greedily clusters overlapping read windows on one asset into shared union reads.
+
+    Windows are taken in the order given (row, col sorted by the caller). A window joins the first
+    cluster whose union it overlaps, as long as the grown union would cover no more pixels than
+    reading the members separately and stays under max_pixels. That way a merged read never
+    costs more decode work than the reads it replaces; diagonal neighbours that would drag in big
+    empty corners stay separate. Fractional windows (shouldn't happen with geometry_window) are never merged.
+
+    Args:
+        windows: (member position, read window) pairs.
+        max_pixels: Cap on a union window's area.
+
+    Returns:
+        (union window, [(position, window), ...]) per cluster, in first-member order.
+    """
+    clusters: List[List[Any]] = [] # [bounds, summed member pixels, members]
+    for position, window in windows:
+        if any(value != int(value) for value in (window.row_off, window.col_off, window.width, window.height)):
+            clusters.append([None, 0, [(position, window)]])
+            continue
+        row_start, col_start, row_stop, col_stop = _window_bounds(window)
+        area = (row_stop - row_start) * (col_stop - col_start)
+        for cluster in clusters:
+            if cluster[0] is None:
+                continue
+            c_row_start, c_col_start, c_row_stop, c_col_stop = cluster[0]
+            if row_start >= c_row_stop or row_stop <= c_row_start or col_start >= c_col_stop or col_stop <= c_col_start:
+                continue # No overlap
+            union = (min(row_start, c_row_start), min(col_start, c_col_start), max(row_stop, c_row_stop), max(col_stop, c_col_stop))
+            union_area = (union[2] - union[0]) * (union[3] - union[1])
+            if union_area <= cluster[1] + area and union_area <= max_pixels:
+                cluster[0], cluster[1] = union, cluster[1] + area
+                cluster[2].append((position, window))
+                break
+        else:
+            clusters.append([(row_start, col_start, row_stop, col_stop), area, [(position, window)]])
+
+    result: List[Tuple[Window, List[Tuple[int, Window]]]] = []
+    for bounds, _, members in clusters:
+        if bounds is None or len(members) == 1:
+            result.append((members[0][1], members))
+        else:
+            result.append((rasterio.windows.Window(bounds[1], bounds[0], bounds[3] - bounds[1], bounds[2] - bounds[0]), members))
+    return result
+
+
+def _read_merged_window(src_dataset: rasterio.io.DatasetReader, union_window: Window,
+                        members: List[SubstationImageProcessor]) -> bool:
+    """
+    Reads a cluster's union window once and hands it to every member as shared_read.
+
+    Returns:
+        True if the read worked; False (already logged) means the members read on their own.
+    """
+    lead = members[0]
+    try:
+        with lead.timings.measure("merged_read") as metrics:
+            union_array = lead.raster_reader.retry(lambda: src_dataset.read(
+                indexes=(1, 2, 3),
+                window=union_window,
+                out_dtype="uint8",
+                resampling=resampling_method(lead.config["GEOSPATIAL"]["DEFAULT_RESAMPLING"]),
+                boundless=lead.config["GEOSPATIAL"]["BOUNDLESS_READ"] or any(member.mosaic_items for member in members)
+            ), f"merged window read for {len(members)} features", metrics)
+            metrics["bytes"] = union_array.nbytes
+            metrics["pixels"] = int(union_window.width * union_window.height)
+    except Exception as e:
+        logger.warning(f"Merged read of {union_window} for {len(members)} features failed, reading them one by one: {e}")
+        return False
+    for member in members:
+        member.shared_read = (union_window, union_array)
+    return True
+
+
+def _uses_staged_pipeline(config: Dict[str, Any]) -> bool:
+    """
+    Batch search and grouped reads both need every record resolved before the raster stage,
+    and bulk geometry prep needs a chunk of records to vectorize over.
+    """
+    return bool(config["STAC"]["BATCH_SEARCH"] or config["EXECUTION"]["GROUP_READS_BY_ASSET"]
+                or config["GEOSPATIAL"]["BULK_GEOMETRY_PREP"])
+
+
+def _run_staged(records: Iterable[SubstationRecord], stac_client: Client, config: Dict[str, Any],
+                stats: ProcessingStats, make_processor, io_pool: Optional[Executor] = None) -> None:
+    """
+    Runs the staged pipeline over the input in chunks of STAGE_CHUNK_SIZE records, so only
+    one chunk's processors are alive at a time however long the input stream is.
+    """
+    chunk_size = max(1, int(config["EXECUTION"]["STAGE_CHUNK_SIZE"]))
+    indexed_records = enumerate(records)
+    while True:
+        chunk = list(itertools.islice(indexed_records, chunk_size))
+        if not chunk:
+            return
+        logger.info(f"Staged pipeline: processing records {chunk[0][0] + 1}-{chunk[-1][0] + 1}...")
+        _run_staged_chunk(chunk, stac_client, config, stats, make_processor, io_pool=io_pool)
+
+
+def _run_staged_chunk(indexed_records: List[Tuple[int, SubstationRecord]], stac_client: Client, config: Dict[str, Any],
+                      stats: ProcessingStats, make_processor, io_pool: Optional[Executor] = None) -> None:
+    """
+    Staged pipeline for one chunk: prepare every geometry, resolve imagery for all of them
+    (one batch search per spatial group, or per feature), then read and save the chips -
+    either per feature or grouped so each source asset is opened once.
+
+    Args:
+        indexed_records: (record_index, record) pairs for this chunk.
+        stac_client: STAC client used for the searches.
+        config: The global configuration dictionary.
+        stats: Stats object that receives each record's outcome.
+        make_processor: Factory (from _processor_factory) building a processor for (index, record).
+        io_pool: Optional thread pool for the searches and raster reads.
+    """
+    recheck_imagery = config["INCREMENTAL"]["RECHECK_IMAGERY"]
+    bulk_geometry = config["GEOSPATIAL"]["BULK_GEOMETRY_PREP"]
+
+    candidates: List[SubstationImageProcessor] = []
+    for index, record in indexed_records:
+        processor = make_processor(index, record)
+        try:
+            # In bulk mode only validate here; geometry is done for the whole batch below
+            ready = processor.validate() if bulk_geometry else processor.prepare()
         except Exception as e:
-            # Catch unexpected errors during the main loop invocation itself
             logger.error(f"Critical error during processing loop for record {processor.feature_id}: {e}", exc_info=True)
-            failure_count += 1
+            ready = False
+        if ready:
+            candidates.append(processor)
+        else:
+            stats.record(processor.classify_outcome(False), processor)
+
+    if bulk_geometry:
+        with stats.timings.measure("geometry_bulk"):
+            ready_ids = {id(p) for p in BulkGeometryPreparer(config).prepare(candidates)}
+        for processor in candidates:
+            if id(processor) not in ready_ids:
+                stats.record(processor.classify_outcome(False), processor)
+        candidates = [p for p in candidates if id(p) in ready_ids]
+
+    prepared: List[SubstationImageProcessor] = []
+    for processor in candidates:
+        if not recheck_imagery and processor.matches_manifest(check_imagery=False):
+            stats.record(OUTCOME_SKIPPED, processor)
+        else:
+            prepared.append(processor)
+
+    if config["STAC"]["BATCH_SEARCH"]:
+        BatchStacSearcher(stac_client, config).assign(prepared, executor=io_pool)
+    else:
+        list(_pool_map(io_pool, functools.partial(_search_record, stac_client=stac_client), prepared))
+
+    if recheck_imagery:
+        resolved = []
+        for processor in prepared:
+            if processor.selected_stac_asset is not None and processor.matches_manifest(check_imagery=True):
+                stats.record(OUTCOME_SKIPPED, processor)
+            else:
+                resolved.append(processor)
+        prepared = resolved
+
+    if not config["EXECUTION"]["GROUP_READS_BY_ASSET"]:
+        for processor, outcome in zip(prepared, _pool_map(io_pool, _extract_and_save_record, prepared)):
+            stats.record(outcome, processor)
+        return
+
+    asset_groups: Dict[str, List[SubstationImageProcessor]] = defaultdict(list)
+    for processor in prepared:
+        if processor.selected_stac_asset is None:
+            stats.record(processor.classify_outcome(False), processor)
+        else:
+            asset_groups[processor.selected_stac_asset.href].append(processor)
+
+    logger.info(f"Grouped raster reads: {sum(len(m) for m in asset_groups.values())} features across {len(asset_groups)} source assets.")
+    for (_, members), group_outcomes in zip(asset_groups.items(),
+                                            _pool_map(io_pool, lambda group: _read_asset_group(*group), asset_groups.items())):
+        for processor, outcome in zip(members, group_outcomes):
+            stats.record(outcome, processor)
+
+
+def _processor_factory(config: Dict[str, Any], encode_pool: Optional[Executor] = None,
+                       manifest: Optional[RunManifest] = None, output_writer: Optional[AsyncOutputWriter] = None,
+                       timings: Optional[StageTimings] = None):
+    """Returns a callable building a SubstationImageProcessor for (index, record) with the run's shared collaborators."""
+    return functools.partial(SubstationImageProcessor, config=config, encode_executor=encode_pool, manifest=manifest,
+                             output_writer=output_writer, timings=timings, raster_reader=RasterReader(config["RASTER_IO"]))
+
+
+def run_sequential(records: Iterable[SubstationRecord], stac_client: Client, config: Dict[str, Any],
+                   stats: ProcessingStats, manifest: Optional[RunManifest] = None) -> None:
+    """
+    Processes records one at a time on the calling thread (the original behaviour), except
+    that with OUTPUT.ASYNC_WRITER the encode + write overlaps with the next record's search and read.
+    """
+    output_writer = _open_output_writer(config, stats)
+    make_processor = _processor_factory(config, manifest=manifest, output_writer=output_writer, timings=stats.timings)
+    try:
+        if _uses_staged_pipeline(config):
+            _run_staged(records, stac_client, config, stats, make_processor)
+            return
+
+        for index, record in enumerate(records):
+            processor = make_processor(index, record)
+            stats.record(_run_single_record(processor, stac_client), processor)
+    finally:
+        if output_writer is not None:
+            output_writer.close()
+
+
+def run_concurrent(records: Iterable[SubstationRecord], stac_client: Client, config: Dict[str, Any],
+                   stats: ProcessingStats, manifest: Optional[RunManifest] = None) -> None:
+    """
+    Processes records with bounded concurrency.
+
+    Each record's STAC search and COG read run on a thread pool (both are network-bound and
+    release the GIL while waiting). With OUTPUT.ASYNC_WRITER the encode + write moves to the
+    background writer, and if CPU_WORKERS > 0 the encode itself is handed off to a process
+    pool so compression doesn't fight the I/O threads for the GIL. At most
+    MAX_IN_FLIGHT records are submitted at any time, so memory stays flat no matter how
+    many records are in the input. With BATCH_SEARCH, GROUP_READS_BY_ASSET or
+    BULK_GEOMETRY_PREP on, the same pools drive the staged pipeline instead.
+
+    Args:
+        records: Iterable of substation records.
+        stac_client: Shared STAC client used by every worker.
+        config: The global configuration dictionary.
+        stats: Stats object that receives each record's outcome.
+        manifest: Optional run manifest for incremental runs.
+    """
+    exec_config = config["EXECUTION"]
+    max_workers = max(1, int(exec_config["MAX_WORKERS"]))
+    cpu_workers = max(0, int(exec_config["CPU_WORKERS"]))
+    max_in_flight = exec_config["MAX_IN_FLIGHT"] or 2 * max_workers
+
+    logger.info(f"Concurrent mode: {max_workers} I/O threads, {cpu_workers} encode processes, up to {max_in_flight} records in flight.")
+
+    encode_pool: Optional[ProcessPoolExecutor] = None
+    if cpu_workers > 0:
+        # spawn rather than fork: forking a process that already has live I/O threads is asking for trouble
+        encode_pool = ProcessPoolExecutor(max_workers=cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    output_writer = _open_output_writer(config, stats)
+    make_processor = _processor_factory(config, encode_pool=encode_pool, manifest=manifest, output_writer=output_writer,
+                                        timings=stats.timings)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="naip-io") as io_pool:
+            if _uses_staged_pipeline(config):
+                _run_staged(records, stac_client, config, stats, make_processor, io_pool=io_pool)
+                return
+
+            in_flight: Dict[Any, SubstationImageProcessor] = {}
+            try:
+                for index, record in enumerate(records):
+                    processor = make_processor(index, record)
+                    in_flight[io_pool.submit(_run_single_record, processor, stac_client)] = processor
+
+                    if len(in_flight) >= max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            stats.record(future.result(), in_flight.pop(future))
+            finally:
+                # Also when the input stream raises part way: let the submitted records finish and record
+                # them, so their outcomes reach the stats and the manifest before the error propagates
+                for future in wait(in_flight).done:
+                    stats.record(future.result(), in_flight[future])
+    finally:
+        if output_writer is not None:
+            output_writer.close()
+        if encode_pool is not None:
+            encode_pool.shutdown(wait=True)
+
+
+# --- Run Report & Profiling ---
+def build_run_report(stats: ProcessingStats, config: Dict[str, Any], stac_client: Any = None,
+                     exit_code: int = 0, sharder: Optional[RecordSharder] = None) -> Dict[str, Any]:
+    """
+    Collects the outcome counts, throughput and per-stage timing percentiles into one JSON-able dict.
+
+    Args:
+        stats: The run's stats object (its timings hold the per-stage samples).
+        config: The global configuration dictionary (the execution knobs are echoed into the report).
+        stac_client: The run's STAC client; cache hit/miss counts are included when it's a CachedStacClient.
+        exit_code: The exit code main() is about to return.
+        sharder: The run's sharder; a sharded run records which shard it was.
+
+    Returns:
+        The report dictionary.
+    """
+    report: Dict[str, Any] = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "exit_code": exit_code,
+        "elapsed_s": time.perf_counter() - stats.start_time,
+        "records_per_s": stats.throughput(),
+        "outcomes": {
+            "total": stats.completed_count,
+            OUTCOME_SUCCESS: stats.success_count,
+            OUTCOME_NO_COVERAGE: stats.no_coverage_count,
+            OUTCOME_FAILURE: stats.failure_count,
+            OUTCOME_SKIPPED: stats.skipped_count,
+        },
+        "settings": {
+            "mode": config["EXECUTION"]["MODE"],
+            "max_workers": config["EXECUTION"]["MAX_WORKERS"],
+            "cpu_workers": config["EXECUTION"]["CPU_WORKERS"],
+            "batch_search": config["STAC"]["BATCH_SEARCH"],
+            "group_reads_by_asset": config["EXECUTION"]["GROUP_READS_BY_ASSET"],
+            "async_writer": config["OUTPUT"]["ASYNC_WRITER"],
+            "image_format": config["OUTPUT"]["IMAGE_FORMAT"],
+            "tiling": config["TILING"]["ENABLED"],
+        },
+        "stages": stats.timings.summary(),
+    }
+    if isinstance(stac_client, CachedStacClient):
+        report["stac_cache"] = {"hits": stac_client.cache.hits, "misses": stac_client.cache.misses}
+    if sharder is not None and sharder.enabled:
+        report["shard"] = {"index": sharder.shard_index, "count": sharder.shard_count, "strategy": sharder.strategy}
+    return report
+
+
+def write_run_report(report: Dict[str, Any], report_path: pathlib.Path) -> None:
+    """Writes the report as pretty JSON, via a temp file so a crash never leaves half a report behind."""
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = report_path.with_name(report_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    os.replace(tmp_path, report_path)
+
+
+def log_stage_timings(stage_summary: Dict[str, Dict[str, float]]) -> None:
+    """One log line per stage so the bottleneck is visible without opening the report."""
+    for stage, summary in stage_summary.items():
+        logger.info(
+            f"Stage {stage:<17} n={summary['count']:<7} total={summary['total_s']:8.1f}s "
+            f"p50={summary['p50_s'] * 1000:8.1f}ms p95={summary['p95_s'] * 1000:8.1f}ms p99={summary['p99_s'] * 1000:8.1f}ms"
+        )
+
+
+class RunProfiler:
+    """
+    Optional profiler around the processing run (context manager).
+
+    "cprofile" dumps a .prof file (pstats / snakeviz), "pyinstrument" writes an .html
+    call tree. Both only see the thread that started them, so in concurrent mode the
+    worker threads' time shows up as waiting in the main thread - use sequential mode
+    (or the run report's stage timings) to look inside the stages.
+    """
+
+    def __init__(self, profiler: Optional[str], output_base: pathlib.Path):
+        """
+        Args:
+            profiler: None, "cprofile" or "pyinstrument".
+            output_base: Output path without extension (.prof / .html is appended).
+
+        Raises:
+            ValueError: If the profiler name is not recognised.
+            ImportError: If "pyinstrument" was asked for but isn't installed.
+        """
+        if profiler not in (None, "cprofile", "pyinstrument"):
+            raise ValueError(f"Unsupported PROFILER '{profiler}'. Expected None, 'cprofile' or 'pyinstrument'.")
+        self.profiler_name: Optional[str] = profiler
+        self.output_base: pathlib.Path = output_base
+        self._profiler: Any = None
+        if profiler == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+        elif profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise ImportError("PROFILER='pyinstrument' requires pyinstrument (pip install pyinstrument).") from e
+            self._profiler = Profiler()
+
+    def __enter__(self) -> "RunProfiler":
+        if self.profiler_name == "cprofile":
+            self._profiler.enable()
+        elif self.profiler_name == "pyinstrument":
+            self._profiler.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._profiler is None:
+            return
+        self.output_base.parent.mkdir(parents=True, exist_ok=True)
+        if self.profiler_name == "cprofile":
+            self._profiler.disable()
+            output_path = self.output_base.with_name(self.output_base.name + ".prof")
+            self._profiler.dump_stats(str(output_path))
+        else:
+            self._profiler.stop()
+            output_path = self.output_base.with_name(self.output_base.name + ".html")
+            output_path.write_text(self._profiler.output_html(), encoding="utf-8")
+        logger.info(f"Profile ({self.profiler_name}) written to {output_path}")
+
+
+# --- Main Execution Logic ---
+# Input file suffix -> (SOURCE_TYPE, INPUT_DATA key holding its path), for --input
+INPUT_SUFFIXES: Dict[str, Tuple[str, str]] = {
+    ".json": ("json", "JSON_FILE_PATH"),
+    ".geojson": ("json", "JSON_FILE_PATH"),
+    ".geojsonl": ("ndjson", "NDJSON_FILE_PATH"),
+    ".geojsons": ("ndjson", "NDJSON_FILE_PATH"),
+    ".ndjson": ("ndjson", "NDJSON_FILE_PATH"),
+    ".jsonl": ("ndjson", "NDJSON_FILE_PATH"),
+    ".gpkg": ("gpkg", "VECTOR_FILE_PATH"),
+    ".fgb": ("fgb", "VECTOR_FILE_PATH"),
+}
+
+
+def load_config_file(config_path: pathlib.Path) -> Dict[str, Any]:
+    """
+    Reads a TOML (.toml) or YAML (.yaml/.yml) file of CONFIG overrides, laid out like CONFIG:
+
+        [EXECUTION]
+        MODE = "concurrent"
+        MAX_WORKERS = 16
+
+    Raises:
+        ValueError: If the suffix isn't recognised or the file isn't a table of sections.
+        ImportError: For YAML without PyYAML installed.
+    """
+    suffix = config_path.suffix.lower()
+    if suffix == ".toml":
+        import tomllib
+        with config_path.open("rb") as f:
+            overrides = tomllib.load(f)
+    elif suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("YAML config files require PyYAML (pip install pyyaml); TOML works out of the box.") from e
+        with config_path.open("r", encoding="utf-8") as f:
+            overrides = yaml.safe_load(f) or {}
+    else:
+        raise ValueError(f"Unsupported config file type '{config_path.suffix}'. Expected .toml, .yaml or .yml.")
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{config_path} must contain a table of CONFIG sections.")
+    return overrides
+
+
+def apply_config_overrides(config: Dict[str, Any], overrides: Dict[str, Any], source: str, _path: str = "") -> None:
+    """
+    Merges overrides into config in place. Section and key names are case-insensitive, nested
+    tables (e.g. RASTER_IO.GDAL_OPTIONS) merge key by key, and strings become pathlib.Path
+    wherever CONFIG holds a path.
+
+    Args:
+        config: The (section of the) configuration dictionary to update.
+        overrides: Values to apply, shaped like config.
+        source: Where the overrides came from, for error messages.
+
+    Raises:
+        ValueError: On a section or key CONFIG doesn't have (catches typos before a long run
+            silently ignores them). Free-form tables like GDAL_OPTIONS accept new keys.
+    """
+    free_form = _path.endswith("GDAL_OPTIONS")
+    for raw_key, value in overrides.items():
+        key = str(raw_key) if free_form else str(raw_key).upper()
+        dotted = f"{_path}.{key}" if _path else key
+        if key not in config and not free_form:
+            raise ValueError(f"Unknown setting {dotted} in {source}.")
+        current = config.get(key)
+        if isinstance(current, dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"{dotted} in {source} is a section; give it a table of settings, not a single value.")
+            apply_config_overrides(current, value, source, dotted)
+        elif isinstance(current, pathlib.Path) and value is not None:
+            config[key] = pathlib.Path(value)
+        else:
+            config[key] = value
+
+
+def parse_set_override(assignment: str) -> Dict[str, Any]:
+    """
+    Turns a --set "SECTION.KEY=VALUE" into a nested override dict. VALUE is read as JSON when
+    it parses (16, 0.5, true, null, ["a"]) and as a plain string otherwise.
+
+    Raises:
+        ValueError: If the assignment isn't of the form SECTION.KEY=VALUE.
+    """
+    dotted, separator, raw_value = assignment.partition("=")
+    keys = [part for part in dotted.strip().split(".") if part]
+    if not separator or len(keys) < 2:
+        raise ValueError(f"--set expects SECTION.KEY=VALUE, got '{assignment}'.")
+    try:
+        value: Any = json.loads(raw_value)
+    except json.JSONDecodeError:
+        value = raw_value
+    override: Dict[str, Any] = {keys[-1]: value}
+    for key in reversed(keys[:-1]):
+        override = {key: override}
+    return override
+
+
+def input_overrides(input_path: pathlib.Path) -> Dict[str, Any]:
+    """CONFIG overrides for --input: SOURCE_TYPE from the file suffix, plus the matching path key."""
+    if input_path.suffix.lower() not in INPUT_SUFFIXES:
+        raise ValueError(f"Can't tell the input type of '{input_path}'. Use one of {sorted(INPUT_SUFFIXES)} or set INPUT_DATA in a config file.")
+    source_type, path_key = INPUT_SUFFIXES[input_path.suffix.lower()]
+    return {"INPUT_DATA": {"SOURCE_TYPE": source_type, path_key: input_path}}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses the command line flags that override CONFIG for a run."""
+    parser = argparse.ArgumentParser(
+        description="Extract NAIP image chips for substation features.",
+        epilog="Overrides apply in order: CONFIG defaults, --config file, --set, then the dedicated flags.",
+    )
+    parser.add_argument("--config", type=pathlib.Path, default=None,
+                        help="TOML or YAML file of CONFIG overrides, with one table per CONFIG section.")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="Override one CONFIG value; repeatable. VALUE is parsed as JSON if it can be (e.g. --set EXECUTION.MAX_WORKERS=16).")
+    parser.add_argument("--input", type=pathlib.Path, default=None,
+                        help="Input substation file; the type comes from the suffix (.json, .geojsonl/.ndjson, .gpkg, .fgb).")
+    parser.add_argument("--output-dir", type=pathlib.Path, default=None,
+                        help="Folder for the chip images (OUTPUT.IMAGE_FOLDER).")
+    parser.add_argument("--mode", choices=["sequential", "concurrent"], default=None,
+                        help="Execution mode (EXECUTION.MODE).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="I/O threads in concurrent mode (EXECUTION.MAX_WORKERS).")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=None,
+                        help="Logging level (LOGGING.LEVEL).")
+    parser.add_argument("--plan", "--dry-run", dest="plan", action="store_true",
+                        help="Read the input and report feature counts, UTM zones and the STAC searches a run would make, "
+                             "without any catalog requests or raster I/O.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Replay STAC results from the local cache only; no catalog requests are made.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip features the run manifest records as done with unchanged geometry and imagery.")
+    parser.add_argument("--report", type=pathlib.Path, default=None,
+                        help="Write the JSON run report (outcomes + per-stage timing percentiles) to this path. "
+                             "Sharded runs suffix it per shard; pass the same path with --merge-shards to merge them.")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"], default=None,
+                        help="Profile the processing run; output goes to REPORTING.PROFILE_PATH (.prof / .html).")
+    parser.add_argument("--shard-index", type=int, default=None,
+                        help="Process only this 0-based shard of the input (default: $JOB_COMPLETION_INDEX).")
+    parser.add_argument("--shard-count", type=int, default=None,
+                        help="Total number of shards the input is split into (default: $NAIP_SHARD_COUNT, else 1).")
+    parser.add_argument("--merge-shards", action="store_true",
+                        help="Don't process anything; merge the per-shard reports (and manifests) into the base paths.")
+    return parser.parse_args(argv)
+
+
+def build_run_plan(records: Iterable[SubstationRecord], config: Dict[str, Any], sharder: RecordSharder) -> Dict[str, Any]:
+    """
+    Dry run: streams the (sharded) input and works out what a run would do, with no STAC
+    requests, no raster I/O and without importing the geospatial stack.
+
+    The UTM zone and batch-search cell of each feature come from its bbox centre. The processor uses
+    the representative point / buffered centroid, which only differs for features sitting right on a
+    zone or cell edge, so the counts are estimates.
+
+    Args:
+        records: The input records (already filtered to this shard).
+        config: The global configuration dictionary.
+        sharder: The run's sharder, reported in the plan.
+
+    Returns:
+        A JSON-able dict of counts and settings.
+    """
+    stac_config = config["STAC"]
+    feature_count = 0
+    invalid_count = 0
+    seen_ids: set = set()
+    duplicate_ids = 0
+    zone_counts: Dict[int, int] = defaultdict(int)
+    grid_cells: set = set()
+    cell_size = stac_config["BATCH_GRID_DEGREES"]
+
+    for record_index, record in enumerate(records):
+        feature_count += 1
+        geometry = record.get("geometry") if isinstance(record, dict) else None
+        bounds = _geojson_bounds(geometry) if isinstance(geometry, dict) else None
+        if bounds is None:
+            invalid_count += 1
+            continue
+        center_lon, center_lat = (bounds[0] + bounds[2]) / 2.0, (bounds[1] + bounds[3]) / 2.0
+        try:
+            zone_counts[utm_epsg(center_lat, center_lon)] += 1
+        except ValueError:
+            invalid_count += 1
+            continue
+        grid_cells.add((math.floor(center_lon / cell_size), math.floor(center_lat / cell_size)))
+        feature_id = record.get("full_id") or record.get("id") or f"index_{record_index}"
+        if feature_id in seen_ids:
+            duplicate_ids += 1
+        seen_ids.add(feature_id)
+
+    valid_count = feature_count - invalid_count
+    if not stac_config["BATCH_SEARCH"]:
+        searches, search_unit = valid_count, "per feature"
+    elif stac_config["BATCH_GROUPING"] == "utm_zone":
+        searches, search_unit = len(zone_counts), "per UTM zone (paged)"
+    else:
+        searches, search_unit = len(grid_cells), f"per {cell_size} deg cell (paged)"
+
+    return {
+        "shard": sharder.label if sharder.enabled else None,
+        "features": feature_count,
+        "valid_geometries": valid_count,
+        "invalid_geometries": invalid_count,
+        "duplicate_ids": duplicate_ids,
+        "utm_zones": {f"EPSG:{epsg}": count for epsg, count in sorted(zone_counts.items(), key=lambda kv: -kv[1])},
+        "stac_searches": searches,
+        "stac_search_unit": search_unit,
+        "stac_cache": "offline" if config["STAC_CACHE"]["OFFLINE"] else ("enabled" if config["STAC_CACHE"]["ENABLED"] else "off"),
+        "mode": config["EXECUTION"]["MODE"],
+        "max_workers": config["EXECUTION"]["MAX_WORKERS"],
+        "outputs": {
+            "image_format": config["OUTPUT"]["IMAGE_FORMAT"],
+            "image_folder": str(config["OUTPUT"]["IMAGE_FOLDER"]),
+            "fixed_size_chips": config["CHIP"]["FIXED_SIZE"],
+            "tiles": config["TILING"]["ENABLED"],
+            "time_stacks": config["TEMPORAL"]["ENABLED"],
+            "masks": config["MASK"]["MODE"] if config["MASK"]["ENABLED"] else None,
+            "chip_index": config["INDEX"]["ENABLED"],
+        },
+    }
+
+
+def log_run_plan(plan: Dict[str, Any]) -> None:
+    """Logs a --plan result in the same style as the end-of-run summary."""
+    logger.info("=== Run Plan (dry run, nothing was searched, read or written) ===")
+    if plan["shard"]:
+        logger.info(f"Shard: {plan['shard']}")
+    logger.info(f"Features: {plan['features']} ({plan['valid_geometries']} with usable geometry, "
+                f"{plan['invalid_geometries']} would be skipped, {plan['duplicate_ids']} duplicate ids)")
+    zones = ", ".join(f"{epsg} x{count}" for epsg, count in plan["utm_zones"].items())
+    logger.info(f"UTM zones ({len(plan['utm_zones'])}): {zones or 'none'}")
+    cache_note = "" if plan["stac_cache"] == "off" else f", STAC cache {plan['stac_cache']} so cached ones won't reach the catalog"
+    logger.info(f"Estimated STAC searches: {plan['stac_searches']} ({plan['stac_search_unit']}{cache_note})")
+    logger.info(f"Execution: {plan['mode']} mode, {plan['max_workers']} I/O workers")
+    logger.info(f"Outputs: {json.dumps(plan['outputs'])}")
+    logger.info("===================================")
+
+
+def merge_shard_outputs(config: Dict[str, Any]) -> int:
+    """
+    The merge step after a sharded run: folds every shard report next to RUN_REPORT_PATH into
+    RUN_REPORT_PATH, every shard manifest next to MANIFEST_PATH into MANIFEST_PATH, and every
+    shard chip index next to INDEX.PATH into the main index.
+
+    Returns:
+        The exit code (1 if there was nothing to merge).
+    """
+    report_path = config["REPORTING"]["RUN_REPORT_PATH"]
+    report_paths = _shard_siblings(report_path) if report_path is not None else []
+    manifest_paths = _shard_siblings(config["INCREMENTAL"]["MANIFEST_PATH"])
+    index_paths = [path for path in _shard_siblings(config["INDEX"]["PATH"]) if path.suffix in (".parquet", ".npy")]
+    if not report_paths and not manifest_paths and not index_paths:
+        logger.error("No shard reports, manifests or chip indexes found to merge.")
+        return 1
+
+    if report_paths:
+        merged = merge_shard_reports(report_paths)
+        write_run_report(merged, pathlib.Path(report_path))
+        logger.info(f"Merged {len(report_paths)} shard reports into {report_path}: {merged['outcomes']}")
+        log_stage_timings(merged["stages"])
+    if manifest_paths:
+        merged_count = merge_shard_manifests(manifest_paths, config["INCREMENTAL"]["MANIFEST_PATH"])
+        logger.info(f"Merged {merged_count} entries from {len(manifest_paths)} shard manifests into {config['INCREMENTAL']['MANIFEST_PATH']}")
+    if index_paths:
+        index_writer = ChipIndexWriter(config["INDEX"])
+        for path in index_paths:
+            index_writer.extend(ChipIndex.load(path))
+        index_writer.close()
+    return 0
+
+
+def configure_from_args(args: argparse.Namespace, config: Dict[str, Any]) -> None:
+    """
+    Applies the CLI to config: the --config file, then each --set, then the dedicated flags.
+
+    Raises:
+        ValueError, ImportError, OSError: On a bad config file, override or --input path.
+    """
+    if args.config is not None:
+        apply_config_overrides(config, load_config_file(args.config), str(args.config))
+    for assignment in args.overrides:
+        apply_config_overrides(config, parse_set_override(assignment), f"--set {assignment}")
+    if args.input is not None:
+        apply_config_overrides(config, input_overrides(args.input), "--input")
+    if args.output_dir is not None:
+        config["OUTPUT"]["IMAGE_FOLDER"] = args.output_dir
+    if args.mode is not None:
+        config["EXECUTION"]["MODE"] = args.mode
+    if args.workers is not None:
+        config["EXECUTION"]["MAX_WORKERS"] = args.workers
+    if args.log_level is not None:
+        config["LOGGING"]["LEVEL"] = args.log_level
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to orchestrate the data loading and processing workflow."""
+    args = parse_args(argv)
+    try:
+        configure_from_args(args, CONFIG)
+    except (ValueError, ImportError, OSError) as e:
+        setup_logging(CONFIG["LOGGING"])
+        logger.critical(f"Invalid configuration. Terminating workflow. Error: {e}")
+        sys.exit(1)
+    setup_logging(CONFIG["LOGGING"])
+    if args.offline:
+        CONFIG["STAC_CACHE"]["ENABLED"] = True
+        CONFIG["STAC_CACHE"]["OFFLINE"] = True
+    if args.incremental:
+        CONFIG["INCREMENTAL"]["ENABLED"] = True
+    if args.report is not None:
+        CONFIG["REPORTING"]["RUN_REPORT_PATH"] = args.report
+    if args.profile is not None:
+        CONFIG["REPORTING"]["PROFILER"] = args.profile
+    if args.shard_index is not None:
+        CONFIG["SHARDING"]["SHARD_INDEX"] = args.shard_index
+    if args.shard_count is not None:
+        CONFIG["SHARDING"]["SHARD_COUNT"] = args.shard_count
+
+    if args.merge_shards:
+        sys.exit(merge_shard_outputs(CONFIG))
+
+    logger.info("=== Starting Substation NAIP Image Processing Workflow ===")
+
+    try:
+        sharder = RecordSharder(CONFIG["SHARDING"])
+    except ValueError as e:
+        logger.critical(f"Invalid sharding settings. Terminating workflow. Error: {e}")
+        sys.exit(1)
+    try:
+        validate_mask_config(CONFIG["MASK"], CONFIG["OUTPUT"])
+    except ValueError as e:
+        logger.critical(f"Invalid mask settings. Terminating workflow. Error: {e}")
+        sys.exit(1)
+    if CONFIG["STAC"]["BATCH_SEARCH"]:
+        try:
+            BatchStacSearcher.validate_config(CONFIG["STAC"])
+        except ValueError as e:
+            logger.critical(f"Invalid batch search settings. Terminating workflow. Error: {e}")
+            sys.exit(1)
+    report_path = CONFIG["REPORTING"]["RUN_REPORT_PATH"]
+    if report_path is not None:
+        report_path = sharder.shard_path(report_path)
+    if sharder.enabled:
+        logger.info(f"Sharded run: {sharder.label} ({sharder.strategy} strategy), processing only this shard's records.")
+
+    # --- Load Data ---
+    # Records are streamed lazily; peek at the first one so an empty input exits before any setup
+    try:
+        record_stream = SubstationDataLoader.open_stream(CONFIG["INPUT_DATA"], CONFIG["GEOSPATIAL"]["TARGET_GEOGRAPHIC_CRS"])
+        first_record = next(record_stream, None)
+    except Exception as e:
+        logger.critical(f"Failed to load input data. Terminating workflow. Error: {e}", exc_info=True)
+        sys.exit(1)
+
+    if first_record is None:
+        logger.warning("Input data source is empty. No substations to process.")
+        sys.exit(0)
+    all_substation_data = sharder.filter(itertools.chain([first_record], record_stream))
+
+    if args.plan:
+        try:
+            log_run_plan(build_run_plan(all_substation_data, CONFIG, sharder))
+        except (json.JSONDecodeError, OSError) as e:
+            logger.critical(f"Input data stream failed part way through the plan: {e}", exc_info=True)
+            sys.exit(1)
+        return
+
+    # --- Initialize STAC Client ---
+    try:
+        stac_client = open_stac_client(CONFIG)
+        logger.info("STAC client initialized successfully.")
+    except Exception as e:
+        logger.critical(f"Failed to initialize STAC client. Terminating workflow. Error: {e}", exc_info=True)
+        sys.exit(1)
+
+    # --- Process Each Substation ---
+    execution_mode = CONFIG["EXECUTION"]["MODE"]
+    stats = ProcessingStats(None, CONFIG["EXECUTION"]["PROGRESS_INTERVAL"])
+
+    logger.info(f"Beginning processing of streamed substation records ({execution_mode} mode)...")
+
+    try:
+        run_profiler = RunProfiler(CONFIG["REPORTING"]["PROFILER"], sharder.shard_path(CONFIG["REPORTING"]["PROFILE_PATH"]))
+    except (ValueError, ImportError) as e:
+        logger.critical(f"Failed to set up the profiler. Terminating workflow. Error: {e}")
+        sys.exit(1)
+
+    manifest: Optional[RunManifest] = None
+    if CONFIG["INCREMENTAL"]["ENABLED"]:
+        manifest_path = CONFIG["INCREMENTAL"]["MANIFEST_PATH"]
+        manifest = RunManifest(sharder.shard_path(manifest_path), base_path=manifest_path,
+                               output_fingerprint=output_fingerprint(CONFIG))
+        stats.completion_hooks.append(manifest.record)
+
+    chip_index: Optional[ChipIndexWriter] = None
+    if CONFIG["INDEX"]["ENABLED"]:
+        try:
+            chip_index = ChipIndexWriter(CONFIG["INDEX"], sharder.shard_path(CONFIG["INDEX"]["PATH"]))
+        except ValueError as e:
+            logger.critical(f"Invalid chip index settings. Terminating workflow. Error: {e}")
+            sys.exit(1)
+        stats.completion_hooks.append(chip_index.record)
+
+    exit_code = 0
+    try:
+        with run_profiler:
+            if execution_mode == "sequential":
+                run_sequential(all_substation_data, stac_client, CONFIG, stats, manifest=manifest)
+            elif execution_mode == "concurrent":
+                run_concurrent(all_substation_data, stac_client, CONFIG, stats, manifest=manifest)
+            else:
+                logger.critical(f"Unsupported execution mode: {execution_mode}. Expected 'sequential' or 'concurrent'.")
+                sys.exit(1)
+    except (json.JSONDecodeError, OSError) as e:
+        # The input is parsed lazily, so a corrupt file can surface mid-run; finished records are kept
+        logger.critical(f"Input data stream failed part way through the run: {e}", exc_info=True)
+        exit_code = 1
+    except Exception as e:
+        # Still close the manifest/index and write the report below, so whatever finished is kept and the failure is recorded
+        logger.critical(f"Unexpected error part way through the run: {e}", exc_info=True)
+        exit_code = 1
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if chip_index is not None:
+            try:
+                chip_index.close()
+            except (OSError, ImportError, ValueError) as e:
+                logger.error(f"Failed to write the chip index to {chip_index.index_path}: {e}", exc_info=True)
+        if isinstance(stac_client, CachedStacClient):
+            stac_client.close()
 
     # --- Final Summary ---
+    elapsed = time.perf_counter() - stats.start_time
     logger.info("=== Processing Workflow Complete ===")
-    logger.info(f"Total records processed: {total_records}")
-    logger.info(f"Successfully generated images: {success_count}")
-    logger.info(f"Records skipped due to no NAIP coverage: {no_coverage_count}")
-    logger.info(f"Records failed due to processing errors: {failure_count}")
+    logger.info(f"Total records processed: {stats.completed_count}")
+    logger.info(f"Successfully generated images: {stats.success_count}")
+    logger.info(f"Records skipped due to no NAIP coverage: {stats.no_coverage_count}")
+    logger.info(f"Records failed due to processing errors: {stats.failure_count}")
+    if manifest is not None:
+        logger.info(f"Records skipped as unchanged since the last run: {stats.skipped_count}")
+    logger.info(f"Elapsed time: {elapsed:.1f}s ({stats.throughput():.2f} records/s)")
+    report = build_run_report(stats, CONFIG, stac_client, exit_code, sharder=sharder)
+    log_stage_timings(report["stages"])
     logger.info("===================================")
+    if report_path is not None:
+        try:
+            write_run_report(report, pathlib.Path(report_path))
+            logger.info(f"Run report written to {report_path}")
+        except OSError as e:
+            logger.error(f"Failed to write run report to {report_path}: {e}")
+    if exit_code:
+        sys.exit(exit_code)
 
 if __name__ == "__main__":
     #  & run :)
@@ -0,0 +1,61 @@
+from rasterio.windows import Window
+
+from naip_pull import _cluster_windows
+
+
+def _cluster(windows, max_pixels=10_000_000):
+    return _cluster_windows(list(enumerate(windows)), max_pixels)
+
+
+def test_lone_window_is_read_as_is():
+    window = Window(10, 20, 100, 50)
+    assert _cluster([window]) == [(window, [(0, window)])]
+
+
+def test_overlapping_windows_share_one_union_read():
+    a, b = Window(0, 0, 100, 100), Window(50, 0, 100, 100)
+    [(union, members)] = _cluster([a, b])
+    assert union == Window(0, 0, 150, 100)
+    assert members == [(0, a), (1, b)]
+
+
+def test_disjoint_windows_stay_separate():
+    a, b = Window(0, 0, 100, 100), Window(100, 0, 100, 100) # Touching edges don't overlap
+    assert [members for _, members in _cluster([a, b])] == [[(0, a)], [(1, b)]]
+
+
+def test_diagonal_neighbours_are_not_merged():
+    # The union would be 190x190 = 36100 px against 20000 px read separately
+    a, b = Window(0, 0, 100, 100), Window(90, 90, 100, 100)
+    assert len(_cluster([a, b])) == 2
+
+
+def test_union_never_costs_more_than_the_separate_reads():
+    windows = [Window(0, 0, 100, 100), Window(50, 0, 100, 100), Window(0, 50, 150, 100), Window(120, 120, 60, 60)]
+    for union, members in _cluster(windows):
+        if len(members) > 1:
+            assert union.width * union.height <= sum(w.width * w.height for _, w in members)
+
+
+def test_pixel_budget_caps_the_union():
+    a, b = Window(0, 0, 100, 100), Window(50, 0, 100, 100)
+    assert len(_cluster([a, b], max_pixels=150 * 100)) == 1
+    assert len(_cluster([a, b], max_pixels=150 * 100 - 1)) == 2
+
+
+def test_fractional_windows_are_never_merged():
+    a, b = Window(0.5, 0, 100, 100), Window(50, 0, 100, 100)
+    clusters = _cluster([a, b])
+    assert [members for _, members in clusters] == [[(0, a)], [(1, b)]]
+    assert clusters[0][0] is a
+
+
+def test_every_member_is_inside_its_union():
+    windows = [Window(col, row, 80, 80) for row in range(0, 300, 60) for col in range(0, 300, 60)]
+    clusters = _cluster(windows, max_pixels=200 * 200)
+    assert sorted(position for _, members in clusters for position, _ in members) == list(range(len(windows)))
+    for union, members in clusters:
+        assert union.width * union.height <= 200 * 200 or len(members) == 1
+        for _, w in members:
+            assert union.col_off <= w.col_off and w.col_off + w.width <= union.col_off + union.width
+            assert union.row_off <= w.row_off and w.row_off + w.height <= union.row_off + union.height
@@ -0,0 +1,74 @@
+import copy
+import pathlib
+
+import pytest
+
+from naip_pull import CONFIG, apply_config_overrides, parse_set_override
+
+
+@pytest.fixture
+def config():
+    return copy.deepcopy(CONFIG)
+
+
+@pytest.mark.parametrize("assignment, expected", [
+    ("EXECUTION.MAX_WORKERS=16", {"EXECUTION": {"MAX_WORKERS": 16}}),
+    ("CHIP.BUFFER_RATIO=0.5", {"CHIP": {"BUFFER_RATIO": 0.5}}),
+    ("MOSAIC.ENABLED=true", {"MOSAIC": {"ENABLED": True}}),
+    ("REPORTING.RUN_REPORT_PATH=null", {"REPORTING": {"RUN_REPORT_PATH": None}}),
+    ('OUTPUT.IMAGE_FORMAT="WEBP"', {"OUTPUT": {"IMAGE_FORMAT": "WEBP"}}),
+    ("OUTPUT.IMAGE_FORMAT=WEBP", {"OUTPUT": {"IMAGE_FORMAT": "WEBP"}}), # Not JSON, kept as a string
+    ('STAC.COLLECTIONS=["naip"]', {"STAC": {"COLLECTIONS": ["naip"]}}),
+    ("RASTER_IO.GDAL_OPTIONS.GDAL_HTTP_TIMEOUT=30", {"RASTER_IO": {"GDAL_OPTIONS": {"GDAL_HTTP_TIMEOUT": 30}}}),
+    ("OUTPUT.IMAGE_FOLDER=./out=1", {"OUTPUT": {"IMAGE_FOLDER": "./out=1"}}), # Only the first = splits
+    ("CHIP.BUFFER_RATIO=", {"CHIP": {"BUFFER_RATIO": ""}}),
+])
+def test_parse_set_override(assignment, expected):
+    assert parse_set_override(assignment) == expected
+
+
+@pytest.mark.parametrize("assignment", ["EXECUTION.MAX_WORKERS", "MAX_WORKERS=4", "=4", ".MAX_WORKERS=4"])
+def test_parse_set_override_rejects_malformed_assignments(assignment):
+    with pytest.raises(ValueError):
+        parse_set_override(assignment)
+
+
+def test_keys_are_case_insensitive(config):
+    apply_config_overrides(config, {"execution": {"max_workers": 3}}, "test")
+    assert config["EXECUTION"]["MAX_WORKERS"] == 3
+
+
+def test_unknown_keys_are_rejected(config):
+    with pytest.raises(ValueError, match="EXECUTION.MAX_WORKER"):
+        apply_config_overrides(config, {"EXECUTION": {"MAX_WORKER": 3}}, "test")
+    with pytest.raises(ValueError, match="EXECUTON"):
+        apply_config_overrides(config, {"EXECUTON": {"MAX_WORKERS": 3}}, "test")
+
+
+def test_a_section_needs_a_table(config):
+    with pytest.raises(ValueError):
+        apply_config_overrides(config, {"EXECUTION": 3}, "test")
+
+
+def test_path_settings_become_paths(config):
+    apply_config_overrides(config, {"OUTPUT": {"IMAGE_FOLDER": "/tmp/chips"}}, "test")
+    assert config["OUTPUT"]["IMAGE_FOLDER"] == pathlib.Path("/tmp/chips")
+
+
+def test_optional_paths_can_be_cleared(config):
+    apply_config_overrides(config, {"OUTPUT": {"IMAGE_FOLDER": None}}, "test")
+    assert config["OUTPUT"]["IMAGE_FOLDER"] is None
+
+
+def test_gdal_options_are_free_form_and_merge(config):
+    before = dict(config["RASTER_IO"]["GDAL_OPTIONS"])
+    apply_config_overrides(config, {"raster_io": {"gdal_options": {"CPL_DEBUG": "ON"}}}, "test")
+    # Keys inside GDAL_OPTIONS keep their case and add to the defaults
+    assert config["RASTER_IO"]["GDAL_OPTIONS"] == {**before, "CPL_DEBUG": "ON"}
+
+
+def test_overrides_leave_other_settings_alone(config):
+    apply_config_overrides(config, parse_set_override("EXECUTION.MAX_WORKERS=2"), "--set")
+    expected = copy.deepcopy(CONFIG)
+    expected["EXECUTION"]["MAX_WORKERS"] = 2
+    assert config == expected
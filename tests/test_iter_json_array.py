@@ -0,0 +1,108 @@
+import io
+import json
+
+import pytest
+
+from naip_pull import SubstationDataLoader
+
+DOCUMENTS = [
+    "[]",
+    " [ ] ",
+    "[2.5e10]",
+    "[-0.5]",
+    "[1, -2, 3.25, 4E-3, 1e+2, 0]",
+    '[true, false, null, "a,b]", "\\u00e9\\"x"]',
+    '[{"full_id": "a", "geometry": {"type": "Point", "coordinates": [-116.157, 43.56]}}, [1, [2, []]], {}]',
+    '[\n  {"id": 12345678901234567890, "v": -1.5e-7},\n  123456789\n]\n',
+]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_matches_json_loads_for_every_chunk_size(document):
+    expected = json.loads(document)
+    for chunk_size in range(1, len(document) + 2):
+        parsed = list(SubstationDataLoader.iter_json_array(io.StringIO(document), chunk_size))
+        assert parsed == expected, f"chunk_size={chunk_size}"
+
+
+@pytest.mark.parametrize("document", ["[1 2]", "[1,", "[{\"a\": 1}", "[1.5e]"])
+def test_invalid_documents_raise(document):
+    for chunk_size in range(1, len(document) + 2):
+        with pytest.raises(json.JSONDecodeError):
+            list(SubstationDataLoader.iter_json_array(io.StringIO(document), chunk_size))
+
+
+def test_non_array_document_raises_type_error():
+    with pytest.raises(TypeError):
+        list(SubstationDataLoader.iter_json_array(io.StringIO('{"a": 1}'), 4))
+
+
+class _CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.chars_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.chars_read += len(chunk)
+        return chunk
+
+
+def test_syntax_error_raises_without_reading_the_rest_of_the_file():
+    document = '[{"a": 1 "b": 2}, ' + ", ".join(['{"pad": "' + "x" * 100 + '"}'] * 1000) + "]"
+    reader = _CountingReader(document)
+    with pytest.raises(json.JSONDecodeError):
+        list(SubstationDataLoader.iter_json_array(reader, 64))
+    assert reader.chars_read < 1024
+
+
+def test_json_stream_flattens_geojson_features(tmp_path):
+    path = tmp_path / "features.json"
+    path.write_text(json.dumps([
+        {"type": "Feature", "id": 7, "properties": {"full_id": "way/1", "name": "North"},
+         "geometry": {"type": "Point", "coordinates": [-116.2, 43.6]}},
+        {"full_id": "node/2", "geometry": {"type": "Point", "coordinates": [-93.3, 44.9]}},
+    ]), encoding="utf-8")
+    records = list(SubstationDataLoader._stream_json(path, 16))
+    assert records[0] == {"full_id": "way/1", "name": "North", "id": 7, "geometry": {"type": "Point", "coordinates": [-116.2, 43.6]}}
+    assert records[1]["full_id"] == "node/2"
+
+
+FEATURE_COLLECTION = {
+    "type": "FeatureCollection",
+    "name": "substations",
+    "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}},
+    "features": [
+        {"type": "Feature", "properties": {"full_id": "way/1", "name": "North"},
+         "geometry": {"type": "Polygon", "coordinates": [[[-116.2, 43.6], [-116.19, 43.6], [-116.19, 43.61], [-116.2, 43.6]]]}},
+        {"type": "Feature", "properties": {"full_id": "node/2"}, "geometry": {"type": "Point", "coordinates": [-93.3, 44.9]}},
+    ],
+    "bbox": [-116.2, 43.6, -93.3, 44.9],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1 << 20])
+def test_streams_feature_collection_features(chunk_size):
+    document = json.dumps(FEATURE_COLLECTION, indent=1)
+    parsed = list(SubstationDataLoader.iter_json_array(io.StringIO(document), chunk_size))
+    assert parsed == FEATURE_COLLECTION["features"]
+
+
+@pytest.mark.parametrize("document", ['{"type": "FeatureCollection"}', '{}', '{"features": {"a": 1}}'])
+def test_object_without_features_array_raises_type_error(document):
+    with pytest.raises(TypeError):
+        list(SubstationDataLoader.iter_json_array(io.StringIO(document), 4))
+
+
+def test_geojson_input_plans_from_a_feature_collection_file(tmp_path):
+    import naip_pull
+
+    path = tmp_path / "substations.geojson"
+    path.write_text(json.dumps(FEATURE_COLLECTION), encoding="utf-8")
+    config = {section: dict(values) for section, values in naip_pull.CONFIG.items()}
+    naip_pull.configure_from_args(naip_pull.parse_args(["--input", str(path)]), config)
+    records = list(naip_pull.SubstationDataLoader.open_stream(config["INPUT_DATA"], "EPSG:4326"))
+    assert [record["full_id"] for record in records] == ["way/1", "node/2"]
+    plan = naip_pull.build_run_plan(records, config, naip_pull.RecordSharder(config["SHARDING"], environ={}))
+    assert plan["valid_geometries"] == 2
+    assert plan["utm_zones"] == {"EPSG:32611": 1, "EPSG:32615": 1}
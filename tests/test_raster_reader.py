@@ -0,0 +1,69 @@
+import pytest
+from rasterio.errors import RasterioIOError
+
+from naip_pull import RasterReader
+
+
+@pytest.mark.parametrize("message", [
+    "HTTP response code: 503",
+    "HTTP response code: 429",
+    "CURL error: Operation timed out after 30000 milliseconds with 0 bytes received",
+    "CURL error: Connection reset by peer",
+    "Read or write failed. IReadBlock failed at X offset 1, Y offset 2",
+    "CURL error: OpenSSL SSL_read: SSL_ERROR_SYSCALL, errno 104",
+    "CURL error: SSL connection timeout",
+    "CURL error: OpenSSL SSL_read: error:0A000126:SSL routines::unexpected eof while reading",
+    "CURL error: Could not resolve host: naipeuwest.blob.core.windows.net",
+])
+def test_transient_errors_are_retried(message):
+    assert RasterReader.is_transient(RasterioIOError(message))
+
+
+@pytest.mark.parametrize("message", [
+    "HTTP response code: 403",
+    "HTTP response code: 404",
+    "/data/missing.tif: No such file or directory",
+    "'/data/bad.tif' not recognized as being in a supported file format.",
+    "TIFFReadEncodedTile() failed. Read or write failed",
+    "LZWDecode:Corrupted LZW table at scanline 0",
+    "CURL error: SSL certificate problem: unable to get local issuer certificate",
+    "CURL error: SSL: no alternative certificate subject name matches target host name 'example.com'",
+    "Something nobody has seen before",
+])
+def test_permanent_errors_are_raised_straight_away(message):
+    assert not RasterReader.is_transient(RasterioIOError(message))
+
+
+def test_only_rasterio_io_errors_are_transient():
+    assert not RasterReader.is_transient(TimeoutError("timed out"))
+
+
+def test_retry_gives_up_immediately_on_permanent_errors():
+    reader = RasterReader({"GDAL_OPTIONS": {}, "GDAL_CACHEMAX_MB": 0, "MAX_RETRIES": 3,
+                           "RETRY_BACKOFF_SECONDS": 0.0, "RETRY_BACKOFF_MAX_SECONDS": 0.0})
+    calls = []
+
+    def operation():
+        calls.append(1)
+        raise RasterioIOError("/data/missing.tif: No such file or directory")
+
+    metrics = {}
+    with pytest.raises(RasterioIOError):
+        reader.retry(operation, "open", metrics)
+    assert len(calls) == 1 and "retries" not in metrics
+
+
+def test_retry_recovers_from_transient_errors():
+    reader = RasterReader({"GDAL_OPTIONS": {}, "GDAL_CACHEMAX_MB": 0, "MAX_RETRIES": 3,
+                           "RETRY_BACKOFF_SECONDS": 0.0, "RETRY_BACKOFF_MAX_SECONDS": 0.0})
+    attempts = iter([RasterioIOError("HTTP response code: 503"), RasterioIOError("Connection reset by peer"), None])
+
+    def operation():
+        error = next(attempts)
+        if error is not None:
+            raise error
+        return "ok"
+
+    metrics = {}
+    assert reader.retry(operation, "read", metrics) == "ok"
+    assert metrics["retries"] == 2
@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+
+import pytest
+
+from naip_pull import CONFIG, RecordSharder
+
+
+def _sharding(**overrides):
+    return {**CONFIG["SHARDING"], **overrides}
+
+
+def _records(count, seed=0):
+    # Substations cluster: most records sit in a handful of metro areas
+    rng = random.Random(seed)
+    metros = [(-118.25, 34.05), (-87.63, 41.88), (-95.37, 29.76), (-74.0, 40.71), (-112.07, 33.45)]
+    records = []
+    for i in range(count):
+        lon, lat = rng.choice(metros)
+        lon, lat = lon + rng.gauss(0, 0.3), lat + rng.gauss(0, 0.3)
+        records.append({
+            "full_id": f"way/{i}",
+            "geometry": {"type": "Polygon", "coordinates": [[[lon, lat], [lon + 0.001, lat], [lon + 0.001, lat + 0.001],
+                                                             [lon, lat + 0.001], [lon, lat]]]},
+        })
+    return records
+
+
+def _split(records, count, **overrides):
+    shards = [RecordSharder(_sharding(SHARD_INDEX=i, SHARD_COUNT=count, **overrides), environ={}) for i in range(count)]
+    return [[record["full_id"] for record in sharder.filter(iter(records))] for sharder in shards]
+
+
+def test_hash_is_the_default_strategy():
+    assert RecordSharder(_sharding(), environ={}).strategy == "hash"
+
+
+@pytest.mark.parametrize("strategy", ["hash", "spatial"])
+@pytest.mark.parametrize("count", [1, 2, 7, 16])
+def test_every_record_lands_on_exactly_one_shard(strategy, count):
+    records = _records(500)
+    split = _split(records, count, STRATEGY=strategy)
+    assigned = Counter(full_id for shard in split for full_id in shard)
+    assert set(assigned) == {record["full_id"] for record in records}
+    assert set(assigned.values()) == {1}
+
+
+def test_assignment_is_deterministic():
+    records = _records(200)
+    assert _split(records, 5) == _split(records, 5)
+
+
+def test_hash_split_is_balanced():
+    sizes = [len(shard) for shard in _split(_records(2000), 8)]
+    assert min(sizes) > 0.8 * 2000 / 8
+    assert max(sizes) < 1.2 * 2000 / 8
+
+
+def test_spatial_keeps_neighbours_together():
+    sharder = RecordSharder(_sharding(SHARD_COUNT=4, SHARD_INDEX=0, STRATEGY="spatial"), environ={})
+    near = [{"geometry": {"type": "Point", "coordinates": [-118.30 + dx, 34.10]}} for dx in (0.0, 0.01, 0.02)]
+    assert len({sharder.shard_key(record, i) for i, record in enumerate(near)}) == 1
+
+
+def test_id_less_records_get_their_global_position():
+    records = [{"geometry": None} for _ in range(10)]
+    sharder = RecordSharder(_sharding(SHARD_INDEX=1, SHARD_COUNT=3), environ={})
+    kept = list(sharder.filter(iter(records)))
+    assert kept and all(record["id"].startswith("index_") for record in kept)
+    assert all(sharder.shard_of({"geometry": None}, int(record["id"].split("_")[1])) == 1 for record in kept)
+
+
+def test_index_and_count_fall_back_to_the_environment():
+    sharder = RecordSharder(_sharding(), environ={"JOB_COMPLETION_INDEX": "2", "NAIP_SHARD_COUNT": "4"})
+    assert (sharder.shard_index, sharder.shard_count, sharder.label) == (2, 4, "shard-002-of-004")
+
+
+@pytest.mark.parametrize("overrides", [
+    {"SHARD_COUNT": 0},
+    {"SHARD_COUNT": 2, "SHARD_INDEX": 2},
+    {"SHARD_COUNT": 2, "SHARD_INDEX": 0, "STRATEGY": "random"},
+])
+def test_invalid_settings_are_rejected(overrides):
+    with pytest.raises(ValueError):
+        RecordSharder(_sharding(**overrides), environ={})
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from naip_pull import OUTCOME_SUCCESS, RunManifest
+
+
+def _processor(tmp_path, mosaic_ids=(), temporal_mosaic_ids=None):
+    return SimpleNamespace(
+        feature_id="way/1",
+        geometry_hash="abc",
+        selected_stac_item_id="m_3911701_ne_11_060_20220101",
+        selected_stac_item_datetime="2022-01-01T00:00:00+00:00",
+        source_gsd=0.6,
+        output_path=tmp_path / "way_1.png",
+        mosaic_items=[SimpleNamespace(id=item_id) for item_id in mosaic_ids],
+        temporal_mosaic_items={vintage: [SimpleNamespace(id=item_id) for item_id in ids]
+                               for vintage, ids in (temporal_mosaic_ids or {}).items()},
+    )
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    processor = _processor(tmp_path, ["m_b", "m_a"], {"m_old": ["m_c"]})
+    processor.output_path.write_bytes(b"")
+    manifest = RunManifest(manifest_path, output_fingerprint="fp")
+    manifest.record(processor, OUTCOME_SUCCESS)
+    manifest.close()
+    return manifest_path
+
+
+def test_manifest_entry_lists_mosaic_items(recorded):
+    entry = RunManifest.read_entries(recorded)["way/1"]
+    assert entry["mosaic_item_ids"] == ["m_a", "m_b", "m_c"]
+
+
+def test_same_mosaic_items_are_unchanged(tmp_path, recorded):
+    manifest = RunManifest(recorded, output_fingerprint="fp")
+    assert manifest.is_unchanged(_processor(tmp_path, ["m_a", "m_b"], {"m_old": ["m_c"]}), check_imagery=True)
+    manifest.close()
+
+
+@pytest.mark.parametrize("mosaic_ids, temporal_mosaic_ids", [
+    (["m_a"], {"m_old": ["m_c"]}),
+    (["m_a", "m_b", "m_d"], {"m_old": ["m_c"]}),
+    (["m_a", "m_b"], {}),
+])
+def test_different_mosaic_items_are_reprocessed(tmp_path, recorded, mosaic_ids, temporal_mosaic_ids):
+    manifest = RunManifest(recorded, output_fingerprint="fp")
+    processor = _processor(tmp_path, mosaic_ids, temporal_mosaic_ids)
+    assert not manifest.is_unchanged(processor, check_imagery=True)
+    # Before the search nothing is known about the mosaic, so only geometry and settings count
+    assert manifest.is_unchanged(processor, check_imagery=False)
+    manifest.close()
+
+
+def test_different_output_settings_are_reprocessed(tmp_path, recorded):
+    manifest = RunManifest(recorded, output_fingerprint="other")
+    assert not manifest.is_unchanged(_processor(tmp_path, ["m_a", "m_b"], {"m_old": ["m_c"]}), check_imagery=True)
+    manifest.close()
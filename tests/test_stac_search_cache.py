@@ -0,0 +1,108 @@
+import pytest
+
+import naip_pull
+from naip_pull import StacSearchCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(naip_pull.time, "time", clock)
+    return clock
+
+
+def _item(item_id, size=100):
+    return {"id": item_id, "collection": "naip", "properties": {"pad": "x" * size}}
+
+
+def _cache(tmp_path, ttl_seconds=3600, max_size_mb=1.0, check_every=1):
+    cache = StacSearchCache(tmp_path / "stac.sqlite", ttl_seconds, max_size_mb)
+    cache._EVICTION_CHECK_INTERVAL = check_every
+    return cache
+
+
+def test_make_key_ignores_collection_order_and_other_kwargs():
+    geometry = {"type": "Point", "coordinates": [-118.25, 34.05]}
+    a = StacSearchCache.make_key({"collections": ["naip", "b"], "intersects": geometry, "limit": 10, "max_items": 5})
+    b = StacSearchCache.make_key({"collections": ["b", "naip"], "intersects": geometry, "limit": 10})
+    assert a == b
+    assert a != StacSearchCache.make_key({"collections": ["naip", "b"], "intersects": geometry, "limit": 20})
+
+
+def test_round_trip_keeps_item_order(tmp_path, clock):
+    cache = _cache(tmp_path)
+    items = [_item("m_2"), _item("m_1"), _item("m_3")]
+    cache.put("naip", "k", items)
+    assert cache.get("k") == items
+    assert (cache.hits, cache.misses) == (1, 0)
+    cache.close()
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put("naip", "k", [_item("m_1")])
+    clock.now += 60
+    assert cache.get("k") is not None
+    clock.now += 1
+    assert cache.get("k") is None
+    assert cache.misses == 1
+    # Offline replay still serves stale results
+    assert cache.get("k", ignore_ttl=True) == [_item("m_1")]
+    cache.close()
+
+
+def test_put_refreshes_an_expired_entry(tmp_path, clock):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.put("naip", "k", [_item("m_1")])
+    clock.now += 120
+    cache.put("naip", "k", [_item("m_2")])
+    assert cache.get("k") == [_item("m_2")]
+    cache.close()
+
+
+def test_least_recently_used_searches_are_evicted_first(tmp_path, clock):
+    # Each item is ~20 KB; the budget holds about four
+    cache = _cache(tmp_path, max_size_mb=0.08)
+    for index in range(4):
+        cache.put("naip", f"k{index}", [_item(f"m_{index}", size=20_000)])
+        clock.now += 1
+    cache.get("k0") # k0 is now the most recently used, k1 the least
+    clock.now += 1
+    cache.put("naip", "k4", [_item("m_4", size=20_000)])
+
+    assert cache.get("k1") is None
+    assert all(cache.get(key) is not None for key in ("k0", "k2", "k3", "k4"))
+    cache.close()
+
+
+def test_shared_items_survive_until_their_last_search_goes(tmp_path, clock):
+    cache = _cache(tmp_path, max_size_mb=0.05)
+    shared = _item("m_shared", size=20_000)
+    for key, items in (("old", [shared]), ("mid", [_item("m_1", size=20_000)]), ("new", [shared])):
+        cache.put("naip", key, items)
+        clock.now += 1
+    cache.put("naip", "last", [_item("m_2", size=20_000)])
+
+    # Dropping "old" frees nothing while "new" still points at its item, so "mid" goes too
+    assert cache.get("old") is None and cache.get("mid") is None
+    assert cache.get("new") == [shared]
+    assert cache.get("last") is not None
+    cache.close()
+
+
+def test_cache_persists_across_instances(tmp_path, clock):
+    cache = _cache(tmp_path)
+    cache.put("naip", "k", [_item("m_1")])
+    cache.close()
+
+    reopened = _cache(tmp_path)
+    assert reopened.get("k") == [_item("m_1")]
+    reopened.close()
@@ -0,0 +1,108 @@
+import math
+
+import numpy as np
+import pytest
+from PIL import Image
+from pyproj import Transformer
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+
+from naip_pull import WEB_MERCATOR_CRS, WEB_MERCATOR_HALF_EXTENT, TmsPyramidWriter
+
+TILE_SIZE = 256
+
+
+def _writer(tmp_path, min_zoom=15, max_zoom=18):
+    return TmsPyramidWriter({"TILE_FOLDER": tmp_path, "MIN_ZOOM": min_zoom, "MAX_ZOOM": max_zoom,
+                             "TILE_SIZE": TILE_SIZE, "PNG_COMPRESS_LEVEL": 1}, Resampling.nearest)
+
+
+def _xyz_tile(lon, lat, zoom):
+    """Slippy-map (XYZ, top-origin) tile of a lon/lat."""
+    n = 2 ** zoom
+    x = math.floor((lon + 180.0) / 360.0 * n)
+    y = math.floor((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return x, y
+
+
+def _tile_chip(x, y, zoom):
+    """A solid chip covering exactly XYZ tile (x, y) at zoom, in Web Mercator."""
+    span = 2 * WEB_MERCATOR_HALF_EXTENT / 2 ** zoom
+    transform = Affine(span / TILE_SIZE, 0.0, -WEB_MERCATOR_HALF_EXTENT + x * span,
+                       0.0, -span / TILE_SIZE, WEB_MERCATOR_HALF_EXTENT - y * span)
+    return np.full((TILE_SIZE, TILE_SIZE, 3), 120, dtype=np.uint8), transform
+
+
+def _written(tile_dir):
+    return {tuple(int(part) for part in path.relative_to(tile_dir).with_suffix("").parts)
+            for path in tile_dir.rglob("*.png")}
+
+
+def test_tile_span_halves_per_zoom(tmp_path):
+    writer = _writer(tmp_path)
+    assert writer._tile_span(0) == pytest.approx(2 * WEB_MERCATOR_HALF_EXTENT)
+    assert writer._tile_span(18) == pytest.approx(writer._tile_span(17) / 2)
+
+
+@pytest.mark.parametrize("x, y", [(44000, 100000), (45001, 104857), (0, 0), (2 ** 18 - 1, 2 ** 18 - 1)])
+def test_one_tile_chip_gives_one_tile_per_zoom_with_tms_rows(tmp_path, x, y):
+    chip, transform = _tile_chip(x, y, 18)
+    tile_dir, written = _writer(tmp_path).write("way/1", chip, transform, WEB_MERCATOR_CRS)
+
+    expected = {(zoom, x >> (18 - zoom), (2 ** zoom - 1) - (y >> (18 - zoom))) for zoom in range(15, 19)}
+    assert _written(tile_dir) == expected
+    assert written == len(expected)
+
+
+def test_max_zoom_tile_is_copied_through_and_opaque(tmp_path):
+    chip, transform = _tile_chip(44000, 100000, 18)
+    tile_dir, _ = _writer(tmp_path, min_zoom=18).write("way/1", chip, transform, WEB_MERCATOR_CRS)
+    with Image.open(tile_dir / "18" / "44000" / f"{2 ** 18 - 1 - 100000}.png") as tile:
+        assert tile.mode == "RGB" # Fully covered, so no alpha channel
+        assert np.array_equal(np.asarray(tile), chip)
+
+
+def test_parent_tile_is_transparent_outside_the_chip(tmp_path):
+    chip, transform = _tile_chip(44000, 100000, 18)
+    tile_dir, _ = _writer(tmp_path, min_zoom=17).write("way/1", chip, transform, WEB_MERCATOR_CRS)
+    with Image.open(tile_dir / "17" / "22000" / f"{2 ** 17 - 1 - 50000}.png") as tile:
+        rgba = np.asarray(tile)
+    assert tile.mode == "RGBA"
+    # The chip is the top-left quarter of its parent
+    assert (rgba[:128, :128, 3] == 255).all() and (rgba[:128, :128, :3] == 120).all()
+    assert not rgba[128:, :, 3].any() and not rgba[:, 128:, 3].any()
+
+
+def test_utm_chip_lands_in_the_tile_of_its_lon_lat(tmp_path):
+    # ~300 m chip around (-118.25, 34.05) in UTM 11N
+    chip = np.full((500, 500, 3), 80, dtype=np.uint8)
+    transform = Affine(0.6, 0.0, 385000.0, 0.0, -0.6, 3768000.0)
+    tile_dir, _ = _writer(tmp_path, min_zoom=15, max_zoom=15).write("way/1", chip, transform, "EPSG:32611")
+
+    lon, lat = Transformer.from_crs("EPSG:32611", "EPSG:4326", always_xy=True).transform(385150.0, 3767850.0)
+    x, y = _xyz_tile(lon, lat, 15)
+    assert (15, x, (2 ** 15 - 1) - y) in _written(tile_dir)
+
+
+def test_pad_to_even_tiles_aligns_to_parents():
+    rgba = np.zeros((4, TILE_SIZE, 3 * TILE_SIZE), dtype=np.uint8)
+    padded, tx_min, ty_min = TmsPyramidWriter._pad_to_even_tiles(rgba, 5, 8, TILE_SIZE)
+    # One empty column in front (5 -> 4) makes 4 columns; one empty row below makes 2 rows
+    assert (tx_min, ty_min) == (4, 8)
+    assert padded.shape == (4, 2 * TILE_SIZE, 4 * TILE_SIZE)
+    assert np.array_equal(padded, np.zeros_like(padded))
+
+
+def test_downsample_weights_by_alpha():
+    rgba = np.zeros((4, 2, 2), dtype=np.uint8)
+    rgba[:3, 0, 0] = 200
+    rgba[3, 0, 0] = 255 # One covered pixel, three transparent ones
+    out = TmsPyramidWriter._downsample(rgba)
+    assert out.shape == (4, 1, 1)
+    assert out[:3, 0, 0].tolist() == [200, 200, 200] # Not darkened by the empty pixels
+    assert out[3, 0, 0] == 64
+
+
+def test_min_zoom_above_max_zoom_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _writer(tmp_path, min_zoom=18, max_zoom=15)